@@ -23,7 +23,8 @@ class ModelPanelEMO(chimera.extension.EMO):
 		display(self.module('base').ModelPanel.name)
 		return None
 
-chimera.extension.manager.registerExtension(ModelPanelEMO(__file__))
+modelPanelEMO = ModelPanelEMO(__file__)
+chimera.extension.manager.registerExtension(modelPanelEMO)
 
 class RainbowEMO(chimera.extension.EMO):
 	def name(self):
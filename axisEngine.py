@@ -0,0 +1,1226 @@
+"""compare traced helix and strand axes against a reference structure
+in-process with NumPy, in place of the leastsquare binary
+
+usage: python axisEngine.py [-b N] [-c] [-g GATE] PDB HELIX STRAND OUTPUT
+
+The arguments are leastsquare's: the reference PDB and the first files
+of the traced helix and strand series, all without their extension,
+and the text report, with 'Empty' for any of the last three left out.
+GATE limits which axes may be matched, e.g. "distance=8,angle=30" (see
+tools.parseGate()).  -c also fits the strands as curves, since they are
+seldom straight, and adds how far apart those are to the report.  -b
+adds the 95% bootstrap interval of every error, from N resamplings of
+the traced points (200 is plenty).
+
+The true axes come from the HELIX and SHEET records of the reference,
+fitted through the CA atoms of each element (helix CAs are first
+averaged four at a time, which puts them on the helix axis).  Every
+traced file is fitted the same way, through its CA atoms or, for the
+tracer's helix sticks, all its atoms.  All the fits are done as one
+batch.  True and traced axes are matched all at once, pairing them so
+that the matched pairs are as close together as they can be in total
+(see matchAxes()), and every match is scored as leastsquare scores it.
+The results go, as leastsquare's do, to an 'output' folder next to the
+reference: trueHelixN.pdb and traceHelixN.pdb (trueSheetN.pdb and
+traceSheetN.pdb for strands) for the N-th true element and its match,
+each a line of CA atoms along the fitted axis.  The cost of every
+true/traced pair near enough to be considered, and which were matched,
+go to pairCosts.csv there.
+"""
+
+import cPickle
+import hashlib
+import os
+import re
+import sys
+import threading
+import numpy
+import tools
+
+HELIX = "Helix"
+STRAND = "Sheet"
+
+# traced axes further than this (in angstroms, on average) from a true
+# axis are not matched with it
+MAX_DISTANCE = 10.0
+
+# points sampled along each axis to measure how far apart two axes are
+SAMPLES = 20
+
+# spacing of the CA atoms written along each axis
+SPACING = 1.5
+
+# cubic B-spline pieces fitted along each strand curve (see fitCurves()),
+# how strongly bending is penalised, and how finely the curve is traced
+# to measure its length
+CURVE_PIECES = 3
+CURVE_SMOOTHING = 0.01
+CURVE_STEPS = 64
+
+# confidence of the bootstrap intervals (see bootstrap()), and the most
+# resampled points drawn and fitted in one batch
+BOOTSTRAP_LEVEL = 0.95
+BOOTSTRAP_BATCH_POINTS = 1000000
+
+REPORT_HEADER = ("Helix#True, Helix#Trace, LengthTrueAxis, LengthDetectedAxis,"
+	" TwoWayDistance, CrossDisplacement, LengthDisplacement,"
+	" LengthErrorProportion, Specificity, Sensitivity, F1Score\n")
+
+# added to the strand header for the CURVE_METRICS
+CURVE_HEADER = (", LengthTrueCurve, LengthDetectedCurve, CurveDistance,"
+	" CurveMaxDistance")
+
+# added to the header for the bootstrap intervals of the reported errors
+INTERVAL_HEADER = "".join([", %sLow, %sHigh" % (name, name)
+			for name in REPORT_HEADER.strip().split(", ")[2:]])
+
+COSTS_FILE = "pairCosts.csv"
+
+COSTS_HEADER = ("Type, True, Trace, Cost, Usable, Matched, TwoWayDistance,"
+	" Overlap, Angle\n")
+
+RESULT_FILES = re.compile(r"(trace|true)(Helix|Sheet)\d+\.pdb$")
+
+class Axis(object):
+	"""A fitted axis: the segment from 'start' to 'end' through
+	   'points' (an n x 3 array), read from 'path' if traced
+	"""
+
+	def __init__(self, kind, label, points, path=None):
+		self.kind = kind
+		self.label = label
+		self.points = points
+		self.path = path
+		self.start = self.end = None
+		# SAMPLES points evenly spaced along the fitted curve, if fitted
+		self.curve = None
+
+	def __repr__(self):
+		return "<Axis %s %s>" % (self.kind, self.label)
+
+	def length(self):
+		return float(numpy.linalg.norm(self.end - self.start))
+
+class AxisMatch(object):
+	"""True axis 'true', the traced axis matched with it ('trace', or
+	   None), the errors of the match by name (see METRICS), what
+	   matching the two cost (see pairCosts()) and, once bootstrapped,
+	   the (low, high) confidence interval of each error by name
+	"""
+
+	def __init__(self, true, trace=None, errors=None, cost=None):
+		self.true = true
+		self.trace = trace
+		self.errors = errors or {}
+		self.cost = cost
+		self.intervals = {}
+
+	def __repr__(self):
+		return "<AxisMatch %s -> %s>" % (self.true.label,
+					self.trace and self.trace.label)
+
+# the errors of a match, in report order
+METRICS = ("lengthTrue", "lengthTrace", "twoWayDistance",
+	"crossDisplacement", "lengthDisplacement", "lengthErrorProportion",
+	"specificity", "sensitivity", "f1", "angle", "overlap")
+
+# those in the report
+REPORTED = METRICS[:9]
+
+# the errors added to strand matches when strands are fitted as curves,
+# in report order
+CURVE_METRICS = ("curveLengthTrue", "curveLengthTrace", "curveDistance",
+							"curveMaxDistance")
+
+#
+# reading
+#
+
+def pdbPath(path):
+	"""Return 'path' with the .pdb extension leastsquare leaves off"""
+	if os.path.splitext(path)[1].lower() == ".pdb":
+		return path
+	return path + ".pdb"
+
+def readPdb(path):
+	"""Return (atoms, helices, sheets) from PDB file 'path'.
+
+	   'atoms' is a list of (chain, residue number, atom name, (x, y,
+	   z)); 'helices' and 'sheets' are lists of (chain, first residue,
+	   last residue) from the HELIX and SHEET records.
+	"""
+	atoms = []
+	helices = []
+	sheets = []
+	f = open(path, "rU")
+	for line in f:
+		record = line[:6]
+		try:
+			if record in ("ATOM  ", "HETATM"):
+				atoms.append((line[21], int(line[22:26]),
+					line[12:16].strip(), (float(line[30:38]),
+					float(line[38:46]), float(line[46:54]))))
+			elif record == "HELIX ":
+				helices.append((line[19], int(line[21:25]),
+							int(line[33:37])))
+			elif record == "SHEET ":
+				sheets.append((line[21], int(line[22:26]),
+							int(line[33:37])))
+		except ValueError:
+			continue
+	f.close()
+	return atoms, helices, sheets
+
+def _window(points, size):
+	# running mean of 'size' consecutive points
+	if len(points) <= size:
+		return points
+	sums = numpy.cumsum(numpy.vstack([numpy.zeros((1, 3)), points]), axis=0)
+	return (sums[size:] - sums[:-size]) / size
+
+def trueAxes(path):
+	"""Return the helix and strand Axes of the reference 'path'"""
+	atoms, helices, sheets = readPdb(path)
+	cas = {}
+	for chain, number, name, xyz in atoms:
+		if name == "CA":
+			cas.setdefault(chain, {})[number] = xyz
+	axes = []
+	for kind, elements, size in ((HELIX, helices, 4), (STRAND, sheets, 2)):
+		for i, (chain, first, last) in enumerate(elements):
+			residues = cas.get(chain, {})
+			points = [residues[n] for n in range(first, last+1)
+							if n in residues]
+			if len(points) < 2:
+				continue
+			points = _window(numpy.array(points, float), size)
+			axes.append(Axis(kind, str(i+1), points))
+	fitAxes(axes)
+	return axes
+
+def readTraced(path, kind):
+	"""Return the Axis of kind 'kind' traced in file 'path', not yet
+	   fitted, or None if it has too few atoms for one
+	"""
+	atoms = readPdb(path)[0]
+	points = [xyz for chain, number, name, xyz in atoms if name == "CA"]
+	if len(points) < 2:
+		points = [xyz for chain, number, name, xyz in atoms]
+	if len(points) < 2:
+		return None
+	points = numpy.array(points, float)
+	if kind == STRAND:
+		points = _window(points, 2)
+	label = os.path.splitext(os.path.basename(path))[0]
+	return Axis(kind, label, points, path)
+
+def tracedAxes(firstPath, kind):
+	"""Return the Axes of the traced series that starts at
+	   'firstPath', in order
+	"""
+	axes = [readTraced(path, kind)
+			for path in tools.seriesFiles(pdbPath(firstPath))]
+	axes = [axis for axis in axes if axis is not None]
+	fitAxes(axes)
+	return axes
+
+#
+# fitting and scoring
+#
+
+def _padded(axes):
+	# the points of 'axes' as one array, padded with zeros to the most
+	# any has, with how many each has and which entries are real
+	counts = numpy.array([len(a.points) for a in axes])
+	padded = numpy.zeros((len(axes), counts.max(), 3))
+	mask = numpy.arange(counts.max()) < counts[:, None]
+	padded[mask] = numpy.concatenate([a.points for a in axes])
+	return padded, counts, mask
+
+def fitAxes(axes):
+	"""Fit a line through the points of each of 'axes' and set their
+	   'start' and 'end', all in one batch
+	"""
+	if not axes:
+		return
+	padded, counts, mask = _padded(axes)
+	for axis, start, end in zip(axes, *_fitLines(padded, counts)):
+		axis.start = start
+		axis.end = end
+
+def _fitLines(padded, counts):
+	# the (starts, ends) of the lines through the first counts[i] of
+	# padded[i] (n x k x 3), each running the way its points do
+	mask = numpy.arange(padded.shape[1]) < counts[:, None]
+	centers = (padded * mask[:, :, None]).sum(axis=1) / counts[:, None]
+	offsets = (padded - centers[:, None, :]) * mask[:, :, None]
+	# the axis runs along the direction of greatest spread
+	scatter = numpy.einsum("nki,nkj->nij", offsets, offsets)
+	directions = numpy.linalg.eigh(scatter)[1][:, :, -1]
+	along = numpy.einsum("nki,ni->nk", offsets, directions)
+	first = along[:, 0]
+	last = along[numpy.arange(len(padded)), counts - 1]
+	# point each axis the way its points run
+	flip = numpy.where(last < first, -1.0, 1.0)
+	directions *= flip[:, None]
+	along *= flip[:, None]
+	low = numpy.where(mask, along, numpy.inf).min(axis=1)
+	high = numpy.where(mask, along, -numpy.inf).max(axis=1)
+	starts = centers + low[:, None] * directions
+	ends = centers + high[:, None] * directions
+	return starts, ends
+
+def _basis(t, count):
+	# the 'count' clamped uniform cubic B-splines at each of 't' (any
+	# shape, in [0, 1]), stacked along a new last axis
+	knots = numpy.concatenate([numpy.zeros(3),
+			numpy.linspace(0.0, 1.0, count - 2), numpy.ones(3)])
+	t = numpy.minimum(t, 1.0 - 1e-9)[..., None]
+	values = ((knots[:-1] <= t) & (t < knots[1:])).astype(float)
+	for degree in range(1, 4):
+		left = knots[:-degree-1]
+		span = knots[degree:-1] - left
+		rise = numpy.where(span > 0, (t - left) / numpy.where(span > 0,
+							span, 1.0), 0.0)
+		right = knots[degree+1:]
+		span = right - knots[1:-degree]
+		fall = numpy.where(span > 0, (right - t) / numpy.where(span > 0,
+							span, 1.0), 0.0)
+		values = rise * values[..., :-1] + fall * values[..., 1:]
+	return values
+
+def fitCurves(axes, pieces=CURVE_PIECES, smoothing=CURVE_SMOOTHING):
+	"""Fit a smoothing cubic spline of 'pieces' pieces through the
+	   points of each of 'axes', in order, and set their 'curve' to
+	   SAMPLES points evenly spaced along it by arc length, all in one
+	   batch.  'smoothing' weighs bending against closeness to the
+	   points.
+	"""
+	if not axes:
+		return
+	padded, counts, mask = _padded(axes)
+	# each point sits along the curve at its share of the chord length
+	steps = numpy.sqrt((numpy.diff(padded, axis=1) ** 2).sum(axis=2)) \
+								* mask[:, 1:]
+	chord = numpy.concatenate([numpy.zeros((len(axes), 1)),
+					numpy.cumsum(steps, axis=1)], axis=1)
+	t = chord / numpy.maximum(chord.max(axis=1), 1e-12)[:, None]
+	count = pieces + 3
+	basis = _basis(t, count) * mask[:, :, None]
+	bend = numpy.diff(numpy.eye(count), 2, axis=0)
+	normal = numpy.einsum("nkb,nkc->nbc", basis, basis) \
+		+ smoothing * counts[:, None, None] * numpy.dot(bend.T, bend)
+	controls = numpy.linalg.solve(normal,
+				numpy.einsum("nkb,nki->nbi", basis, padded))
+	traced = numpy.einsum("sb,nbi->nsi",
+		_basis(numpy.linspace(0.0, 1.0, CURVE_STEPS), count), controls)
+	# resample evenly by arc length
+	lengths = numpy.concatenate([numpy.zeros((len(axes), 1)), numpy.cumsum(
+		numpy.sqrt((numpy.diff(traced, axis=1) ** 2).sum(axis=2)), axis=1)],
+									axis=1)
+	targets = lengths[:, -1:] * numpy.linspace(0.0, 1.0, SAMPLES)
+	after = numpy.minimum((lengths[:, None, :] < targets[:, :, None]).sum(
+						axis=2), CURVE_STEPS - 1)
+	before = numpy.maximum(after - 1, 0)
+	rows = numpy.arange(len(axes))[:, None]
+	span = lengths[rows, after] - lengths[rows, before]
+	f = numpy.where(span > 0, (targets - lengths[rows, before])
+				/ numpy.where(span > 0, span, 1.0), 0.0)
+	curves = traced[rows, before] + f[:, :, None] \
+				* (traced[rows, after] - traced[rows, before])
+	for axis, curve in zip(axes, curves):
+		axis.curve = curve
+
+def _segments(axes):
+	return (numpy.array([a.start for a in axes]),
+		numpy.array([a.end for a in axes]))
+
+def pointSegmentDistances(points, starts, ends):
+	"""Return the distance from each of 'points' (... x 3) to the
+	   matching segment from 'starts' to 'ends' (broadcast against it)
+	"""
+	d = ends - starts
+	lengthSquared = numpy.maximum((d * d).sum(axis=-1), 1e-12)
+	t = numpy.clip(((points - starts) * d).sum(axis=-1) / lengthSquared,
+								0.0, 1.0)
+	nearest = starts + t[..., None] * d
+	return numpy.sqrt(((points - nearest) ** 2).sum(axis=-1))
+
+def _samples(starts, ends):
+	t = numpy.linspace(0.0, 1.0, SAMPLES)
+	return starts[:, None, :] + t[None, :, None] * (ends - starts)[:, None, :]
+
+def twoWayDistances(p0, p1, q0, q1):
+	"""Return the mean distance between segments p and q, each way
+	   averaged, for every pair of rows of the k x 3 arrays given
+	"""
+	pq = pointSegmentDistances(_samples(q0, q1), p0[:, None, :],
+							p1[:, None, :]).mean(axis=1)
+	qp = pointSegmentDistances(_samples(p0, p1), q0[:, None, :],
+							q1[:, None, :]).mean(axis=1)
+	return (pq + qp) / 2
+
+def pairErrors(p0, p1, q0, q1):
+	"""Return {metric: array} scoring traced segments q against true
+	   segments p, row by row, the way leastsquare does: 's' is the
+	   part of p that q overlaps when projected onto it, and cross and
+	   longitudinal displacement are how far q lies off p and how far
+	   its ends overshoot or fall short of p's
+	"""
+	lengthP = numpy.sqrt(((p1 - p0) ** 2).sum(axis=1))
+	lengthQ = numpy.sqrt(((q1 - q0) ** 2).sum(axis=1))
+	u = (p1 - p0) / numpy.maximum(lengthP, 1e-12)[:, None]
+	a = ((q0 - p0) * u).sum(axis=1)
+	b = ((q1 - p0) * u).sum(axis=1)
+	low = numpy.minimum(a, b)
+	high = numpy.maximum(a, b)
+	overlap = numpy.maximum(numpy.minimum(high, lengthP)
+					- numpy.maximum(low, 0.0), 0.0)
+	def offLine(q):
+		rel = q - p0
+		along = (rel * u).sum(axis=1)
+		return numpy.sqrt(numpy.maximum((rel * rel).sum(axis=1)
+						- along ** 2, 0.0))
+	cross = (offLine(q0) + offLine(q1)) / 2
+	longitudinal = numpy.abs(low) + numpy.abs(lengthP - high)
+	combined = numpy.maximum(lengthP + lengthQ, 1e-12)
+	sensitivity = overlap / numpy.maximum(lengthP, 1e-12)
+	specificity = numpy.minimum(overlap / numpy.maximum(high - low, 1e-12),
+									1.0)
+	f1 = numpy.where(sensitivity + specificity > 0, 2 * sensitivity
+		* specificity / numpy.maximum(sensitivity + specificity, 1e-12), 0.0)
+	v = (q1 - q0) / numpy.maximum(lengthQ, 1e-12)[:, None]
+	cosine = numpy.abs((u * v).sum(axis=1)).clip(0.0, 1.0)
+	return {
+		"lengthTrue": lengthP,
+		"lengthTrace": lengthQ,
+		"twoWayDistance": twoWayDistances(p0, p1, q0, q1),
+		"crossDisplacement": cross,
+		"lengthDisplacement": longitudinal,
+		"lengthErrorProportion": (lengthP + lengthQ - 2 * overlap) / combined,
+		"specificity": specificity,
+		"sensitivity": sensitivity,
+		"f1": f1,
+		"angle": numpy.degrees(numpy.arccos(cosine)),
+		"overlap": overlap,
+	}
+
+# the cell and the 26 around it
+NEIGHBOURS = numpy.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1)
+							for k in (-1, 0, 1)])
+
+class SegmentGrid(object):
+	"""A uniform grid over the segments from 'starts' to 'ends' (k x 3
+	   arrays) that finds, for many points at once, the segments
+	   within 'radius' of each
+	"""
+
+	def __init__(self, starts, ends, radius):
+		self.starts = numpy.asarray(starts, float).reshape(-1, 3)
+		self.ends = numpy.asarray(ends, float).reshape(-1, 3)
+		self.radius = float(radius)
+		# every point of a segment is within a quarter of a cell of one
+		# of the samples taken along it, so whatever is within 'radius'
+		# of a point has a sample in the point's cell or one next to it
+		self.cell = max(self.radius * 4 / 3.0, 1e-6)
+		lengths = numpy.sqrt(((self.ends - self.starts) ** 2).sum(axis=1))
+		counts = numpy.ceil(lengths / (self.cell / 2)).astype(int) + 1
+		segments = numpy.repeat(numpy.arange(len(counts)), counts)
+		steps = numpy.arange(counts.sum()) - numpy.repeat(
+						numpy.cumsum(counts) - counts, counts)
+		t = steps / numpy.maximum(counts - 1, 1).astype(float)[segments]
+		samples = self.starts[segments] + t[:, None] \
+				* (self.ends - self.starts)[segments]
+		if len(samples):
+			self.origin = samples.min(axis=0)
+		else:
+			self.origin = numpy.zeros(3)
+		cells = self._cells(samples)
+		if len(cells):
+			self.shape = cells.max(axis=0) + 1
+		else:
+			self.shape = numpy.ones(3, int)
+		# (cell, segment) entries, sorted by cell, each once
+		entries = numpy.unique(self._keys(cells) * max(len(counts), 1)
+								+ segments)
+		self.keys = entries // max(len(counts), 1)
+		self.segments = entries % max(len(counts), 1)
+
+	def _cells(self, points):
+		return numpy.floor((points - self.origin) / self.cell).astype(int)
+
+	def _keys(self, cells):
+		return (cells[:, 0].astype(numpy.int64) * self.shape[1]
+				+ cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+	def near(self, points):
+		"""Return (point indices, segment indices, distances), arrays
+		   with an entry for every one of 'points' (n x 3) and segment
+		   within 'radius' of each other
+		"""
+		points = numpy.asarray(points, float).reshape(-1, 3)
+		cells = self._cells(points)
+		pointIndices = []
+		segmentIndices = []
+		for offset in NEIGHBOURS:
+			neighbours = cells + offset
+			inside = numpy.nonzero(((neighbours >= 0)
+				& (neighbours < self.shape)).all(axis=1))[0]
+			keys = self._keys(neighbours[inside])
+			low = numpy.searchsorted(self.keys, keys, "left")
+			counts = numpy.searchsorted(self.keys, keys, "right") - low
+			entries = numpy.arange(counts.sum()) + numpy.repeat(
+					low - numpy.cumsum(counts) + counts, counts)
+			pointIndices.append(numpy.repeat(inside, counts))
+			segmentIndices.append(self.segments[entries])
+		pairs = numpy.unique(numpy.concatenate(pointIndices).astype(numpy.int64)
+			* max(len(self.starts), 1) + numpy.concatenate(segmentIndices))
+		pointIndices = pairs // max(len(self.starts), 1)
+		segmentIndices = pairs % max(len(self.starts), 1)
+		distances = pointSegmentDistances(points[pointIndices],
+			self.starts[segmentIndices], self.ends[segmentIndices])
+		within = distances <= self.radius
+		return (pointIndices[within], segmentIndices[within],
+							distances[within])
+
+	def nearest(self, points):
+		"""Return (distances, segment indices): for each of 'points'
+		   (n x 3), how far it is from the nearest segment and which
+		   that is, or infinity and -1 where none is within 'radius'
+		"""
+		points = numpy.asarray(points, float).reshape(-1, 3)
+		distances = numpy.empty(len(points))
+		distances.fill(numpy.inf)
+		segments = -numpy.ones(len(points), int)
+		pointIndices, segmentIndices, found = self.near(points)
+		order = numpy.lexsort((found, pointIndices))
+		pointIndices = pointIndices[order]
+		first = numpy.ones(len(order), bool)
+		first[1:] = pointIndices[1:] != pointIndices[:-1]
+		distances[pointIndices[first]] = found[order][first]
+		segments[pointIndices[first]] = segmentIndices[order][first]
+		return distances, segments
+
+def curveDistances(points, curves):
+	"""Return the distance from each of 'points' (k x n x 3) to the
+	   polyline through the matching one of 'curves' (k x m x 3)
+	"""
+	return pointSegmentDistances(points[:, :, None, :],
+		curves[:, None, :-1, :], curves[:, None, 1:, :]).min(axis=2)
+
+def curveErrors(p, q):
+	"""Return {metric: array} (see CURVE_METRICS) comparing the traced
+	   curves 'q' with the true curves 'p' (both k x SAMPLES x 3,
+	   resampled by fitCurves()) pair by pair: their lengths, and the
+	   mean and greatest distance of each one's points from the other
+	   curve, both ways
+	"""
+	pq = curveDistances(q, p)
+	qp = curveDistances(p, q)
+	def length(curves):
+		return numpy.sqrt((numpy.diff(curves, axis=1) ** 2).sum(axis=2)
+								).sum(axis=1)
+	return {
+		"curveLengthTrue": length(p),
+		"curveLengthTrace": length(q),
+		"curveDistance": (pq.mean(axis=1) + qp.mean(axis=1)) / 2,
+		"curveMaxDistance": numpy.maximum(pq.max(axis=1), qp.max(axis=1)),
+	}
+
+def scoreCurves(matches):
+	"""Fit curves to the true and traced axes of 'matches' and add the
+	   CURVE_METRICS to the errors of those matched, all at once
+	"""
+	axes = [m.true for m in matches] + [m.trace for m in matches
+						if m.trace is not None]
+	# curves kept from an earlier comparison (see ComparisonState) stay
+	fitCurves([axis for axis in axes if axis.curve is None])
+	matched = [m for m in matches if m.trace is not None
+					and "curveDistance" not in m.errors]
+	if not matched:
+		return
+	errors = curveErrors(numpy.array([m.true.curve for m in matched]),
+			numpy.array([m.trace.curve for m in matched]))
+	for i, match in enumerate(matched):
+		for name in CURVE_METRICS:
+			match.errors[name] = float(errors[name][i])
+
+def gateReach(maxDistance=MAX_DISTANCE, **gate):
+	"""Return how near a traced axis must come to a true axis for the
+	   two to pass a gate of 'maxDistance' (see gated()): their mean
+	   distance apart, each way, averages to no more than that, so
+	   one of the points sampled along the traced axis is within
+	   twice that of the true one
+	"""
+	return 2 * maxDistance
+
+def pairCosts(true, traced, reach=None):
+	"""Return {metric: array} scoring pairs of the 'traced' Axes
+	   against the 'true' ones as pairErrors() does, one entry per
+	   pair, with "rows" and "columns" holding the indices of the true
+	   and traced axis of each and "cost" (the two-way distance) what
+	   matchAxes() pairs them by.
+
+	   Every pair is scored or, with 'reach', only those where the
+	   traced axis comes within that of the true one, found with a
+	   SegmentGrid.
+	"""
+	p0, p1 = _segments(true)
+	q0, q1 = _segments(traced)
+	if reach is None:
+		rows, cols = numpy.indices((len(true), len(traced)))
+		rows = rows.ravel()
+		cols = cols.ravel()
+	else:
+		grid = SegmentGrid(p0, p1, reach)
+		points, rows = grid.near(_samples(q0, q1).reshape(-1, 3))[:2]
+		pairs = numpy.unique(rows.astype(numpy.int64) * len(traced)
+							+ points // SAMPLES)
+		rows = pairs // len(traced)
+		cols = pairs % len(traced)
+	costs = pairErrors(p0[rows], p1[rows], q0[cols], q1[cols])
+	costs["rows"] = rows
+	costs["columns"] = cols
+	costs["cost"] = costs["twoWayDistance"]
+	return costs
+
+def gated(costs, maxDistance=MAX_DISTANCE, minOverlap=0.0, maxAngle=None):
+	"""Return which of the pairs scored in 'costs' (see pairCosts())
+	   may be matched: those no more than 'maxDistance' apart that
+	   overlap by more than 'minOverlap' and, if 'maxAngle' is given,
+	   point no more than that many degrees apart
+	"""
+	usable = (costs["cost"] <= maxDistance) & (costs["overlap"] > minOverlap)
+	if maxAngle is not None:
+		usable &= costs["angle"] <= maxAngle
+	return usable
+
+def assign(cost):
+	"""Return (rows, columns), the pairing of rows with columns of the
+	   2D array 'cost' that has the least total cost, with as many
+	   pairs as the shorter side.  scipy is used if it is there.
+	"""
+	try:
+		from scipy.optimize import linear_sum_assignment
+	except ImportError:
+		return _assign(cost)
+	return linear_sum_assignment(cost)
+
+def _assign(cost):
+	# the Hungarian method, growing one shortest augmenting path per
+	# row with the columns handled as arrays
+	cost = numpy.asarray(cost, float)
+	transposed = cost.shape[0] > cost.shape[1]
+	if transposed:
+		cost = cost.T
+	n, m = cost.shape
+	# row and column potentials, and the row (counting from 1) that
+	# each column (from 1) is paired with; column 0 holds the row
+	# being added
+	u = numpy.zeros(n + 1)
+	v = numpy.zeros(m + 1)
+	owner = numpy.zeros(m + 1, int)
+	way = numpy.zeros(m + 1, int)
+	for row in range(1, n + 1):
+		owner[0] = row
+		column = 0
+		slack = numpy.empty(m + 1)
+		slack.fill(numpy.inf)
+		used = numpy.zeros(m + 1, bool)
+		while owner[column]:
+			used[column] = True
+			reduced = numpy.empty(m + 1)
+			reduced[0] = numpy.inf
+			reduced[1:] = cost[owner[column] - 1] - u[owner[column]] - v[1:]
+			better = ~used & (reduced < slack)
+			slack[better] = reduced[better]
+			way[better] = column
+			free = numpy.where(used, numpy.inf, slack)
+			nearest = int(free.argmin())
+			delta = free[nearest]
+			u[owner[used]] += delta
+			v[used] -= delta
+			slack[~used] -= delta
+			column = nearest
+		while column:
+			previous = way[column]
+			owner[column] = owner[previous]
+			column = previous
+	cols = numpy.nonzero(owner[1:])[0]
+	rows = owner[1:][cols] - 1
+	if transposed:
+		rows, cols = cols, rows
+	order = numpy.argsort(rows)
+	return rows[order], cols[order]
+
+def components(rows, cols):
+	"""Return [indices, ...], splitting the pairs of row 'rows[k]' and
+	   column 'cols[k]' into the groups joined by sharing a row or a
+	   column, each as an array of the k of its pairs
+	"""
+	if not len(rows):
+		return []
+	n = rows.max() + 1
+	# rows are nodes 0..n-1 and columns n on; every node takes the
+	# lowest label of those it is joined to until none changes
+	labels = numpy.arange(n + cols.max() + 1)
+	while True:
+		edge = numpy.minimum(labels[rows], labels[n + cols])
+		before = labels.copy()
+		numpy.minimum.at(labels, rows, edge)
+		numpy.minimum.at(labels, n + cols, edge)
+		labels = labels[labels]
+		if (labels == before).all():
+			break
+	pairLabels = labels[rows]
+	order = numpy.argsort(pairLabels, kind="mergesort")
+	breaks = numpy.nonzero(numpy.diff(pairLabels[order]))[0] + 1
+	return numpy.split(order, breaks)
+
+def matchAxes(true, traced, costs=None, previous=None, **gate):
+	"""Return an AxisMatch for each of the 'true' Axes.
+
+	   True and traced axes are paired so that as many pairs as
+	   possible pass the gate (see gated(), which takes the keyword
+	   arguments given here) and, of those pairings, the pairs add up
+	   to the least cost; pairs that do not pass are left unmatched.
+	   'costs' is pairCosts(true, traced), if that is already known;
+	   otherwise only the pairs within reach of the gate are scored.
+	   'previous' maps the indices of true axes whose pairs are as
+	   they were when last matched to the index of the traced axis
+	   they were matched with then (-1 for none); groups made up of
+	   those alone keep their matches instead of being solved again.
+	"""
+	matches = [AxisMatch(axis) for axis in true]
+	if not true or not traced:
+		return matches
+	if costs is None:
+		costs = pairCosts(true, traced, gateReach(**gate))
+	usable = numpy.nonzero(gated(costs, **gate))[0]
+	rows = costs["rows"][usable]
+	cols = costs["columns"][usable]
+	cost = costs["cost"][usable]
+	chosen = []
+	# axes only compete for others joined to them through pairs that
+	# pass the gate, so each such group is paired up on its own
+	for group in components(rows, cols):
+		if previous and not [r for r in rows[group] if r not in previous]:
+			chosen.extend([usable[k] for k in group
+					if previous[rows[k]] == cols[k]])
+			continue
+		if len(group) == 1:
+			chosen.append(usable[group[0]])
+			continue
+		groupRows, i = numpy.unique(rows[group], return_inverse=True)
+		groupCols, j = numpy.unique(cols[group], return_inverse=True)
+		# a pair that fails the gate costs more than all the pairs
+		# that pass, so one more match always beats a cheaper pairing
+		matrix = numpy.empty((len(groupRows), len(groupCols)))
+		matrix.fill(cost[group].sum() + 1.0)
+		matrix[i, j] = cost[group]
+		pairs = -numpy.ones(matrix.shape, int)
+		pairs[i, j] = usable[group]
+		for row, col in zip(*assign(matrix)):
+			if pairs[row, col] >= 0:
+				chosen.append(pairs[row, col])
+	for k in chosen:
+		match = matches[costs["rows"][k]]
+		match.trace = traced[costs["columns"][k]]
+		match.errors = dict([(name, float(costs[name][k]))
+							for name in METRICS])
+		match.cost = float(costs["cost"][k])
+	return matches
+
+#
+# uncertainty
+#
+
+def bootstrap(matches, resamples, level=BOOTSTRAP_LEVEL, seed=0):
+	"""Set the 'intervals' of the 'matches' with a trace: the 'level'
+	   confidence interval of each of their METRICS, from 'resamples'
+	   resamplings of the trace's points refitted and scored against
+	   the true axis.
+
+	   The resamples are drawn, fitted and scored as arrays, in this
+	   process, in batches of at most BOOTSTRAP_BATCH_POINTS points;
+	   'seed' makes the intervals repeatable.
+
+	   The intervals are percentile intervals.  On a simulated trace
+	   (16 points with 0.7A of noise) those of the distances and
+	   displacements cover the true error 86-94% of the time for a
+	   'level' of 95%.  Those of the trace's length, and of errors set
+	   by where its ends are (specificity, when the trace overshoots),
+	   cover it only about half the time: a resample can only lose the
+	   trace's end points, so they lean short.  Basic and
+	   bias-corrected intervals do no better, as the bias is in the
+	   resampling itself.
+	"""
+	matched = [m for m in matches if m.trace is not None]
+	if not matched or resamples < 1:
+		return
+	p0, p1 = _segments([m.true for m in matched])
+	padded, counts = _padded([m.trace for m in matched])[:2]
+	# the batches, and so the intervals, depend only on the sizes
+	points = padded.shape[0] * padded.shape[1] * resamples
+	batches = min(-(-points // BOOTSTRAP_BATCH_POINTS), resamples)
+	shares = numpy.diff(numpy.linspace(0, resamples,
+						batches + 1).astype(int))
+	seeds = numpy.random.RandomState(seed).randint(2**31 - 1, size=batches)
+	results = [_resampleErrors(p0, p1, padded, counts, share, batchSeed)
+				for share, batchSeed in zip(shares, seeds)]
+	tail = (1 - level) * 100 / 2
+	for name in METRICS:
+		values = numpy.concatenate([r[name] for r in results], axis=1)
+		low, high = numpy.percentile(values, [tail, 100 - tail], axis=1)
+		for match, l, h in zip(matched, low, high):
+			match.intervals[name] = (float(l), float(h))
+
+def _resampleErrors(p0, p1, padded, counts, resamples, seed):
+	# {metric: len(p0) x resamples array} of the errors of each trace
+	# resampled 'resamples' times, refitted and scored against its
+	# true axis
+	random = numpy.random.RandomState(seed)
+	n, width = padded.shape[:2]
+	# each resample draws as many of the trace's points as it has,
+	# kept in their order along the trace
+	picks = (random.random_sample((n, resamples, width))
+				* counts[:, None, None]).astype(int)
+	# the padding's picks sort last and are left out of the fit
+	padding = numpy.arange(width) >= counts[:, None]
+	picks[numpy.broadcast_to(padding[:, None, :], picks.shape)] = width
+	picks.sort(axis=2)
+	picks = numpy.minimum(picks, width - 1)
+	points = padded[numpy.arange(n)[:, None, None], picks]
+	starts, ends = _fitLines(points.reshape(n * resamples, width, 3),
+					numpy.repeat(counts, resamples))
+	errors = pairErrors(numpy.repeat(p0, resamples, axis=0),
+			numpy.repeat(p1, resamples, axis=0), starts, ends)
+	return dict([(name, errors[name].reshape(n, resamples))
+						for name in METRICS])
+
+#
+# writing
+#
+
+def writeAxis(path, axis, spacing=SPACING):
+	"""Write 'axis' to 'path' as a line of CA atoms, along its curve
+	   if one was fitted
+	"""
+	if axis.curve is not None:
+		points = axis.curve
+	else:
+		count = max(int(round(axis.length() / spacing)), 1) + 1
+		points = axis.start + numpy.linspace(0.0, 1.0, count)[:, None] \
+						* (axis.end - axis.start)
+	f = open(path, "w")
+	for i, (x, y, z) in enumerate(points):
+		f.write("ATOM  %5d  CA  ALA A%4d    %8.3f%8.3f%8.3f  1.00  0.00"
+			"           C\n" % (i+1, i+1, x, y, z))
+	f.write("END\n")
+	f.close()
+
+def writeResults(outputDir, matches):
+	"""Write trueHelixN/traceHelixN (trueSheetN/traceSheetN) for
+	   'matches' to 'outputDir', replacing any left from earlier runs
+	"""
+	if not os.path.isdir(outputDir):
+		os.makedirs(outputDir)
+	for name in os.listdir(outputDir):
+		if RESULT_FILES.match(name):
+			os.remove(os.path.join(outputDir, name))
+	for match in matches:
+		kind = match.true.kind
+		writeAxis(os.path.join(outputDir, "true%s%s.pdb"
+				% (kind, match.true.label)), match.true)
+		if match.trace is not None:
+			writeAxis(os.path.join(outputDir, "trace%s%s.pdb"
+				% (kind, match.true.label)), match.trace)
+
+def costLines(kind, true, traced, costs, usable, matches):
+	"""Return the pairCosts.csv lines for the pairs of the 'true' and
+	   'traced' Axes of 'kind' scored in 'costs', gated by 'usable'
+	   (see matchAxes())
+	"""
+	matched = set([(m.true, m.trace) for m in matches if m.trace is not None])
+	lines = []
+	for k, (i, j) in enumerate(zip(costs["rows"], costs["columns"])):
+		p = true[i]
+		q = traced[j]
+		lines.append("%s, %s, %s, %.6f, %d, %d, %.6f, %.6f, %.6f\n"
+			% (kind, p.label, q.label, costs["cost"][k], usable[k],
+			(p, q) in matched, costs["twoWayDistance"][k],
+			costs["overlap"][k], costs["angle"][k]))
+	return lines
+
+def reportLine(match, curves=False, intervals=False):
+	"""Return the report line for 'match', with its CURVE_METRICS if
+	   'curves' and its bootstrap intervals if 'intervals'
+	"""
+	fields = [match.true.label, match.trace and match.trace.label or "-"]
+	if match.trace is None:
+		fields.append("%.6f" % match.true.length())
+		fields.extend([""] * (8 + curves * len(CURVE_METRICS)
+						+ intervals * 2 * len(REPORTED)))
+		return ", ".join(fields) + "\n"
+	errors = match.errors
+	fields.extend(["%.6f" % errors[name] for name in REPORTED])
+	if curves:
+		fields.extend(["%.6f" % errors[name] for name in CURVE_METRICS])
+	if intervals:
+		for name in REPORTED:
+			fields.extend(["%.6f" % v for v in match.intervals[name]])
+	return ", ".join(fields) + "\n"
+
+def writeReport(path, matches):
+	intervals = bool([m for m in matches if m.intervals])
+	header = REPORT_HEADER
+	if intervals:
+		header = header.rstrip("\n") + INTERVAL_HEADER + "\n"
+	f = open(path, "w")
+	f.write(header)
+	for match in matches:
+		if match.true.kind == HELIX:
+			f.write(reportLine(match, intervals=intervals))
+	strands = [m for m in matches if m.true.kind == STRAND]
+	if strands:
+		curves = strands[0].true.curve is not None
+		header = REPORT_HEADER.replace("Helix#", "Sheet#").rstrip("\n")
+		if curves:
+			header += CURVE_HEADER
+		if intervals:
+			header += INTERVAL_HEADER
+		f.write("\n" + header + "\n")
+		for match in strands:
+			f.write(reportLine(match, curves, intervals))
+	f.close()
+
+def describe(match):
+	"""Return the console text for 'match', in leastsquare's words"""
+	if match.trace is None:
+		return "No trace corresponds enough to true %s %s\n" % (
+				match.true.kind.lower(), match.true.label)
+	errors = match.errors
+	extra = ""
+	if "curveDistance" in errors:
+		extra = ("Along the curves, q is %.3f from p on average and"
+			" %.3f at most\n" % (errors["curveDistance"],
+			errors["curveMaxDistance"]))
+	if match.intervals:
+		extra += ("%d%% intervals: two-way distance %.3f-%.3f, cross"
+			" displacement %.3f-%.3f, longitudinal displacement"
+			" %.3f-%.3f\n" % ((round(BOOTSTRAP_LEVEL * 100),)
+			+ match.intervals["twoWayDistance"]
+			+ match.intervals["crossDisplacement"]
+			+ match.intervals["lengthDisplacement"]))
+	return ("For true axis p and traced axis q: true%s%s --> %s\n"
+		"Length of p is %.3f\n"
+		"Length of q is %.3f\n"
+		"Length of s is %.3f\n"
+		"Cross displacement is %.3f\n"
+		"Longitudinal displacement is %.3f\n"
+		"Proportion of incorrect length to combined length of axes is %.3f\n"
+		% (match.true.kind, match.true.label, match.trace.label,
+		errors["lengthTrue"], errors["lengthTrace"], errors["overlap"],
+		errors["crossDisplacement"], errors["lengthDisplacement"],
+		errors["lengthErrorProportion"])) + extra
+
+#
+# incremental comparison
+#
+
+# bumped whenever what ComparisonState holds changes, so saved states
+# from before are not used
+STATE_VERSION = 1
+
+def _digest(path):
+	f = open(path, "rb")
+	digest = hashlib.md5(f.read()).hexdigest()
+	f.close()
+	return digest
+
+class ComparisonState(object):
+	"""What comparing against one reference found: its true Axes, the
+	   traced Axes of each file (by what the file held), the pair
+	   costs and the matches, kept so that comparing again refits and
+	   rematches only what has changed since (see compare())
+	"""
+
+	def __init__(self, reference=None):
+		self.version = STATE_VERSION
+		# digest of the reference the true axes are from
+		self.reference = reference
+		self.true = []
+		# the gate and options the costs and matches were made with
+		self.settings = None
+		# kind -> {traced file: (digest, Axis or None)}
+		self.traced = {}
+		self.clearMatches()
+		# result file name -> what it was written from
+		self.results = {}
+		# names of the result files the last comparison changed
+		self.changed = set()
+
+	def clearMatches(self):
+		"""Forget the costs and matches, and any curves, keeping the
+		   fitted axes
+		"""
+		# kind -> (traced files by column, pairCosts() or None)
+		self.costs = {}
+		# kind -> {true axis label: AxisMatch}
+		self.matches = {}
+		for axis in self.true + [axis for files in self.traced.values()
+				for digest, axis in files.values() if axis is not None]:
+			axis.curve = None
+
+	def updateTraced(self, paths, kind):
+		"""Return (Axes, changed files) for the traced 'paths' of
+		   'kind': only the files that are new or changed are read and
+		   fitted; 'changed' also holds those no longer traced
+		"""
+		old = self.traced.get(kind, {})
+		current = {}
+		fresh = []
+		for path in paths:
+			digest = _digest(path)
+			if path in old and old[path][0] == digest:
+				current[path] = old[path]
+				continue
+			axis = readTraced(path, kind)
+			current[path] = (digest, axis)
+			if axis is not None:
+				fresh.append(axis)
+		fitAxes(fresh)
+		self.traced[kind] = current
+		changed = set([path for path in old if path not in current])
+		changed.update([axis.path for axis in fresh])
+		changed.update([path for path in current if path not in old])
+		axes = [current[path][1] for path in paths
+					if current[path][1] is not None]
+		return axes, changed
+
+	def match(self, kind, true, traced, changed, gate):
+		"""Return the AxisMatches of 'true' with the 'traced' Axes of
+		   'kind' (see matchAxes()) and remember them, scoring only
+		   the pairs with a traced file in 'changed' and solving again
+		   only the groups of axes those could alter
+		"""
+		previous = self.matches.get(kind, {})
+		oldPaths, old = self.costs.get(kind, ([], None))
+		paths = [axis.path for axis in traced]
+		if not true or not traced:
+			self.costs[kind] = (paths, None)
+			self.matches[kind] = {}
+			return [AxisMatch(axis) for axis in true]
+		column = dict([(path, j) for j, path in enumerate(paths)])
+		parts = []
+		# true axes that could have been, or could now be, matched
+		# with a changed trace
+		touched = set()
+		fresh = range(len(traced))
+		if old is not None:
+			# where each old column is now, -1 if it is to be scored again
+			moved = -numpy.ones(len(oldPaths), int)
+			for j, path in enumerate(oldPaths):
+				if path not in changed and path in column:
+					moved[j] = column[path]
+			cols = moved[old["columns"]]
+			keep = cols >= 0
+			touched.update(old["rows"][~keep & gated(old, **gate)])
+			part = dict([(name, values[keep])
+					for name, values in old.items()])
+			part["columns"] = cols[keep]
+			parts.append(part)
+			fresh = [j for j, path in enumerate(paths) if path in changed]
+		if fresh:
+			part = pairCosts(true, [traced[j] for j in fresh],
+							gateReach(**gate))
+			part["columns"] = numpy.array(fresh, int)[part["columns"]]
+			touched.update(part["rows"][gated(part, **gate)])
+			parts.append(part)
+		costs = dict([(name, numpy.concatenate([part[name]
+				for part in parts])) for name in parts[0]])
+		kept = {}
+		if old is not None:
+			for i, axis in enumerate(true):
+				match = previous.get(axis.label)
+				if i in touched or match is None:
+					continue
+				kept[i] = -1
+				if match.trace is not None:
+					kept[i] = column[match.trace.path]
+		matches = matchAxes(true, traced, costs, kept, **gate)
+		for match in matches:
+			before = previous.get(match.true.label)
+			# matches that are as they were keep their curve errors
+			# and intervals
+			if before is not None and match.trace is not None \
+			and before.trace is not None \
+			and before.trace.path == match.trace.path \
+			and match.trace.path not in changed:
+				match.errors = before.errors
+				match.intervals = before.intervals
+		self.costs[kind] = (paths, costs)
+		self.matches[kind] = dict([(m.true.label, m) for m in matches])
+		return matches
+
+	def updateResults(self, matches):
+		"""Set 'changed' to the names of the result files that differ
+		   from those of the last comparison, written for 'matches'
+		"""
+		curves = self.settings and self.settings[1]
+		results = {}
+		for match in matches:
+			kind = match.true.kind
+			results["true%s%s.pdb" % (kind, match.true.label)] = curves
+			if match.trace is not None:
+				path = match.trace.path
+				results["trace%s%s.pdb" % (kind, match.true.label)] = (
+					path, self.traced[kind][path][0], curves)
+		self.changed = set([name for name in set(results) | set(self.results)
+				if results.get(name) != self.results.get(name)])
+		self.results = results
+
+def loadState(path):
+	"""Return the ComparisonState saved at 'path', or a new one if
+	   there is none that can be used
+	"""
+	try:
+		f = open(path, "rb")
+	except IOError:
+		return ComparisonState()
+	try:
+		try:
+			state = cPickle.load(f)
+		except Exception:
+			return ComparisonState()
+	finally:
+		f.close()
+	if not isinstance(state, ComparisonState) \
+	or getattr(state, 'version', None) != STATE_VERSION:
+		return ComparisonState()
+	return state
+
+def saveState(state, path):
+	"""Save ComparisonState 'state' to 'path', replacing what was
+	   there in one step
+	"""
+	temp = "%s.%d-%d" % (path, os.getpid(), threading.current_thread().ident)
+	f = open(temp, "wb")
+	cPickle.dump(state, f, 2)
+	f.close()
+	if os.name == 'nt' and os.path.exists(path):
+		# Windows cannot rename over an existing file
+		os.remove(path)
+	os.rename(temp, path)
+
+#
+# the whole comparison
+#
+
+def compare(referencePath, helixPath="", strandPath="", outPath="",
+		write=sys.stdout.write, cancelled=None, gate=None, curves=False,
+						resamples=0, state=None):
+	"""Compare the traced series starting at 'helixPath' and
+	   'strandPath' (either may be blank) against the reference PDB
+	   'referencePath', as leastsquare would, and return the
+	   AxisMatches.  Progress goes to 'write'; 'cancelled', if given,
+	   is checked between steps and stops the comparison (returning
+	   None) once it returns true.  'gate' holds the keyword arguments
+	   of gated() (see tools.parseGate()).  With 'curves', strands are
+	   matched by their axes as usual but also fitted as curves, and
+	   scored and written along those (see scoreCurves()).  With
+	   'resamples', the errors of every match get bootstrap intervals
+	   from that many resamplings of its trace (see bootstrap()).
+
+	   'state', a ComparisonState, carries over what an earlier
+	   comparison against the same reference found: only the traced
+	   files that have changed since are refitted and rematched, and
+	   state.changed is left holding the names of the result files
+	   that differ from that comparison's.
+	"""
+	def stop():
+		return cancelled is not None and cancelled()
+	gate = gate or {}
+	if state is None:
+		state = ComparisonState()
+	referencePath = pdbPath(referencePath)
+	digest = _digest(referencePath)
+	if state.reference != digest:
+		state.__init__(digest)
+		state.true = trueAxes(referencePath)
+	settings = (sorted(gate.items()), bool(curves), resamples)
+	if state.settings != settings:
+		state.clearMatches()
+		state.settings = settings
+	matches = []
+	costLog = []
+	for kind, firstPath in ((HELIX, helixPath), (STRAND, strandPath)):
+		if stop():
+			return None
+		kindTrue = [axis for axis in state.true if axis.kind == kind]
+		paths = []
+		if firstPath and firstPath != tools.EMPTY:
+			paths = tools.seriesFiles(pdbPath(firstPath))
+		traced, changed = state.updateTraced(paths, kind)
+		write("--- Number of true %s axes = %d, traced = %d\n"
+			% (kind.lower(), len(kindTrue), len(traced)))
+		if len(changed) < len(paths):
+			write("(%d traced %s files changed since the last comparison)\n"
+						% (len(changed), kind.lower()))
+		kindMatches = state.match(kind, kindTrue, traced, changed, gate)
+		costs = state.costs[kind][1]
+		if costs is not None:
+			costLog.extend(costLines(kind, kindTrue, traced, costs,
+					gated(costs, **gate), kindMatches))
+		if curves and kind == STRAND:
+			scoreCurves(kindMatches)
+		if resamples and not stop():
+			bootstrap([m for m in kindMatches if not m.intervals],
+								resamples)
+		for match in kindMatches:
+			write(describe(match))
+			matches.append(match)
+	if stop():
+		return None
+	state.updateResults(matches)
+	outputDir = tools.comparisonOutputDir(referencePath)
+	writeResults(outputDir, matches)
+	f = open(os.path.join(outputDir, COSTS_FILE), "w")
+	f.write(COSTS_HEADER)
+	f.writelines(costLog)
+	f.close()
+	if outPath and outPath != tools.EMPTY:
+		writeReport(outPath, matches)
+	write("Results written to %s\n" % outputDir)
+	return matches
+
+def main(argv):
+	import getopt
+	try:
+		opts, args = getopt.getopt(argv[1:], "b:cg:")
+	except getopt.GetoptError, e:
+		print >> sys.stderr, e
+		print >> sys.stderr, __doc__
+		return 2
+	if len(args) != 4:
+		print >> sys.stderr, __doc__
+		return 2
+	curves = False
+	gate = {}
+	resamples = 0
+	for opt, val in opts:
+		if opt == "-b":
+			resamples = int(val)
+		elif opt == "-c":
+			curves = True
+		elif opt == "-g":
+			try:
+				gate = tools.parseGate(val)
+			except ValueError, e:
+				print >> sys.stderr, "Bad gate: %s" % e
+				return 2
+	compare(gate=gate, curves=curves, resamples=resamples, *args)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
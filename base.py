@@ -8,16 +8,17 @@ import Tkinter
 import CGLtk
 import os
 import chimera
-import subprocess
 from chimera import dialogs
 from Tkinter import Tk
 import Queue
-import multiprocessing
-import ModelPanel
-import platform
 import time
-import shutil
-from VolumeViewer import Volume
+import tools
+import runTools
+# runTools brings in the core of the job machinery (jobs, pipeline,
+# progress), which is small; the rest of it (launcher, memoryModel,
+# jobHistory, metricsExport, worker) and VolumeViewer are imported where
+# they are first used, so that loading the extension stays cheap; see
+# importTimes.py
 
 _buttonInfo = {}
 _mp = None
@@ -170,7 +171,7 @@ def getPhysicalChains(model):
 
 def nameColumn(m):
 	if "trace" in readableName(m):
-		if _mp and _mp._confDialog.showColorVar.get():
+		if _mp and _mp._confDialog.showColor():
 			bcolor = isinstance(m, chimera.Molecule) and m.color or None
 			return readableName(m), bcolor
 		return readableName(m)
@@ -185,7 +186,6 @@ def _oslIdent(item):
 		return u"%s\N{HORIZONTAL ELLIPSIS}%s" % (osls[0][1:], osls[-1][1:])
 	return item.oslIdent()[1:]
 
-from _surface import SurfaceModel
 addColumns([
 	('Name', 'text', nameColumn)
 ])
@@ -196,7 +196,7 @@ addColumns([
 
 class ModelPanel(ModelessDialog):
 	title="SSETracer"
-	buttons=('Run Tracer', 'Run Twister','Axis Comparison','Close')
+	buttons=('Run Tracer', 'Run Twister','Axis Comparison','Run Pipeline','Stop','Jobs','Close')
 	name="SSETracer"
 	#help="UsersGuide/modelpanel.html"
 
@@ -204,13 +204,31 @@ class ModelPanel(ModelessDialog):
 			"\nright-hand action buttons work on selected models;"\
 			"\ndouble-click to perform default action on model"\
 			"\n(see 'Configure...' for default action info)"
+
+	# ms between output box updates while jobs run
+	outputInterval = 100
+	# lines of job output kept in the output box
+	outputLines = 5000
 	
 	
 			
 	def __init__(self):
-		self.outputQueue = Queue.Queue()
-		self.runEnabled = True
-		self.threadClass = None
+		from chimera import preferences
+		self.jobPrefs = preferences.addCategory("SSETracer jobs",
+					preferences.HiddenCategory,
+					optDict={"limits": {}, "timeouts": {},
+						"cacheSize": 2.0, "memoryBudget": 0.0,
+						"workers": [], "workerKey": "",
+						"comparisonEngine": "",
+						"comparisonGate": "",
+						"comparisonCurves": False,
+						"comparisonResamples": 0,
+						"keepRuns": 0})
+		#filled in by _startScheduler()
+		self.history = None
+		self._doneJobs = Queue.Queue()
+		self.shownJob = None
+		self._updatingOutput = False
 
 		openModels = chimera.openModels.list()
 
@@ -258,6 +276,40 @@ class ModelPanel(ModelessDialog):
 		self.pdb2Path.set(self.pdbCurrentPath)
 
 		ModelessDialog.__init__(self)
+
+	def __getattr__(self, name):
+		#the scheduler is only set up once a job or the job table needs it
+		if name == 'scheduler':
+			self._startScheduler()
+			return self.__dict__['scheduler']
+		raise AttributeError(name)
+
+	def _startScheduler(self):
+		import launcher
+		import memoryModel
+		import jobHistory
+		import metricsExport
+		#tools are started by the launcher process rather than by
+		#forking Chimera, when the platform allows
+		self.scheduler = jobs.JobScheduler(self.jobPrefs["limits"],
+					timeouts=self.jobPrefs["timeouts"],
+					launcher=launcher.shared(),
+					memory=memoryModel.MemoryModel())
+		self.setCacheSize(self.jobPrefs["cacheSize"])
+		self.setMemoryBudget(self.jobPrefs["memoryBudget"])
+		self.setWorkers(self.jobPrefs["workers"])
+		self.scheduler.addStateHandler(self._jobStateChange)
+		try:
+			self.history = jobHistory.JobHistory()
+			self.history.attach(self.scheduler)
+		except Exception:
+			import traceback
+			traceback.print_exc()
+		try:
+			metricsExport.MetricsExport().attach(self.scheduler)
+		except Exception:
+			import traceback
+			traceback.print_exc()
 		
 	def fillInUI(self, parent):
 		global _mp
@@ -288,6 +340,8 @@ class ModelPanel(ModelessDialog):
 		self.label4SSE.grid(row=3, column=7, sticky='E')
 		self.thresholdEntrySSE= Entry(parent)
 		self.thresholdEntrySSE.grid(row=3, column=8,sticky='EW')
+		help.register(self.thresholdEntrySSE, balloon="threshold, or several to run in parallel:"
+			"\na list (0.3, 0.35, 0.4) or a start:stop:step range (0.3:0.5:0.05)")
 		self.analysisSSE = Tkinter.IntVar()
 		self.checkBox2SSE = Checkbutton(parent, variable=self.analysisSSE).grid(row=4, column =9, sticky='WS', pady=(13,0))
 		self.label5SSE = Label(parent, text="Sensitivity analysis (using PDB below)")
@@ -438,91 +492,99 @@ class ModelPanel(ModelessDialog):
 	
 	def RunTracer(self):
 
-		if self.runEnabled:
+		#one threshold, a list of them or a start:stop:step sweep
+		try:
+			thresholds = tools.parseThresholds(self.thresholdEntrySSE.get())
+		except ValueError:
+			thresholds = []
+
+		if self.mrcPathSSE and self.skeletonPathSSE and thresholds:
+			mrcPath = os.path.splitext(self.mrcPathSSE.get())[0] #file path and name without extension
+			pdbPath = os.path.splitext(self.pdbPathSSE.get())[0] #file path and name without extension
+			skeletonPath = os.path.splitext(self.skeletonPathSSE.get())[0] #file path and name without extension
+
+			tracerJobs = [TracerJob(mrcPath, skeletonPath, threshold, self.analysisSSE.get(), pdbPath, self.openCut.get())
+							for threshold in thresholds]
+			if len(tracerJobs) > 1:
+				#the runs write separate _thr_<t>_outFiles folders, so they can all go at once;
+				#each job keeps the sweep as its 'sweep'
+				TracerSweep(mrcPath, tracerJobs)
+			for job in tracerJobs:
+				self.submitJob(job)
 
+		else:
+			#change to dialog box
 			self.outputBox.delete('1.0', Tkinter.END)
-
-			threshold = self.thresholdEntrySSE.get()
-
-			if self.mrcPathSSE and self.skeletonPathSSE and threshold:
-				mrcPath = os.path.splitext(self.mrcPathSSE.get())[0] #file path and name without extension
-				pdbPath = os.path.splitext(self.pdbPathSSE.get())[0] #file path and name without extension
-				skeletonPath = os.path.splitext(self.skeletonPathSSE.get())[0] #file path and name without extension
-				path = os.path.dirname(mrcPath)
-				
-				# Only use drive letter + colon if path points to drive root on Windows
-				if platform.system() == 'Windows' and len(path) == 3:
-					path = path[:2]
-
-				if platform.system() == 'Linux':
-					tracerPath = os.path.dirname(os.path.realpath(__file__)) + os.sep + "tracer_v3_command"
-				else:
-					tracerPath = os.path.dirname(os.path.realpath(__file__)) + os.sep + "tracer_v3_command.exe"
-
-				tracerPath = '"' + tracerPath + '"'
-
-				self.threadClass = TracerThread(tracerPath, path, mrcPath, skeletonPath, threshold, self.analysisSSE.get(), pdbPath, self.openCut.get(), self.outputQueue)
-				self.threadClass.start()
-				#buttons = ('Close')
-				self.runEnabled = False
-				#disable the actual button
-
-				#waits to make sure thread.isAlive() returns true
-				while True:
-					try:
-						if self.threadClass.isAlive():
-							break
-					except AttributeError:
-						pass
-
-
-				self.outputBox.after(1000, self.updateOutput)
-
-			else:
-				#change to dialog box
-				self.outputBox.insert(Tkinter.END, "Incorrect input")
+			self.outputBox.insert(Tkinter.END, "Incorrect input")
 
 	def RunTwister(self):
 
-		if self.runEnabled:
+		threshold = self.threshold2EntrySSE.get()
 
-			self.outputBox.delete('1.0', Tkinter.END)
-
-			threshold = self.threshold2EntrySSE.get()
-
-			if self.mrc2Path and self.pdb2Path and threshold: #and mrcFile and newX and newY and newZ:
-				mrcPath = os.path.splitext(self.mrc2Path.get())[0] #file path and name without extension
-				pdbPath = os.path.splitext(self.pdb2Path.get())[0] #file path and name without extension
-				#skeletonPath = os.path.splitext(self.skeletonPath.get())[0] #file path and name without extension
-				path = os.path.dirname(mrcPath)
-
-				if platform.system() == 'Linux':
-					twisterPath = os.path.dirname(os.path.realpath(__file__)) + os.sep + "strandtwister_v2_command"
-				else:
-					twisterPath = os.path.dirname(os.path.realpath(__file__)) + os.sep + "strandtwister_v2_command.exe"
+		if self.mrc2Path and self.pdb2Path and threshold: #and mrcFile and newX and newY and newZ:
+			mrcPath = os.path.splitext(self.mrc2Path.get())[0] #file path and name without extension
+			pdbPath = os.path.splitext(self.pdb2Path.get())[0] #file path and name without extension
 
-				twisterPath = '"' + twisterPath + '"'
-
-				self.threadClass = TwisterThread(twisterPath, path, mrcPath, "skeletonPath", threshold, self.analysisSSE.get(), pdbPath, self.openCut.get(), self.outputQueue)
-				self.threadClass.start()
-				#buttons = ('Close')
-				self.runEnabled = False
-				#disable the actual button
-
-				#waits to make sure thread.isAlive() returns true
-				while True:
-					try:
-						if self.threadClass.isAlive():
-							break
-					except AttributeError:
-						pass
+			self.submitJob(TwisterJob(mrcPath, threshold, pdbPath, self.openCut.get()))
 
+		else:
+			#change to dialog box
+			self.outputBox.delete('1.0', Tkinter.END)
+			self.outputBox.insert(Tkinter.END, "Incorrect input")
 
-				self.outputBox.after(1000, self.updateOutput)
+	def RunPipeline(self):
+		"""trace the SSETracer map at each threshold, run Strand Twister on
+		   each sheet estimate and compare both against the PDB file;
+		   each run starts as soon as the ones it needs are done
+		"""
+		try:
+			thresholds = tools.parseThresholds(self.thresholdEntrySSE.get())
+		except ValueError:
+			thresholds = []
+		twisterThreshold = self.threshold2EntrySSE.get()
+
+		if self.mrcPathSSE.get() and self.skeletonPathSSE.get() and self.pdbPathSSE.get() and thresholds and twisterThreshold:
+			mrcPath = os.path.splitext(self.mrcPathSSE.get())[0] #file path and name without extension
+			pdbPath = os.path.splitext(self.pdbPathSSE.get())[0] #file path and name without extension
+			skeletonPath = os.path.splitext(self.skeletonPathSSE.get())[0] #file path and name without extension
+			openCut = self.openCut.get()
+			engine = self.jobPrefs["comparisonEngine"]
+			gate = self.jobPrefs["comparisonGate"]
+			curves = self.jobPrefs["comparisonCurves"]
+			resamples = self.jobPrefs["comparisonResamples"]
+
+			def report(pipeline):
+				summary = runTools.writeSummary(pipeline, mrcPath)
+				for stage in pipeline.stages:
+					if stage.job is not None:
+						stage.job.write("\nPipeline summary (%s_pipeline.txt):\n%s" % (mrcPath, summary))
+			import pipeline
+			p = pipeline.Pipeline(self.scheduler, os.path.basename(mrcPath), report)
+			#the chain itself is shared with runTools.py; only opening the
+			#results in Chimera is added here
+			runTools.addStages(p, mrcPath, skeletonPath, pdbPath, thresholds,
+				twisterThreshold, self.analysisSSE.get(),
+				tracer=lambda *args: TracerJob(*args, openCut=openCut),
+				twister=lambda *args: TwisterJob(*args, openCut=openCut),
+				comparison=lambda *args: DistanceCompareJob(engine=engine, gate=gate, curves=curves,
+					resamples=resamples, *args))
+			self.runPipeline(p)
 
-			else:
-				#change to dialog box
-				self.outputBox.insert(Tkinter.END, "Incorrect input")
+		else:
+			#change to dialog box
+			self.outputBox.delete('1.0', Tkinter.END)
+			self.outputBox.insert(Tkinter.END, "Incorrect input")
+
+	def runPipeline(self, p):
+		"""start pipeline 'p' and show the output of its first job"""
+		p.start()
+		for stage in p.stages:
+			if stage.job is not None:
+				self.showJob(stage.job)
+				break
+		if not self._updatingOutput:
+			self._updatingOutput = True
+			self.outputBox.after(self.outputInterval, self.updateOutput)
 
 	#copy path from current entry to empty entry boxes in copyBoxes using the given extension from each tuple
 	#copyBoxes contains one or more tuples in the format (DESTINATION, EXTENSION) where DESTINATION is a Var
@@ -561,187 +623,174 @@ class ModelPanel(ModelessDialog):
 
 	def AxisComparison(self):
 
-		if self.runEnabled:
-
-			self.outputBox.delete('1.0', Tkinter.END)
-
-			#threshold = self.thresholdEntry.get()
-
-			if self.mrcPath and self.skeletonPath:
-				mrcPath = os.path.splitext(self.mrcPath.get())[0] #file path and name without extension
-				pdbPath = os.path.splitext(self.pdbPath.get())[0] #file path and name without extension
-				skeletonPath = os.path.splitext(self.skeletonPath.get())[0] #file path and name without extension
-				stickPath = os.path.splitext(self.stickPath.get())[0]
-				outPath = os.path.splitext(self.outputPath.get())[0]
-				path = os.path.dirname(mrcPath)
-
-				if platform.system() == 'Linux':
-					tracerPath = os.path.dirname(os.path.realpath(__file__)) + os.sep + "leastsquare"
-				else:
-					tracerPath = os.path.dirname(os.path.realpath(__file__)) + os.sep + "leastsquare.exe"
-					
-				tracerPath = '"' + tracerPath + '"'
-				
-				proteinNameOffset = 1	
-				stringHolder = mrcPath[-proteinNameOffset:]
-				while ("\\" not in stringHolder):
-					proteinNameOffset+=1
-					stringHolder = mrcPath[-proteinNameOffset:]
-				proteinNameOffset -= 1	
-				
-				if(outPath[-4:] != ".txt") and (outPath != "") :
-					outPath = outPath + ".txt"
+		#threshold = self.thresholdEntry.get()
+
+		if self.mrcPath and self.skeletonPath:
+			mrcPath = os.path.splitext(self.mrcPath.get())[0] #file path and name without extension
+			skeletonPath = os.path.splitext(self.skeletonPath.get())[0] #file path and name without extension
+			stickPath = os.path.splitext(self.stickPath.get())[0]
+			outPath = os.path.splitext(self.outputPath.get())[0]
+
+			if(outPath[-4:] != ".txt") and (outPath != "") :
+				outPath = outPath + ".txt"
+			#each run writes to a folder of its own under output_runs, so
+			#earlier results stay readable and runs can overlap
+			runDir = tools.newComparisonRun(mrcPath + ".pdb")
+
+			#results open as leastsquare writes them; see DistanceCompareJob
+			job = DistanceCompareJob(mrcPath, skeletonPath, stickPath, outPath, runDir,
+				self.jobPrefs["comparisonEngine"], self.jobPrefs["comparisonGate"],
+				self.jobPrefs["comparisonCurves"], self.jobPrefs["comparisonResamples"])
+			#the NumPy engine only replaces the results that changed, so the
+			#models of the last comparison against this reference stay open
+			if job.engine == tools.LEASTSQUARE or not job.showsReference():
 				# close all currently open models
 				for e in chimera.openModels.list(all=True):
 					chimera.openModels.close(e)
-				#delete old files
-				if os.path.exists(mrcPath[:-proteinNameOffset] + "output/"):
-					shutil.rmtree(mrcPath[:-proteinNameOffset] + "output/") 
-				if not os.path.exists(mrcPath[:-proteinNameOffset] + "/output/"):
-					os.makedirs(mrcPath[:-proteinNameOffset] + "/output/")
-					
-				self.threadClass = DistanceCompareThread(tracerPath, path, mrcPath, skeletonPath, stickPath, pdbPath, self.outputQueue, outPath)
-				
-				self.threadClass.start()
-				#buttons = ('Close')
-				self.runEnabled = False
-				#disable the actual button
-
-				#waits to make sure thread.isAlive() returns true
-				while True:
-					try:
-						if self.threadClass.isAlive():
-							break
-					except AttributeError:
-						pass
-
-
-				self.outputBox.after(1000, self.updateOutput)
+				DistanceCompareJob.shown.clear()
+			self.submitJob(job)
 
-			else:
-				#change to dialog box
-				self.outputBox.insert(Tkinter.END, "Incorrect input")
-		
-		#wait for c++ program to create files
-		while self.threadClass.isAlive():
-			True
-		#open files
-		it = 0
-		x = -1
-		if skeletonPath != "" :
-			while(skeletonPath[len(skeletonPath)-it-1] != "1" and skeletonPath[len(skeletonPath)-it-1] != "0"):
-				if(len(skeletonPath)-it-2 > 0):
-					it = it+1
-				else:
-					break;
-			if(skeletonPath[len(skeletonPath)-it-1] == "1"):
-				x = 1
-				if(os.path.isfile(mrcPath[:-proteinNameOffset] +  "/output/traceHelix0.pdb")):
-					os.remove(mrcPath[:-proteinNameOffset] +  "/output/traceHelix0.pdb")
-			if(skeletonPath[len(skeletonPath)-it-1] == "0"):
-				x = 0
-		if stickPath != "" :
-			while(stickPath[len(stickPath)-it-1] != "1" and stickPath[len(stickPath)-it-1] != "0"):
-				it = it+1
-			if(stickPath[len(stickPath)-it-1] == "1"):
-				x = 1
-				#if(os.path.isfile(mrcPath[:-4] +  "/output/traceHelix0.pdb")):
-				#	os.remove(mrcPath[:-4] +  "/output/traceHelix0.pdb")
-			if(stickPath[len(stickPath)-it-1] == "0"):
-				x = 0
-		
-		x = 1
-		if (os.path.isfile(mrcPath[:-proteinNameOffset] +  "/output/traceHelix0" + ".pdb")):
-			chimera.openModels.open(mrcPath[:-proteinNameOffset] + "/output/traceHelix0" + ".pdb")
-		#time.sleep(.5)
-		count = x
-		if (os.path.isfile(mrcPath[:-proteinNameOffset] +  "/output/traceHelix" + str(count) + ".pdb")):
-			while(True):
-				while(os.path.isfile(mrcPath[:-proteinNameOffset] +  "/output/traceHelix" + str(count) + ".pdb")):
-					chimera.openModels.open(mrcPath[:-proteinNameOffset] + "/output/traceHelix" + str(count) + ".pdb")
-					count = count + 1	
-				if(count != x):
-					break
-				else:
-					time.sleep(.25)
-			
-		variable = 0
-		count = x
-		
-		if (os.path.isfile(mrcPath[:-proteinNameOffset] +  "/output/traceSheet0" + ".pdb")):
-			chimera.openModels.open(mrcPath[:-proteinNameOffset] + "/output/traceSheet0" + ".pdb")
-		while(True):
-			while(os.path.isfile(mrcPath[:-proteinNameOffset] +  "/output/traceSheet" + str(count) + ".pdb")):
-				chimera.openModels.open(mrcPath[:-proteinNameOffset] + "/output/traceSheet" + str(count) + ".pdb")
-				count = count + 1	
-				variable = 0
-			if(time > 4):
-				break
-			if(count != x):
-				break
-			else:
-				variable = variable + 1
-				time.sleep(.25)		
-				
-	
-		count = 1
-		while(os.path.isfile(mrcPath[:-proteinNameOffset] +  "/output/trueHelix" + str(count) + ".pdb")):
-			chimera.openModels.open(mrcPath[:-proteinNameOffset] + "/output/trueHelix" + str(count) + ".pdb")
-			count = count + 1
-		while(os.path.isfile(mrcPath[:-proteinNameOffset] +  "/output/trueSheet" + str(count) + ".pdb")):
-			chimera.openModels.open(mrcPath[:-proteinNameOffset] + "/output/trueSheet" + str(count) + ".pdb")
-			count = count + 1
-		
-		if (os.path.isfile(skeletonPath + ".mrc")):
-			chimera.openModels.open(skeletonPath + ".mrc")
-			for v in openModels.list(modelTypes=[Volume]):
-				v.initialize_thresholds ( self,  True )
-				v.set_parameters(surface_colors = [(0.7, 0.7, 0.7, 0.5)], surface_levels = [.1])
-				v.show()
-			
-		chimera.openModels.open(mrcPath + ".pdb")
-		from chimera import viewer
-		viewer.viewAll()
-		
-		import Midas
-		Midas.color('#d2d2b4b48c8c', '@/element=C')
+		else:
+			#change to dialog box
+			self.outputBox.delete('1.0', Tkinter.END)
+			self.outputBox.insert(Tkinter.END, "Incorrect input")
+
+	def submitJob(self, job):
+		"""queue 'job' and show its output in the output box"""
+		if self.history is not None:
+			previous = self.history.lastRun(job)
+			if previous:
+				job.write("The same run finished on %s; its results are in %s\n\n"
+					% (time.ctime(previous['ended']), ", ".join(previous['outputs'])))
+		self.scheduler.submit(job)
+		self.showJob(job)
+		if not self._updatingOutput:
+			self._updatingOutput = True
+			self.outputBox.after(self.outputInterval, self.updateOutput)
+
+	def showJob(self, job):
+		"""show the output of 'job' in the output box"""
+		self.shownJob = job
+		self.outputBox.delete('1.0', Tkinter.END)
+		if job.log.dropped:
+			self.outputBox.insert(Tkinter.END, "[%d earlier lines are in %s]\n"
+						% (job.log.dropped, job.log.path))
+		self.outputBox.insert(Tkinter.END, job.log.text())
+		self.outputBox.yview(Tkinter.MOVETO, 1.0)
 
 	def updateOutput(self):
-
-		try:
-			#self.outputBox.insert(Tkinter.END, "try block")
-			self.outputBox.insert(Tkinter.END, self.outputQueue.get(block=False))
-			self.outputBox.yview(Tkinter.MOVETO, 1.0)
-		except Queue.Empty:
-			pass
-
-		#self.outputBox.insert(Tkinter.END, "test")
-		try:
-			if not self.runEnabled:
-				self.outputBox.after(50, self.updateOutput)
-
-			if not self.threadClass.isAlive(): #make sure 
-			 	self.outputBox.after(3000, self.enableButton)
-		except AttributeError:
-			pass
-
-	def enableButton(self):
+		#open the results of jobs that are done; this has to happen
+		#here in the Tk loop rather than in the job's worker thread
 		while True:
 			try:
-				self.outputBox.insert(Tkinter.END, self.outputQueue.get(block=False))
-				self.outputBox.yview(Tkinter.MOVETO, 1.0)
+				job = self._doneJobs.get(block=False)
 			except Queue.Empty:
 				break
+			sweep = getattr(job, 'sweep', None)
+			if sweep and sweep.isDone():
+				sweep.report()
+			if job.state == jobs.CANCELLED:
+				continue
+			try:
+				job.finish()
+			except:
+				import traceback
+				job.write(traceback.format_exc())
+			if isinstance(job, runTools.ComparisonRun) and self.jobPrefs["keepRuns"]:
+				self.pruneRuns(job.pdbPath + ".pdb")
+
+		#everything that arrived since the last tick goes in with one insert
+		for job in self.scheduler.jobs():
+			if job.state == jobs.RUNNING:
+				try:
+					job.update()
+				except:
+					import traceback
+					job.write(traceback.format_exc())
+			text = job.readOutput()
+			if text and job is self.shownJob:
+				self.outputBox.insert(Tkinter.END, text)
+				self._trimOutput()
+				self.outputBox.yview(Tkinter.MOVETO, 1.0)
 
-		self.runEnabled = True
-		#enable the actual button
+		#keep going until every job is done and its output shown
+		if self.scheduler.active() or not self._doneJobs.empty():
+			self.outputBox.after(self.outputInterval, self.updateOutput)
+		else:
+			self._updatingOutput = False
+			for job in self.scheduler.jobs():
+				job.log.close()
+
+	def _trimOutput(self):
+		#the output box only keeps the last outputLines lines
+		lines = int(self.outputBox.index('end-1c').split('.')[0])
+		if lines > self.outputLines:
+			self.outputBox.delete('1.0', '%d.0' % (lines - self.outputLines + 1))
+
+	def _jobStateChange(self, job):
+		#called from the scheduler's worker threads
+		if job.isDone():
+			self._doneJobs.put(job)
+
+	def setCacheSize(self, gigabytes):
+		"""limit the result cache to 'gigabytes'; 0 turns it off"""
+		if not gigabytes:
+			self.scheduler.cache = None
+			return
+		maxBytes = int(gigabytes * 1024**3)
+		if self.scheduler.cache is None:
+			from resultCache import ResultCache
+			self.scheduler.cache = ResultCache(maxBytes=maxBytes)
+		else:
+			self.scheduler.cache.maxBytes = maxBytes
+			self.scheduler.cache.evict()
 
-		#self.update_idletasks()
+	def setMemoryBudget(self, gigabytes):
+		"""only start runs that are expected to fit in 'gigabytes' of
+		   memory; 0 leaves room for this session in 80% of the
+		   physical memory
+		"""
+		if gigabytes:
+			self.scheduler.setMemoryBudget(int(gigabytes * 1024**3))
+		else:
+			import memoryModel
+			self.scheduler.setMemoryBudget(memoryModel.defaultBudget())
+
+	def setWorkers(self, addresses):
+		"""run jobs on the worker daemons at 'addresses' ("host:port"
+		   strings) while they have free slots, and here otherwise
+		"""
+		if addresses:
+			import worker
+			self.scheduler.workers = worker.WorkerPool(addresses,
+					key=self.jobPrefs["workerKey"] or None)
+		else:
+			self.scheduler.workers = None
+
+	def pruneRuns(self, pdbPath):
+		"""delete all but the newest comparison runs against 'pdbPath',
+		   as many as the keepRuns preference says, other than those the
+		   jobs or the run history still refer to
+		"""
+		try:
+			runTools.pruneRuns(pdbPath, self.jobPrefs["keepRuns"],
+						self.scheduler, self.history)
+		except Exception:
+			import traceback
+			traceback.print_exc()
+
+	def Stop(self):
+		"""stop the job whose output is shown"""
+		if self.shownJob:
+			self.scheduler.cancel(self.shownJob, "stopped by user")
+
+	def Jobs(self):
+		"""show the job table"""
+		from jobDialog import JobDialog
+		if not hasattr(self, '_jobDialog'):
+			self._jobDialog = JobDialog(self)
+		self._jobDialog.enter()
 
-		#call updateOutput until process finished
-		#disable run button until finished
-		#add stop button
-		
 	def Configure(self):
 		"""configure action buttons"""
 		self._confDialog.enter()
@@ -1583,6 +1632,7 @@ _groups = []
 _groupNameCache = {}
 def groupCmd(items, name=None):
 	from Group import Group
+	_registerSessionSave()
 	removeGroups = []
 	addItems = []
 	newGroup = None
@@ -1699,8 +1749,15 @@ try:
 except:
 	reportRestoreError("Error restoring model panel groups")
 """
-from SimpleSession import SAVE_SESSION
-chimera.triggers.addHandler(SAVE_SESSION, _saveGroups, None)
+_saveHandler = None
+def _registerSessionSave():
+	# groups are the only thing saved in sessions, so SimpleSession is
+	# not needed until the first one is made
+	global _saveHandler
+	if _saveHandler is None:
+		from SimpleSession import SAVE_SESSION
+		_saveHandler = chimera.triggers.addHandler(SAVE_SESSION,
+							_saveGroups, None)
 
 from chimera.baseDialog import ModalDialog
 class GroupNameDialog(ModalDialog):
@@ -1828,106 +1885,128 @@ def _getModels(item):
 		return item.models
 	return [item]
 
-import threading
+import jobs
 
-class DistanceCompareThread(threading.Thread):
-	def __init__(self, tracerPath, path, mrcPath, skeletonPath, threshold, pdbPath, outputQueue, outPath):
-		self.tracerPath = tracerPath
-		self.path = path
-		self.pdbPath = pdbPath
-		self.mrcPath = mrcPath
-		self.skeletonPath = skeletonPath
-		self.threshold = threshold
-		self.outputQueue = outputQueue
-		self.outPath = outPath
-		threading.Thread.__init__(self)
-
-	def run(self):
-		if (self.skeletonPath == ""):
-			self.skeletonPath = "Empty"
-		if (self.threshold == ""):
-			self.threshold = "Empty"
-		if (self.outPath == ""):
-			self.outPath = "Empty"
-		if platform.system() == 'Windows':
-			arguments = '"' + self.mrcPath +  '" "'  + self.skeletonPath + '" "' + self.threshold + '" "' + self.outPath + '"'
-		else:
-			arguments = '"' + self.mrcPath +  '" "'  + self.skeletonPath + '" "' + self.threshold + '" "' + self.outPath + '"'
-		# for i in self.chains:
-		# 	arguments += " " + i
-		#self.outputBox.insert(Tkinter.END, "Running: " + self.cutDensityPath + "\n with arguments: " + arguments + "\n\n")
-		#self.outputQueue.put("Running: " + self.tracerPath + "\n" + arguments + "\n\n")
-		#process = subprocess.Popen('exec "' + self.tracerPath + " " + arguments + '"', stdout=subprocess.PIPE, shell=True)
-		process = subprocess.Popen(self.tracerPath + " " + arguments, stdout=subprocess.PIPE, shell=True)
-		#process = subprocess.Popen([self.tracerPath, self.pdbPath, pdbID, stdout=subprocess.PIPE, shell=False)
+class DistanceCompareJob(runTools.ComparisonRun):
+	resultFiles = r"(trace|true)(Helix|Sheet)\d+\.pdb$"
 
-		while True:
-			line = process.stdout.readline()
+	#the models opened, across runs, for each result of a comparison of
+	#traced series against a reference, and for each reference; see _key
+	shown = {}
 
-			if line != '':
-				self.outputQueue.put(line.rstrip() + "\n")
-				#self.outputBox.insert(Tkinter.END, line.rstrip() + "\n")
-			else:
-				break
+	def __init__(self, pdbPath, helixPath, strandPath, outPath, runDir, engine="", gate="", curves=False,
+			resamples=0):
+		runTools.ComparisonRun.__init__(self, pdbPath, helixPath, strandPath, outPath, runDir, engine, gate, curves,
+			resamples)
+		self.arrived = Queue.Queue()
+		self.opened = set()
 
-		self.outputQueue.put("Process finished\n")
+	def watchOutput(self):
+		return (self.outputDir(), self.resultFiles)
 
-class TracerThread(threading.Thread):
-	def __init__(self, tracerPath, path, mrcPath, skeletonPath, threshold, analysis, pdbPath, openCut, outputQueue):
-		self.openCut = openCut
-		self.tracerPath = tracerPath
-		self.path = path
-		self.pdbPath = pdbPath
-		self.mrcPath = mrcPath
-		self.skeletonPath = skeletonPath
-		self.threshold = threshold
-		self.outputQueue = outputQueue
-		self.analysis = analysis
-		threading.Thread.__init__(self)
-
-	def run(self):
-		if platform.system() == 'Windows':
-			arguments = '"' + self.path + '"\ "' + self.mrcPath + '" "' + self.skeletonPath + '" ' + str(self.threshold) + ' ' + str(self.analysis) + ' "' + self.pdbPath + '"'
-		else:
-			arguments = '"' + self.path + '" "' + self.mrcPath + '" "' + self.skeletonPath + '" ' + str(self.threshold) + ' ' + str(self.analysis) + ' "' + self.pdbPath + '"'
-		# for i in self.chains:
-		# 	arguments += " " + i
-
-		#self.outputBox.insert(Tkinter.END, "Running: " + self.cutDensityPath + "\n with arguments: " + arguments + "\n\n")
-		self.outputQueue.put("Running: " + self.tracerPath + "\n" + arguments + "\n\n")
-		#process = subprocess.Popen('exec "' + self.tracerPath + " " + arguments + '"', stdout=subprocess.PIPE, shell=True)
-		process = subprocess.Popen(self.tracerPath + " " + arguments, stdout=subprocess.PIPE, shell=True)
-		#process = subprocess.Popen([self.tracerPath, self.pdbPath, pdbID, stdout=subprocess.PIPE, shell=False)
+	def fileComplete(self, path):
+		self.arrived.put(path)
 
+	def update(self):
+		#open each result as soon as leastsquare has written it
 		while True:
-			line = process.stdout.readline()
-
-			if line != '':
-				self.outputQueue.put(line.rstrip() + "\n")
-				#self.outputBox.insert(Tkinter.END, line.rstrip() + "\n")
-			else:
+			try:
+				path = self.arrived.get(block=False)
+			except Queue.Empty:
 				break
+			self.openResult(path)
 
-		self.outputQueue.put("Process finished\n")
+	def showsReference(self):
+		"""whether the models of this job's reference are still open"""
+		return self._isShown(None)
 
+	def _key(self, name):
+		if name is None:
+			return (self.pdbPath,)
+		return (self.pdbPath, self.helixPath, self.strandPath, name)
+
+	def _isShown(self, name):
+		models = self.shown.get(self._key(name))
+		return bool(models) and not [m for m in models if m.__destroyed__]
+
+	def _show(self, name, path):
+		key = self._key(name)
+		for m in self.shown.pop(key, []):
+			if not m.__destroyed__:
+				chimera.openModels.close(m)
+		if path is not None:
+			self.shown[key] = chimera.openModels.open(path)
+
+	def openResult(self, path):
+		if path in self.opened:
+			return
+		self.opened.add(path)
+		#a helix series numbered from 1 leaves a stale traceHelix0 behind
+		digits = [c for c in self.helixPath if c in "01"]
+		if digits and digits[-1] == "1" and os.path.basename(path) == "traceHelix0.pdb":
+			os.remove(path)
+			return
+		name = os.path.basename(path)
+		#results the NumPy engine found unchanged keep their models
+		if self.changed is not None and name not in self.changed and self._isShown(name):
+			return
+		self._show(name, path)
+
+	def finish(self):
+		self.update()
+		#results restored from the cache never went past the watcher
+		outputDir = self.outputDir()
+		import re
+		import outputWatcher
+		for name in sorted(os.listdir(outputDir), key=outputWatcher.naturalKey):
+			if re.match(self.resultFiles, name):
+				self.openResult(os.path.join(outputDir, name))
+		#and those no longer written go
+		for name in self.changed or ():
+			if not os.path.isfile(os.path.join(outputDir, name)):
+				self._show(name, None)
+
+		#the map is shown again only if the traces have changed
+		if (os.path.isfile(self.helixPath + ".mrc")) and (self.changed or not self._isShown(".mrc")):
+			from VolumeViewer import Volume
+			self._show(".mrc", self.helixPath + ".mrc")
+			for v in openModels.list(modelTypes=[Volume]):
+				v.initialize_thresholds ( self,  True )
+				v.set_parameters(surface_colors = [(0.7, 0.7, 0.7, 0.5)], surface_levels = [.1])
+				v.show()
+			
+		if self.showsReference():
+			return
+		self.shown[self._key(None)] = chimera.openModels.open(self.pdbPath + ".pdb")
+		viewer.viewAll()
+		
+		import Midas
+		Midas.color('#d2d2b4b48c8c', '@/element=C')
+
+class TracerJob(runTools.TracerRun):
+
+	def __init__(self, mrcPath, skeletonPath, threshold, analysis, pdbPath, openCut=False):
+		runTools.TracerRun.__init__(self, mrcPath, skeletonPath, threshold, analysis, pdbPath)
+		self.openCut = openCut
+		self.sweep = None
+
+	def finish(self):
 		if self.openCut:
 			import glob
-			import time
 
 			#1FLP_thr_0.4_outFiles
 
 			pdbID = os.path.basename(self.mrcPath)
 
 			outputPath = self.mrcPath + "_thr_" + self.threshold + "_outFiles"
-			#self.outputQueue.put(outputPath + "\n")
+			#self.write(outputPath + "\n")
 
 			openModelsBefore = list(chimera.openModels.list())
 
 			#os.chdir(outputPath)
 			for file in glob.glob(outputPath + os.sep + '*.pdb'):
-				self.outputQueue.put("Opening: " + file + "\n")
+				self.write("Opening: " + file + "\n")
 				chimera.openModels.open(file)
-				time.sleep(0.5)
 
 			#1FLP_SHTestimate_final.mrc
 
@@ -1943,69 +2022,73 @@ class TracerThread(threading.Thread):
 			outputModels = set(openModelsNow) - set(openModelsBefore)
 
 			groupName = pdbID + "_thr_" + self.threshold
-			ModelPanel.groupCmd(outputModels, groupName)
+			groupCmd(outputModels, groupName)
 
-			#self.outputQueue.put(finalFile + "\n")
+			#self.write(finalFile + "\n")
 
-			self.outputQueue.put("Opened output files\n")
+			self.write("Opened output files\n")
 
-class TwisterThread(threading.Thread):
-	def __init__(self, twisterPath, path, mrcPath, skeletonPath, threshold, analysis, pdbPath, openCut, outputQueue):
-		self.openCut = openCut
-		self.twisterPath = twisterPath
-		self.path = path
-		self.pdbPath = pdbPath
-		self.mrcPath = mrcPath
-		self.skeletonPath = skeletonPath
-		self.threshold = threshold
-		self.outputQueue = outputQueue
-		self.analysis = analysis
-		threading.Thread.__init__(self)
-
-	def run(self):
-		if platform.system() == 'Windows':
-			arguments = '"' + self.pdbPath + '" "' + self.mrcPath + '" ' + str(self.threshold);
-		else:
-			arguments = '"' + self.pdbPath + '" "' + self.mrcPath + '" ' + str(self.threshold);
-		# for i in self.chains:
-		# 	arguments += " " + i
-
-		#self.outputBox.insert(Tkinter.END, "Running: " + self.cutDensityPath + "\n with arguments: " + arguments + "\n\n")
-		self.outputQueue.put("Running: " + self.twisterPath + "\n" + arguments + "\n\n")
-		#process = subprocess.Popen('exec "' + self.tracerPath + " " + arguments + '"', stdout=subprocess.PIPE, shell=True)
-		process = subprocess.Popen(self.twisterPath + " " + arguments, stdout=subprocess.PIPE, shell=True)
-		#process = subprocess.Popen([self.tracerPath, self.pdbPath, pdbID, stdout=subprocess.PIPE, shell=False)
-
-		while True:
-			line = process.stdout.readline()
-
-			if line != '':
-				self.outputQueue.put(line.rstrip() + "\n")
-				#self.outputBox.insert(Tkinter.END, line.rstrip() + "\n")
-			else:
-				break
+class TracerSweep(object):
+	"""tracer runs of one map at several thresholds"""
 
-		self.outputQueue.put("Process finished\n")
+	def __init__(self, mrcPath, tracerJobs):
+		self.mrcPath = mrcPath
+		self.jobs = tracerJobs
+		self.reported = False
+		for job in tracerJobs:
+			job.sweep = self
+
+	def isDone(self):
+		return not [job for job in self.jobs if not job.isDone()]
+
+	def summary(self):
+		import glob
+		lines = ["threshold\tstate\tseconds\tpdb files\toutput\n"]
+		for job in self.jobs:
+			outputPath = job.outputPaths()[0]
+			pdbFiles = len(glob.glob(outputPath + os.sep + '*.pdb'))
+			elapsed = job.elapsed() or 0.0
+			lines.append("%s\t%s\t%.1f\t%d\t%s\n" % (job.threshold,
+				job.state, elapsed, pdbFiles, outputPath))
+		return "".join(lines)
+
+	def report(self):
+		"""write the summary to <map>_sweep.txt and every run's output"""
+		if self.reported:
+			return
+		self.reported = True
+		summary = self.summary()
+		summaryPath = self.mrcPath + "_sweep.txt"
+		f = open(summaryPath, "w")
+		f.write(summary)
+		f.close()
+		for job in self.jobs:
+			job.write("\nThreshold sweep summary (%s):\n%s" % (summaryPath, summary))
+
+class TwisterJob(runTools.TwisterRun):
+
+	def __init__(self, mrcPath, threshold, pdbPath, openCut=False):
+		runTools.TwisterRun.__init__(self, mrcPath, threshold, pdbPath)
+		self.openCut = openCut
 
+	def finish(self):
 		if self.openCut:
 			import glob
-			import time
 
 			#1FLP_thr_0.4_outFiles
 
 			pdbID = os.path.basename(self.pdbPath)
 
 			outputPath = self.mrcPath + "twist" #"_thr_" + self.threshold + "_outFiles"
-			self.outputQueue.put("Output files written to " + outputPath +" \n")
+			self.write("Output files written to " + outputPath +" \n")
 
 			openModelsBefore = list(chimera.openModels.list())
 
 			#4ZQQsht37_trans_2_orient_10.pdb
 			for file in glob.glob(outputPath + os.sep + pdbID + '*[0-9].pdb'): #_trans_[0-9]_orient
 				if not "CAchain" in file:
-					self.outputQueue.put("Opening: " + file + "\n")
+					self.write("Opening: " + file + "\n")
 					chimera.openModels.open(file)
-					time.sleep(0.5)
 
 			#1FLP_SHTestimate_final.mrc
 
@@ -2019,13 +2102,10 @@ class TwisterThread(threading.Thread):
 			outputModels = set(openModelsNow) - set(openModelsBefore)
 
 			groupName = pdbID + "sht_thr_" + self.threshold
-			ModelPanel.groupCmd(outputModels, groupName)
+			groupCmd(outputModels, groupName)
 
-			#self.outputQueue.put(finalFile + "\n")
+			#self.write(finalFile + "\n")
 
-			self.outputQueue.put("Opened output files\n")
-						
-		
-			
-			
-#dialogs.register(SSETracerDialog.name, SSETracerDialog)
\ No newline at end of file
+			self.write("Opened output files\n")
+
+#dialogs.register(SSETracerDialog.name, SSETracerDialog)
@@ -0,0 +1,154 @@
+"""run AxisComparison (leastsquare) over a whole dataset without Chimera
+
+usage: python batchCompare.py [-j WORKERS] DATASET_ROOT JOB_FILE
+
+Each non-blank line of JOB_FILE describes one job:
+
+	reference.pdb [firstHelix [firstStrand [output.txt]]]
+
+separated by tabs or spaces, with paths relative to DATASET_ROOT.  Use
+'-' (or 'Empty') for an optional field that should be left blank; lines
+starting with '#' are ignored.  Jobs are spread over a pool of worker
+processes, each in its own run folder under output_runs next to its
+reference PDB, and a tab-separated summary (exit status and seconds per
+job) is printed when they have all finished.
+"""
+
+import os
+import sys
+import time
+import subprocess
+import multiprocessing
+import tools
+
+class BatchJob(object):
+	"""One leastsquare invocation; paths are absolute"""
+
+	def __init__(self, pdbPath, helixPath="", strandPath="", outPath=""):
+		self.pdbPath = pdbPath
+		self.helixPath = helixPath
+		self.strandPath = strandPath
+		self.outPath = outPath
+
+	def args(self, runDir):
+		return tools.comparisonArgs(tools.runReference(runDir, self.pdbPath),
+				self.helixPath, self.strandPath, self.outPath)
+
+def readJobs(datasetRoot, jobFile):
+	"""Return the list of BatchJobs described in 'jobFile'"""
+	jobs = []
+	f = open(jobFile, "rU")
+	for lineNum, line in enumerate(f):
+		fields = line.split()
+		if not fields or fields[0].startswith("#"):
+			continue
+		if len(fields) > 4:
+			f.close()
+			raise ValueError("%s line %d: expected at most 4 fields,"
+				" got %d" % (jobFile, lineNum+1, len(fields)))
+		paths = []
+		for field in fields:
+			if field in ("-", tools.EMPTY):
+				paths.append("")
+			else:
+				paths.append(os.path.join(datasetRoot, field))
+		jobs.append(BatchJob(*paths))
+	f.close()
+	return jobs
+
+def runJob(job):
+	"""Run one job in the current process and return its result dict.
+
+	   The result has the keys 'pdb', 'returncode', 'elapsed' (seconds),
+	   'outputDir' and 'log' (the captured leastsquare output).  The
+	   job runs in a new run folder under the reference's output_runs,
+	   which becomes the 'latest' run if leastsquare succeeds.
+	"""
+	start = time.time()
+	runDir = tools.newComparisonRun(job.pdbPath)
+	outDir = tools.comparisonOutputDir(tools.runReference(runDir, job.pdbPath))
+	logPath = os.path.join(outDir, "leastsquare.log")
+	log = open(logPath, "w")
+	try:
+		process = subprocess.Popen(job.args(runDir), stdout=log,
+			stderr=subprocess.STDOUT, cwd=runDir)
+		returncode = process.wait()
+	except OSError, e:
+		log.write("Could not run %s: %s\n"
+				% (tools.binaryPath(tools.LEASTSQUARE), e))
+		returncode = None
+	log.close()
+	if returncode == 0:
+		tools.setLatestRun(runDir)
+	return {
+		'pdb': job.pdbPath,
+		'returncode': returncode,
+		'elapsed': time.time() - start,
+		'outputDir': outDir,
+		'log': logPath,
+	}
+
+def runBatch(jobs, processes=None, callback=None):
+	"""Run 'jobs' over a pool of 'processes' workers.
+
+	   'processes' defaults to the number of CPUs.  'callback', if
+	   given, is called with each result dict as soon as that job is
+	   done.  Returns the result dicts in the same order as 'jobs'.
+	"""
+	pool = multiprocessing.Pool(processes)
+	try:
+		results = [None] * len(jobs)
+		for index, result in pool.imap_unordered(_runIndexed,
+							enumerate(jobs)):
+			results[index] = result
+			if callback:
+				callback(result)
+	finally:
+		pool.close()
+		pool.join()
+	return results
+
+def _runIndexed(indexedJob):
+	index, job = indexedJob
+	return index, runJob(job)
+
+def formatResult(result):
+	if result['returncode'] is None:
+		status = "failed"
+	else:
+		status = str(result['returncode'])
+	return "%s\t%s\t%.1f\t%s" % (result['pdb'], status,
+					result['elapsed'], result['outputDir'])
+
+def main(argv):
+	import getopt
+	try:
+		opts, args = getopt.getopt(argv[1:], "j:")
+	except getopt.GetoptError, e:
+		print >> sys.stderr, e
+		print >> sys.stderr, __doc__
+		return 2
+	if len(args) != 2:
+		print >> sys.stderr, __doc__
+		return 2
+	processes = None
+	for opt, val in opts:
+		if opt == "-j":
+			processes = int(val)
+	datasetRoot, jobFile = args
+	jobs = readJobs(datasetRoot, jobFile)
+	start = time.time()
+	def report(result):
+		print >> sys.stderr, "done: " + formatResult(result)
+	results = runBatch(jobs, processes, report)
+	print "pdb\tstatus\tseconds\toutput"
+	for result in results:
+		print formatResult(result)
+	print >> sys.stderr, "%d jobs in %.1f seconds" % (len(results),
+						time.time() - start)
+	if [r for r in results if r['returncode'] != 0]:
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -31,11 +31,23 @@ class ConfDialog(ModelessDialog):
 		self.prefs = preferences.addCategory("Model Panel",
 						preferences.HiddenCategory,
 						optDict=options)
-		ModelessDialog.__init__(self)
-	
+		# the notebook is only built when the dialog is first shown;
+		# until then the preferences stand in for its widgets
+		self.uiBuilt = False
+
+	def Close(self):
+		if self.uiBuilt:
+			ModelessDialog.Close(self)
+
+	def showColor(self):
+		"""whether model colors go behind model names"""
+		if self.uiBuilt:
+			return self.showColorVar.get()
+		return self.prefs['showColor']
+
 	def dblClick(self):
 		"""execute double-click-related commands"""
-		for cmd in self.dblCommandsList.get(None):
+		for cmd in self.prefs['executionList']:
 			cb, minModels, maxModels, moleculesOnly \
 							= _buttonInfo[cmd][0:4]
 			sel = self.modelPanel.selected(
@@ -45,12 +57,15 @@ class ConfDialog(ModelessDialog):
 			cb(sel)
 
 	def enter(self):
+		if not self.uiBuilt:
+			ModelessDialog.__init__(self)
 		if self.computePageSize:
 			self.noteBook.setnaturalsize()
 			self.computePageSize = False
 		ModelessDialog.enter(self)
 
 	def fillInUI(self, parent):
+		self.uiBuilt = True
 		self.computePageSize = True
 		self.buttonInfo = {}
 		self.columnInfo = {}
@@ -108,8 +123,17 @@ class ConfDialog(ModelessDialog):
 		self.dblCommandMenu.grid(row=0, column=1, sticky='nsew')
 		help.register(self.dblCommandMenu,
 			balloon='click on function to add to execution list')
+
+		# buttons and columns added before now
+		for name in _buttonInfo.keys():
+			self.newButton(name)
+		for name, shown in zip(_columnNames,
+					self.modelPanel.shownColumns):
+			self.newColumn(name, shown)
 	
 	def newButton(self, butName, balloon=None, defaultFavorite=True):
+		if not self.uiBuilt:
+			return
 		self.computePageSize = True
 
 		"""
@@ -162,6 +186,8 @@ class ConfDialog(ModelessDialog):
 				self.dblCommandMenu.setlist(cmds)
 
 	def newColumn(self, colName, shown):
+		if not self.uiBuilt:
+			return
 		self.computePageSize = True
 
 		for cn in self.columnInfo.keys():
@@ -212,6 +238,9 @@ class ConfDialog(ModelessDialog):
 		self.prefs[pref] = copyDict
 
 	def showColumn(self, colName, doShow):
+		if not self.uiBuilt:
+			ModelessDialog.__init__(self)
+			self.Close()
 		var = self.columnInfo[colName]['variable']
 		if var.get() != doShow:
 			var.set(doShow)
@@ -0,0 +1,103 @@
+"""report how long importing modules takes, and what the time goes on
+
+usage: python importTimes.py [-n COUNT] [-c STATEMENT] MODULE...
+
+Imports each MODULE in turn and prints, for every module loaded along
+the way, the time spent loading it including what it imported
+(cumulative) and excluding that (self), slowest first.  STATEMENT, if
+given, is run and timed afterwards, e.g. to time opening a dialog
+('chimera' can be used in it without importing it).
+
+Chimera's own modules can only be imported inside Chimera, so to see
+what loading this extension costs there, start Chimera without opening
+the panel and in its Python shell (IDLE), with this folder on sys.path,
+run
+
+	import importTimes
+	importTimes.main(["", "-c", "chimera.dialogs.display('SSETracer')",
+								"base"])
+
+The modules Chimera has already loaded cost nothing and are left out,
+so what is listed is what the extension adds.
+"""
+
+import __builtin__
+import sys
+import time
+
+def profile(modules, statement=None):
+	"""Import 'modules' (names) and run 'statement', and return
+	   ([(cumulative, self, module name), ...], total import seconds,
+	   statement seconds or None)
+	"""
+	realImport = __builtin__.__import__
+	times = {}
+	# time taken by the imports made within each import in progress
+	nested = [0.0]
+
+	def timedImport(name, *args, **kw):
+		loaded = len(sys.modules)
+		nested.append(0.0)
+		start = time.time()
+		try:
+			return realImport(name, *args, **kw)
+		finally:
+			elapsed = time.time() - start
+			inner = nested.pop()
+			nested[-1] += elapsed
+			if len(sys.modules) != loaded:
+				entry = times.setdefault(name, [0.0, 0.0])
+				entry[0] += elapsed
+				entry[1] += elapsed - inner
+
+	__builtin__.__import__ = timedImport
+	start = time.time()
+	try:
+		for module in modules:
+			__import__(module)
+	finally:
+		__builtin__.__import__ = realImport
+	total = time.time() - start
+	elapsed = None
+	if statement:
+		start = time.time()
+		namespace = {}
+		if 'chimera' in sys.modules:
+			namespace['chimera'] = sys.modules['chimera']
+		exec statement in namespace
+		elapsed = time.time() - start
+	report = [(cumulative, own, name)
+			for name, (cumulative, own) in times.items()]
+	report.sort()
+	report.reverse()
+	return report, total, elapsed
+
+def main(argv):
+	import getopt
+	try:
+		opts, args = getopt.getopt(argv[1:], "n:c:")
+	except getopt.GetoptError, e:
+		print >> sys.stderr, e
+		print >> sys.stderr, __doc__
+		return 2
+	if not args:
+		print >> sys.stderr, __doc__
+		return 2
+	count = 25
+	statement = None
+	for opt, val in opts:
+		if opt == "-n":
+			count = int(val)
+		elif opt == "-c":
+			statement = val
+	report, total, elapsed = profile(args, statement)
+	print "cumulative ms\tself ms\tmodule"
+	for cumulative, own, name in report[:count]:
+		print "%.1f\t%.1f\t%s" % (cumulative * 1000, own * 1000, name)
+	print "importing %s took %.1f ms" % (" ".join(args), total * 1000)
+	if elapsed is not None:
+		print "%s took %.1f ms" % (statement, elapsed * 1000)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -0,0 +1,313 @@
+"""dialog listing the running, queued and finished tool jobs"""
+
+import chimera
+from chimera.baseDialog import ModelessDialog
+from chimera import help, replyobj
+import Pmw
+import Tkinter
+import tools
+
+class JobDialog(ModelessDialog):
+	title = 'SSETracer Jobs'
+	buttons = ('Stop', 'Clear Finished', 'Close')
+
+	# how often (ms) the table is refreshed while shown
+	refreshInterval = 500
+
+	# characters in a job's progress bar
+	barWidth = 10
+
+	toolLabels = [
+		(tools.TRACER, "SSETracer"),
+		(tools.TWISTER, "Strand Twister"),
+		(tools.LEASTSQUARE, "Axis Comparison"),
+	]
+
+	def __init__(self, modelPanel):
+		self.modelPanel = modelPanel
+		self._refreshing = False
+		ModelessDialog.__init__(self)
+
+	def fillInUI(self, parent):
+		self.parent = parent
+		scheduler = self.modelPanel.scheduler
+
+		limitGroup = Pmw.Group(parent, tag_text="Concurrent runs")
+		limitGroup.grid(row=0, column=0, sticky='ew')
+		self.limitCounters = {}
+		for col, (tool, label) in enumerate(self.toolLabels):
+			counter = Pmw.Counter(limitGroup.interior(),
+				labelpos='w', label_text=label + ":",
+				entry_width=3, datatype='integer',
+				entryfield_value=scheduler.limit(tool),
+				entryfield_validate={'validator': 'integer',
+								'min': 1},
+				entryfield_modifiedcommand=lambda t=tool:
+							self._limitChange(t))
+			counter.grid(row=0, column=col, padx=5)
+			self.limitCounters[tool] = counter
+		help.register(limitGroup, balloon="maximum number of runs of"
+			" each tool at once;\nfurther runs wait in the queue")
+
+		timeoutGroup = Pmw.Group(parent, tag_text="Timeout (minutes)")
+		timeoutGroup.grid(row=1, column=0, sticky='ew')
+		self.timeoutFields = {}
+		for col, (tool, label) in enumerate(self.toolLabels):
+			timeout = scheduler.timeout(tool)
+			if timeout is None:
+				value = ""
+			else:
+				value = "%g" % (timeout / 60.0)
+			field = Pmw.EntryField(timeoutGroup.interior(),
+				labelpos='w', label_text=label + ":",
+				entry_width=5, value=value,
+				validate={'validator': 'real', 'min': 0},
+				modifiedcommand=lambda t=tool:
+							self._timeoutChange(t))
+			field.grid(row=0, column=col, padx=5)
+			self.timeoutFields[tool] = field
+		help.register(timeoutGroup, balloon="runs still going after this"
+			" long are stopped;\nleave blank for no limit")
+
+		self.cacheField = Pmw.EntryField(parent, labelpos='w',
+			label_text="Result cache size (GB):", entry_width=5,
+			value="%g" % self.modelPanel.jobPrefs['cacheSize'],
+			validate={'validator': 'real', 'min': 0},
+			modifiedcommand=self._cacheChange)
+		self.cacheField.grid(row=2, column=0, sticky='w')
+		help.register(self.cacheField, balloon="runs repeated with the same"
+			" inputs and settings are\nrestored from the cache instead"
+			" of rerun;\n0 turns the cache off")
+
+		self.memoryField = Pmw.EntryField(parent, labelpos='w',
+			label_text="Memory budget (GB):", entry_width=5,
+			value="%g" % self.modelPanel.jobPrefs['memoryBudget'],
+			validate={'validator': 'real', 'min': 0},
+			modifiedcommand=self._memoryChange)
+		self.memoryField.grid(row=2, column=0, sticky='e')
+		help.register(self.memoryField, balloon="runs wait until their"
+			" expected memory use fits in this;\n0 uses most of the"
+			" physical memory")
+
+		self.workersField = Pmw.EntryField(parent, labelpos='w',
+			label_text="Workers:", entry_width=40,
+			value=" ".join(self.modelPanel.jobPrefs['workers']),
+			command=self._workersChange)
+		self.workersField.grid(row=3, column=0, sticky='w')
+		help.register(self.workersField, balloon="host:port of worker"
+			" daemons (python worker.py) to run jobs on,\nseparated by"
+			" spaces; press Return to apply")
+
+		engines = {"": "automatic", tools.LEASTSQUARE: "leastsquare",
+						tools.NUMPY: "NumPy"}
+		self.engineMenu = Pmw.OptionMenu(parent, labelpos='w',
+			label_text="Compare axes with:",
+			items=[engines[e] for e in ("", tools.LEASTSQUARE, tools.NUMPY)],
+			initialitem=engines[self.modelPanel.jobPrefs['comparisonEngine']],
+			command=self._engineChange)
+		self.engineMenu.grid(row=3, column=0, sticky='e')
+		help.register(self.engineMenu, balloon="the leastsquare binary or"
+			" the built-in NumPy comparison;\nautomatic uses leastsquare"
+			" where it is installed")
+		self._engines = dict([(label, e) for e, label in engines.items()])
+
+		self.gateField = Pmw.EntryField(parent, labelpos='w',
+			label_text="Match axes within:", entry_width=30,
+			value=self.modelPanel.jobPrefs['comparisonGate'],
+			command=self._gateChange)
+		self.gateField.grid(row=4, column=0, sticky='w')
+		help.register(self.gateField, balloon="NumPy comparisons only match"
+			" axes that pass this gate,\ne.g. distance=8 overlap=2"
+			" angle=30; press Return to apply")
+
+		self.curvesVar = Tkinter.IntVar()
+		self.curvesVar.set(self.modelPanel.jobPrefs['comparisonCurves'])
+		curvesButton = Tkinter.Checkbutton(parent, text="Fit strands as"
+			" curves", variable=self.curvesVar, command=self._curvesChange)
+		curvesButton.grid(row=4, column=0, sticky='e')
+		help.register(curvesButton, balloon="NumPy comparisons also fit"
+			" smooth curves to the strands\nand report how far apart"
+			" those are")
+
+		self.resamplesField = Pmw.EntryField(parent, labelpos='w',
+			label_text="Bootstrap resamples:", entry_width=5,
+			value=str(self.modelPanel.jobPrefs['comparisonResamples']),
+			validate={'validator': 'numeric', 'min': 0},
+			modifiedcommand=self._resamplesChange)
+		self.resamplesField.grid(row=5, column=0, sticky='w')
+		help.register(self.resamplesField, balloon="NumPy comparisons add"
+			" 95% confidence intervals of the errors,\nfrom this many"
+			" resamples of the traced points; 0 for none")
+
+		self.keepField = Pmw.EntryField(parent, labelpos='w',
+			label_text="Keep comparison runs:", entry_width=5,
+			value=str(self.modelPanel.jobPrefs['keepRuns']),
+			validate={'validator': 'numeric', 'min': 0},
+			modifiedcommand=self._keepChange)
+		self.keepField.grid(row=5, column=0, sticky='e')
+		help.register(self.keepField, balloon="after each comparison, delete"
+			" all but this many of the newest\nrun folders of its reference,"
+			" other than those still in use\nor in the run history;"
+			" 0 keeps them all")
+
+		self.jobList = Pmw.ScrolledListBox(parent, labelpos='nw',
+			label_text="ID  Tool  Name  State  Time  Memory  Progress  ETA  Stage",
+			listbox_font="Courier", listbox_width=120,
+			listbox_height=12,
+			listbox_selectmode='extended',
+			selectioncommand=self._selectJob)
+		self.jobList.grid(row=6, column=0, sticky='nsew')
+		help.register(self.jobList, balloon="click a job to show its"
+			" output in the SSETracer output box")
+		parent.rowconfigure(6, weight=1)
+		parent.columnconfigure(0, weight=1)
+
+	def enter(self):
+		ModelessDialog.enter(self)
+		if not self._refreshing:
+			self._refresh()
+
+	def Stop(self):
+		for index in self.jobList.curselection():
+			self.modelPanel.scheduler.cancel(
+				self.shownJobs[int(index)], "stopped by user")
+
+	def ClearFinished(self):
+		self.modelPanel.scheduler.clearFinished()
+		self._fill()
+
+	def _fill(self):
+		self.shownJobs = self.modelPanel.scheduler.jobs()
+		rows = []
+		for job in self.shownJobs:
+			elapsed = job.elapsed()
+			if elapsed is None:
+				elapsed = ""
+			else:
+				elapsed = "%d:%02d" % divmod(int(elapsed), 60)
+			if job.rss:
+				memory = "%.1fG" % (job.rss / 1024.0**3)
+			else:
+				memory = ""
+			rows.append("%3d  %-24s  %-22s  %-9s  %5s  %6s  %s" % (job.id,
+				job.tool, job.name[:22], job.state, elapsed, memory,
+				self._progress(job)))
+		selected = self.jobList.curselection()
+		self.jobList.setlist(rows)
+		for index in selected:
+			self.jobList.selection_set(index)
+
+	def _progress(self, job):
+		#text progress bar, time left and current stage
+		tracker = job.progress
+		if tracker is None:
+			return ""
+		fraction = tracker.fraction()
+		if fraction is None:
+			bar = "[%s]" % ("?" * self.barWidth)
+		else:
+			done = int(round(fraction * self.barWidth))
+			bar = "[%s%s] %3d%%" % ("#" * done,
+				"-" * (self.barWidth - done), 100 * fraction)
+		eta = None
+		if not job.isDone():
+			eta = tracker.eta()
+		if eta is None:
+			eta = ""
+		else:
+			eta = "%d:%02d" % divmod(int(eta), 60)
+		return "%-17s  %5s  %s" % (bar, eta, tracker.stage() or "")
+
+	def _cacheChange(self):
+		if not self.cacheField.valid():
+			return
+		size = float(self.cacheField.get())
+		self.modelPanel.setCacheSize(size)
+		self.modelPanel.jobPrefs['cacheSize'] = size
+
+	def _memoryChange(self):
+		if not self.memoryField.valid():
+			return
+		budget = float(self.memoryField.get())
+		self.modelPanel.setMemoryBudget(budget)
+		self.modelPanel.jobPrefs['memoryBudget'] = budget
+
+	def _engineChange(self, label):
+		self.modelPanel.jobPrefs['comparisonEngine'] = self._engines[label]
+
+	def _gateChange(self):
+		gate = self.gateField.get().strip()
+		try:
+			tools.parseGate(gate)
+		except ValueError, e:
+			replyobj.error("Bad matching gate: %s\n" % e)
+			return
+		self.modelPanel.jobPrefs['comparisonGate'] = gate
+
+	def _resamplesChange(self):
+		if not self.resamplesField.valid() or not self.resamplesField.get():
+			return
+		self.modelPanel.jobPrefs['comparisonResamples'] = int(
+						self.resamplesField.get())
+
+	def _keepChange(self):
+		if not self.keepField.valid() or not self.keepField.get():
+			return
+		self.modelPanel.jobPrefs['keepRuns'] = int(self.keepField.get())
+
+	def _curvesChange(self):
+		self.modelPanel.jobPrefs['comparisonCurves'] = bool(self.curvesVar.get())
+
+	def _workersChange(self):
+		addresses = self.workersField.get().split()
+		for address in addresses:
+			host, sep, port = address.rpartition(":")
+			if not host or not port.isdigit():
+				replyobj.error("Workers are given as host:port,"
+					" not %s\n" % address)
+				return
+		self.modelPanel.setWorkers(addresses)
+		self.modelPanel.jobPrefs['workers'] = addresses
+
+	def _limitChange(self, tool):
+		counter = self.limitCounters[tool]
+		if not counter.valid():
+			return
+		limit = int(counter.get())
+		self.modelPanel.scheduler.setLimit(tool, limit)
+		prefs = self.modelPanel.jobPrefs
+		limits = prefs['limits'].copy()
+		limits[tool] = limit
+		prefs['limits'] = limits
+
+	def _timeoutChange(self, tool):
+		field = self.timeoutFields[tool]
+		value = field.get().strip()
+		if not value:
+			timeout = None
+		elif not field.valid():
+			return
+		else:
+			timeout = float(value) * 60 or None
+		self.modelPanel.scheduler.setTimeout(tool, timeout)
+		prefs = self.modelPanel.jobPrefs
+		timeouts = prefs['timeouts'].copy()
+		if timeout is None:
+			timeouts.pop(tool, None)
+		else:
+			timeouts[tool] = timeout
+		prefs['timeouts'] = timeouts
+
+	def _refresh(self):
+		if self.uiMaster().winfo_toplevel().state() == 'withdrawn':
+			self._refreshing = False
+			return
+		self._refreshing = True
+		self._fill()
+		self.parent.after(self.refreshInterval, self._refresh)
+
+	def _selectJob(self):
+		selected = self.jobList.curselection()
+		if not selected:
+			return
+		self.modelPanel.showJob(self.shownJobs[int(selected[0])])
@@ -0,0 +1,205 @@
+"""record of every tool run in a local SQLite database
+
+Each job is written once it is done: its protein, tool, settings,
+timings, exit status and where its output and log went (logs are kept
+for as long as outputLog.pruneLogs() allows).  Runs with the
+same tool, settings and inputs share a run key (inputs are compared by
+size and modification time), so whether a run has been done before is
+one indexed lookup.
+
+Run as a script to list past runs:
+
+	python jobHistory.py [-p PROTEIN] [-t TOOL] [-n COUNT]
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+	id INTEGER PRIMARY KEY,
+	run_key TEXT NOT NULL,
+	protein TEXT,
+	tool TEXT,
+	name TEXT,
+	threshold TEXT,
+	parameters TEXT,
+	state TEXT,
+	returncode INTEGER,
+	submitted REAL,
+	started REAL,
+	ended REAL,
+	seconds REAL,
+	peak_rss INTEGER,
+	outputs TEXT,
+	log TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_key ON runs (run_key, ended);
+CREATE INDEX IF NOT EXISTS runs_protein ON runs (protein, tool);
+CREATE INDEX IF NOT EXISTS runs_tool ON runs (tool, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+"""
+
+COLUMNS = ("id", "run_key", "protein", "tool", "name", "threshold",
+	"parameters", "state", "returncode", "submitted", "started", "ended",
+	"seconds", "peak_rss", "outputs", "log")
+
+def defaultPath():
+	return os.path.join(os.path.expanduser("~"), ".SSETracer",
+							"history.sqlite")
+
+def runKey(job):
+	"""Return the key shared by runs of the same tool with the same
+	   settings on the same inputs
+	"""
+	sha = hashlib.sha1()
+	sha.update(json.dumps([job.tool, job.metadata()], sort_keys=True))
+	for path in sorted(job.cacheInputs() or []):
+		sha.update("\0" + path)
+		try:
+			st = os.stat(path)
+		except OSError:
+			sha.update("\0missing")
+		else:
+			sha.update("\0%d\0%r" % (st.st_size, st.st_mtime))
+	return sha.hexdigest()
+
+class JobHistory(object):
+	"""The run database in 'path'"""
+
+	def __init__(self, path=None):
+		if path is None:
+			path = defaultPath()
+		self.path = path
+		folder = os.path.dirname(path)
+		if folder and not os.path.isdir(folder):
+			os.makedirs(folder)
+		# jobs finish in the scheduler's threads
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._lock = threading.Lock()
+		self._db.executescript(SCHEMA)
+
+	def attach(self, scheduler):
+		"""Record every job 'scheduler' runs"""
+		scheduler.addStateHandler(self._jobStateChange)
+
+	def _jobStateChange(self, job):
+		if job.isDone():
+			try:
+				self.record(job)
+			except (sqlite3.Error, OSError), e:
+				job.write("Could not record the run in %s: %s\n"
+							% (self.path, e))
+
+	def record(self, job):
+		"""Add the done 'job' to the database"""
+		metadata = dict(job.metadata())
+		protein = metadata.pop('protein', None)
+		threshold = metadata.pop('threshold', None)
+		if threshold is not None:
+			threshold = str(threshold)
+		self._execute("INSERT INTO runs (run_key, protein, tool, name,"
+			" threshold, parameters, state, returncode, submitted,"
+			" started, ended, seconds, peak_rss, outputs, log)"
+			" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+			(runKey(job), protein, job.tool, job.name, threshold,
+			json.dumps(metadata, sort_keys=True), job.state,
+			job.returncode, job.submitted, job.started, job.ended,
+			job.elapsed(), job.peakRss or None,
+			json.dumps(job.outputPaths()), job.log.path))
+
+	def find(self, protein=None, tool=None, key=None, state=None,
+								limit=None):
+		"""Return matching runs, newest first, as dicts keyed by column
+		   ('parameters' and 'outputs' decoded, 'log' None once the log
+		   has been pruned)
+		"""
+		clauses = []
+		values = []
+		for column, value in (("protein", protein), ("tool", tool),
+					("run_key", key), ("state", state)):
+			if value is not None:
+				clauses.append(column + " = ?")
+				values.append(value)
+		sql = "SELECT %s FROM runs" % ", ".join(COLUMNS)
+		if clauses:
+			sql += " WHERE " + " AND ".join(clauses)
+		sql += " ORDER BY ended DESC"
+		if limit:
+			sql += " LIMIT %d" % limit
+		runs = []
+		for row in self._execute(sql, values):
+			run = dict(zip(COLUMNS, row))
+			run['parameters'] = json.loads(run['parameters'] or "{}")
+			run['outputs'] = json.loads(run['outputs'] or "[]")
+			if run['log'] and not os.path.isfile(run['log']):
+				run['log'] = None
+			runs.append(run)
+		return runs
+
+	def lastRun(self, job):
+		"""Return the newest finished run identical to 'job' whose
+		   outputs are all still there, or None
+		"""
+		import jobs
+		for run in self.find(key=runKey(job), state=jobs.FINISHED):
+			if not [path for path in run['outputs']
+						if not os.path.exists(path)]:
+				return run
+		return None
+
+	def outputPaths(self):
+		"""Return the set of every output path a recorded run names"""
+		paths = set()
+		for (outputs,) in self._execute("SELECT outputs FROM runs"):
+			paths.update(json.loads(outputs or "[]"))
+		return paths
+
+	def _execute(self, sql, values=()):
+		self._lock.acquire()
+		try:
+			cursor = self._db.execute(sql, values)
+			rows = cursor.fetchall()
+			self._db.commit()
+			return rows
+		finally:
+			self._lock.release()
+
+	def close(self):
+		self._db.close()
+
+def main(argv):
+	import getopt
+	try:
+		opts, args = getopt.getopt(argv[1:], "p:t:n:")
+	except getopt.GetoptError, e:
+		print >> sys.stderr, e
+		print >> sys.stderr, __doc__
+		return 2
+	query = {'limit': 20}
+	for opt, val in opts:
+		if opt == "-p":
+			query['protein'] = val
+		elif opt == "-t":
+			query['tool'] = val
+		elif opt == "-n":
+			query['limit'] = int(val)
+	history = JobHistory()
+	print "ended\tprotein\ttool\tthreshold\tstate\tseconds\toutputs"
+	for run in history.find(**query):
+		ended = ""
+		if run['ended']:
+			ended = time.strftime("%Y-%m-%d %H:%M:%S",
+						time.localtime(run['ended']))
+		print "%s\t%s\t%s\t%s\t%s\t%.1f\t%s" % (ended, run['protein'],
+			run['tool'], run['threshold'] or "", run['state'],
+			run['seconds'] or 0.0, " ".join(run['outputs']))
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
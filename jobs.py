@@ -0,0 +1,654 @@
+"""queue external tool runs and execute them with a concurrency limit
+per tool
+
+Nothing in here imports chimera; the model panel wraps the tracer,
+twister and leastsquare runs in Job subclasses and hands them to a
+JobScheduler.
+"""
+
+import itertools
+import os
+import Queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import traceback
+from outputLog import OutputLog
+from progress import ProgressTracker, newParser
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# seconds a cancelled process group gets to exit before it is killed
+KILL_GRACE = 2.0
+
+def killProcessGroup(process, force=False):
+	"""Stop 'process' and everything it started.
+
+	   Jobs run in their own process group (a new process group on
+	   Windows), so this also reaches the tool under the intermediate
+	   shell.  'force' sends SIGKILL instead of SIGTERM; on Windows the
+	   whole tree is always terminated.
+	"""
+	if hasattr(process, 'cancel'):
+		# runs elsewhere; see worker.RemoteProcess
+		process.cancel(force)
+		return
+	if os.name == 'nt':
+		subprocess.call(["taskkill", "/F", "/T", "/PID", str(process.pid)],
+			stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		return
+	if force:
+		sig = signal.SIGKILL
+	else:
+		sig = signal.SIGTERM
+	try:
+		os.killpg(process.pid, sig)
+	except OSError:
+		# group already gone
+		pass
+
+def removePaths(paths):
+	"""Delete the files and folders in 'paths' that exist"""
+	for path in paths:
+		if os.path.isdir(path):
+			shutil.rmtree(path, ignore_errors=True)
+		elif os.path.exists(path):
+			os.remove(path)
+
+class Job(object):
+	"""One run of an external tool.
+
+	   Subclasses set 'tool' (the name concurrency limits are kept
+	   under) and implement command(), which returns the shell command
+	   to run.  The scheduler starts the process and feeds its stdout
+	   and stderr to write(); jobs that do their work in Python instead
+	   return None from command() and implement run(), which is called
+	   in a worker thread and returns an exit status (None or 0 for
+	   success).  Output is kept per job in 'outputQueue' until the
+	   owner moves it to 'log', an OutputLog, with readOutput().  Work
+	   that has to happen on the owner's thread once the job is done,
+	   such as opening its results in Chimera, goes in finish().
+
+	   A job can be cancelled (or time out after 'timeout' seconds) while
+	   queued or running; the files and folders listed by outputPaths()
+	   are then deleted, since they only hold partial results.  Jobs
+	   that list their inputs in cacheInputs() are looked up in the
+	   scheduler's ResultCache, if it has one, and skipped on a hit.
+	   Jobs that name a folder in watchOutput() have each result file
+	   passed to fileComplete() as soon as the tool has written it.
+	   The tool's output also goes through progressParser(), and
+	   'progress' (a ProgressTracker) says how far along the job is.
+	   While the tool runs, 'rss' and 'peakRss' hold its memory use in
+	   bytes (where that can be measured); inputSize() is what the
+	   scheduler predicts that from.
+	"""
+
+	tool = None
+	_ids = itertools.count(1)
+
+	def __init__(self, name):
+		self.id = self._ids.next()
+		self.name = name
+		self.state = QUEUED
+		self.returncode = None
+		self.process = None
+		self.timeout = None
+		self.cancelReason = None
+		self._timer = None
+		self._cacheKey = None
+		self._capture = None
+		self._watcher = None
+		self.progress = None
+		self.rss = self.peakRss = 0
+		self.projectedRss = None
+		self._memoryWait = False
+		self.outputQueue = Queue.Queue()
+		self.log = OutputLog(prefix="job%d-" % self.id)
+		# held while output moves from the queue to the log
+		self._outputLock = threading.Lock()
+		self.submitted = self.started = self.ended = None
+		self._done = threading.Event()
+
+	def __repr__(self):
+		return "<%s %d %s (%s)>" % (self.__class__.__name__, self.id,
+							self.name, self.state)
+
+	def isDone(self):
+		return self.state in (FINISHED, FAILED, CANCELLED)
+
+	def wait(self, timeout=None):
+		"""Block until the job is done; returns whether it is"""
+		self._done.wait(timeout)
+		return self._done.isSet()
+
+	def elapsed(self):
+		"""Seconds the job has been running (or ran), None if queued"""
+		if self.started is None:
+			return None
+		if self.ended is None:
+			return time.time() - self.started
+		return self.ended - self.started
+
+	def write(self, text):
+		self.outputQueue.put(text)
+
+	def readOutput(self):
+		"""Move all queued output to 'log' and return it as one string"""
+		texts = []
+		self._outputLock.acquire()
+		try:
+			while True:
+				try:
+					texts.append(self.outputQueue.get(block=False))
+				except Queue.Empty:
+					break
+			text = "".join(texts)
+			self.log.append(text)
+		finally:
+			self._outputLock.release()
+		return text
+
+	def output(self):
+		"""Return all the output so far, both what is in the log's file
+		   and what is still queued, from any thread
+		"""
+		self._outputLock.acquire()
+		try:
+			text = ""
+			if self.log.path and os.path.isfile(self.log.path):
+				f = open(self.log.path, "rb")
+				text = f.read()
+				f.close()
+			return text + "".join(list(self.outputQueue.queue))
+		finally:
+			self._outputLock.release()
+
+	def command(self):
+		"""Return the shell command to run; called once, at start"""
+		return None
+
+	def metadata(self):
+		"""Return {name: value} of the settings the run was made with,
+		   including 'protein' and 'threshold' where they apply
+		"""
+		return {}
+
+	def inputSize(self):
+		"""Return the size in bytes of the input that the tool's
+		   memory use grows with, or None
+		"""
+		return None
+
+	def args(self):
+		"""Return the argument list that command() stands for, so the
+		   tool can be started without a shell, or None
+		"""
+		return None
+
+	def progressParser(self):
+		"""Return the parser that follows the tool's progress in its
+		   output, or None; see progress.py
+		"""
+		return newParser(self.tool)
+
+	def run(self):
+		raise NotImplementedError("%s.run" % self.__class__.__name__)
+
+	def outputPaths(self):
+		"""Return the files and folders this job writes"""
+		return []
+
+	def cacheInputs(self):
+		"""Return the files (tool binary included) the job's results
+		   depend on, or None if the results should not be cached
+		"""
+		return None
+
+	def cacheCommand(self, command):
+		"""Return the text that stands for 'command' in the cache key;
+		   jobs whose command names a scratch location that differs
+		   from run to run should leave it out
+		"""
+		return command
+
+	def watchOutput(self):
+		"""Return (folder, file name pattern) for the result files to
+		   report to fileComplete() while the tool runs, or None
+		"""
+		return None
+
+	def fileComplete(self, path):
+		"""Called in a watcher thread for each finished result file;
+		   the rest are reported, in order, once the tool has exited
+		"""
+		pass
+
+	def update(self):
+		"""Called by the owner, on its own thread, while the job runs"""
+		pass
+
+	def exited(self, returncode):
+		"""Called in the I/O thread when the tool process has exited"""
+		self.write("Process finished\n")
+
+	def finish(self):
+		"""Called by the owner, on its own thread, once the job is done"""
+		pass
+
+class JobScheduler(object):
+	"""Run submitted Jobs, at most limit(tool) of each tool at a time.
+
+	   Jobs start in submission order as slots free up; a job whose
+	   tool is at its limit does not hold up queued jobs of other
+	   tools.  Functions added with addStateHandler() are called with
+	   a job whenever it changes state, from whichever thread made the
+	   change.  Tool processes are started directly and their output
+	   is read by a single PipeMultiplexer shared by all jobs.
+
+	   Jobs submitted without their own 'timeout' get timeout(tool)
+	   seconds, if that is set.  'cache' is an optional ResultCache.
+	   Jobs with args() are started through 'launcher' (see
+	   launcher.py), if one is given and still running, or on a free
+	   worker of 'workers', a worker.WorkerPool, if one is given.
+
+	   With a 'memoryBudget' (bytes), a job is only started if its
+	   predicted peak memory fits in what the running jobs leave of the
+	   budget, or if nothing else is running.  Predictions come from
+	   'memory', a MemoryModel, which learns from every finished run.
+	"""
+
+	# seconds between samples of the running jobs' memory use
+	memoryInterval = 1.0
+
+	def __init__(self, limits=None, defaultLimit=None, timeouts=None,
+			cache=None, launcher=None, memoryBudget=None, memory=None,
+								workers=None):
+		from pipeMux import PipeMultiplexer
+		self.pipes = PipeMultiplexer(self._deliver)
+		self.limits = dict(limits or {})
+		if defaultLimit is None:
+			import multiprocessing
+			defaultLimit = multiprocessing.cpu_count()
+		self.defaultLimit = defaultLimit
+		self.timeouts = dict(timeouts or {})
+		self.cache = cache
+		self.launcher = launcher
+		self.workers = workers
+		self.memoryBudget = memoryBudget
+		self.memory = memory
+		self._sampler = None
+		self.queued = []
+		self.running = []
+		self.finished = []
+		# queued jobs cancelled but not yet done; see cancel()
+		self._dropped = []
+		self._stateHandlers = []
+		self._lock = threading.RLock()
+
+	def limit(self, tool):
+		return self.limits.get(tool, self.defaultLimit)
+
+	def setLimit(self, tool, limit):
+		if limit < 1:
+			raise ValueError("limit for %s must be at least 1" % tool)
+		self.limits[tool] = limit
+		self._fill()
+
+	def timeout(self, tool):
+		return self.timeouts.get(tool)
+
+	def setTimeout(self, tool, timeout):
+		"""Set the default timeout (seconds, None for none) for 'tool'"""
+		if timeout is None:
+			self.timeouts.pop(tool, None)
+		elif timeout <= 0:
+			raise ValueError("timeout for %s must be positive" % tool)
+		else:
+			self.timeouts[tool] = timeout
+
+	def setMemoryBudget(self, budget):
+		"""Set the memory budget (bytes, None for none)"""
+		self.memoryBudget = budget
+		self._fill()
+
+	def memoryInUse(self):
+		"""Return the bytes the running jobs use or are expected to"""
+		self._lock.acquire()
+		try:
+			return sum([max(job.rss, job.projectedRss or 0)
+						for job in self.running])
+		finally:
+			self._lock.release()
+
+	def addStateHandler(self, func):
+		self._stateHandlers.append(func)
+
+	def removeStateHandler(self, func):
+		self._stateHandlers.remove(func)
+
+	def jobs(self):
+		"""Return all known jobs: running, then queued, then finished"""
+		self._lock.acquire()
+		try:
+			return (self.running + self.queued + self._dropped
+							+ self.finished)
+		finally:
+			self._lock.release()
+
+	def active(self):
+		"""Return whether any job is queued or running"""
+		return bool(self.queued or self.running or self._dropped)
+
+	def submit(self, job):
+		job.state = QUEUED
+		job.submitted = time.time()
+		if job.timeout is None:
+			job.timeout = self.timeout(job.tool)
+		self._lock.acquire()
+		try:
+			self.queued.append(job)
+		finally:
+			self._lock.release()
+		self._notify(job)
+		self._fill()
+		return job
+
+	def cancel(self, job, reason="cancelled"):
+		"""Stop 'job'.
+
+		   A queued job is dropped; a running tool has its whole
+		   process group terminated, and killed outright if it is
+		   still around KILL_GRACE seconds later.  Jobs that run in
+		   Python only see 'cancelReason' being set.
+		"""
+		self._lock.acquire()
+		try:
+			if job.isDone() or job.cancelReason:
+				return
+			job.cancelReason = reason
+			# taken off the queue here, so _fill() cannot start it
+			queued = job in self.queued
+			if queued:
+				self.queued.remove(job)
+				self._dropped.append(job)
+		finally:
+			self._lock.release()
+		job.write("Stopping: %s\n" % reason)
+		if queued:
+			self._done(job, CANCELLED)
+		elif job.process is not None:
+			killProcessGroup(job.process)
+			timer = threading.Timer(KILL_GRACE, killProcessGroup,
+							(job.process, True))
+			timer.setDaemon(True)
+			timer.start()
+
+	def clearFinished(self):
+		self._lock.acquire()
+		try:
+			self.finished = []
+		finally:
+			self._lock.release()
+
+	def _fill(self):
+		started = []
+		self._lock.acquire()
+		try:
+			counts = {}
+			for job in self.running:
+				counts[job.tool] = counts.get(job.tool, 0) + 1
+			budget = self.memoryBudget
+			if budget is not None:
+				inUse = self.memoryInUse()
+			for job in self.queued[:]:
+				if counts.get(job.tool, 0) >= self.limit(job.tool):
+					continue
+				if budget is not None:
+					need = self._projectedRss(job)
+					if self.running and inUse + need > budget:
+						if not job._memoryWait:
+							job._memoryWait = True
+							job.write("Waiting for memory: needs about"
+								" %.1f GB, %.1f GB of %.1f GB in use\n"
+								% (need / 1024.0**3, inUse / 1024.0**3,
+								budget / 1024.0**3))
+						continue
+					inUse += need
+				counts[job.tool] = counts.get(job.tool, 0) + 1
+				self.queued.remove(job)
+				self.running.append(job)
+				job.state = RUNNING
+				job.started = time.time()
+				started.append(job)
+		finally:
+			self._lock.release()
+		for job in started:
+			self._notify(job)
+			self._start(job)
+
+	def _projectedRss(self, job):
+		if job.projectedRss is None and self.memory is not None:
+			try:
+				size = job.inputSize()
+			except OSError:
+				size = None
+			if size is not None:
+				job.projectedRss = self.memory.predict(job.tool, size)
+		return job.projectedRss or 0
+
+	def _sampleMemory(self):
+		import memoryModel
+		while True:
+			time.sleep(self.memoryInterval)
+			self._lock.acquire()
+			try:
+				running = [job for job in self.running
+					if job.process is not None
+					and job.process.pid is not None]
+			finally:
+				self._lock.release()
+			if not running:
+				continue
+			# each job leads a process group of its own
+			usage = memoryModel.groupRss([job.process.pid
+							for job in running])
+			for job in running:
+				job.rss = usage.get(job.process.pid, 0)
+				job.peakRss = max(job.peakRss, job.rss)
+			if self.memoryBudget is not None and self.queued:
+				self._fill()
+
+	def _start(self, job):
+		try:
+			command = job.command()
+			job.progress = ProgressTracker(job.progressParser(),
+								job.started)
+		except:
+			job.write(traceback.format_exc())
+			self._done(job, FAILED)
+			return
+		if job.timeout:
+			job._timer = threading.Timer(job.timeout, self.cancel, (job,
+				"timed out after %g seconds" % job.timeout))
+			job._timer.setDaemon(True)
+			job._timer.start()
+		if command is None:
+			thread = threading.Thread(target=self._run, args=(job,))
+		elif self.cache is not None and job.cacheInputs() is not None:
+			# hashing the inputs can take a while for large maps
+			thread = threading.Thread(target=self._startCached,
+							args=(job, command))
+		elif self.workers is not None:
+			# so does reaching a worker and sending it the inputs; and
+			# this may be the Tk or the output thread
+			thread = threading.Thread(target=self._launch,
+							args=(job, command))
+		else:
+			self._launch(job, command)
+			return
+		thread.setDaemon(True)
+		thread.start()
+
+	def _startCached(self, job, command):
+		try:
+			key = self.cache.key(job.cacheCommand(command),
+							job.cacheInputs())
+			stdout = self.cache.restore(key, job.outputPaths())
+		except:
+			job.write(traceback.format_exc())
+			key = stdout = None
+		if stdout is None:
+			job._cacheKey = key
+			job._capture = tempfile.TemporaryFile()
+			self._launch(job, command)
+			return
+		job.write(stdout.replace("\r\n", "\n"))
+		job.write("(restored from the result cache)\n")
+		self._exited(job, 0)
+
+	def _launch(self, job, command):
+		if job.cancelReason:
+			self._exited(job, None)
+			return
+		if self._sampler is None:
+			self._sampler = threading.Thread(target=self._sampleMemory)
+			self._sampler.setDaemon(True)
+			self._sampler.start()
+		watch = job.watchOutput()
+		if watch is not None:
+			from outputWatcher import OutputWatcher
+			folder, pattern = watch
+			job._watcher = OutputWatcher(folder, job.fileComplete,
+							pattern).start()
+		try:
+			job.process = self._popen(job, command)
+		except:
+			job.write(traceback.format_exc())
+			self._done(job, FAILED)
+			return
+		self.pipes.register(job, job.process, self._exited)
+
+	def _popen(self, job, command):
+		# a process group of its own, shell included, so that cancel()
+		# can take down everything the job started
+		if self.workers is not None:
+			process = self.workers.launch(job)
+			if process is not None:
+				return process
+		if self.launcher is not None and self.launcher.alive():
+			args = job.args()
+			if args is not None:
+				return self.launcher.launch(args, os.getcwd())
+		if os.name == 'nt':
+			return subprocess.Popen(command, shell=True,
+				stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+				creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+		return subprocess.Popen(command, shell=True,
+			stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+			preexec_fn=os.setsid)
+
+	def _deliver(self, batch):
+		for job, stream, data in batch:
+			if job._capture is not None:
+				job._capture.write(data)
+			if job.progress is not None:
+				job.progress.feed(data)
+			job.write(data.replace("\r\n", "\n"))
+
+	def _exited(self, job, returncode):
+		job.returncode = returncode
+		job.exited(returncode)
+		if job.cancelReason:
+			self._done(job, CANCELLED)
+		elif returncode:
+			self._done(job, FAILED)
+		elif job._cacheKey is not None:
+			# copying the outputs can take a while; keep it out of
+			# the I/O thread, but finish the job only once it is done
+			thread = threading.Thread(target=self._store, args=(job,))
+			thread.setDaemon(True)
+			thread.start()
+		else:
+			self._done(job, FINISHED)
+
+	def _store(self, job):
+		try:
+			self.cache.store(job._cacheKey, job.outputPaths(),
+								job._capture)
+		except:
+			job.write("Could not cache results:\n"
+						+ traceback.format_exc())
+		self._done(job, FINISHED)
+
+	def _run(self, job):
+		try:
+			job.returncode = job.run()
+		except:
+			job.write(traceback.format_exc())
+			self._done(job, FAILED)
+		else:
+			if job.cancelReason:
+				self._done(job, CANCELLED)
+			elif job.returncode:
+				self._done(job, FAILED)
+			else:
+				self._done(job, FINISHED)
+
+	def _done(self, job, state):
+		if job._timer is not None:
+			job._timer.cancel()
+		if job._capture is not None:
+			job._capture.close()
+			job._capture = None
+		if job._watcher is not None:
+			# reports whatever the watcher has not yet seen
+			try:
+				job._watcher.stop()
+			except:
+				job.write(traceback.format_exc())
+			job._watcher = None
+		if state == CANCELLED:
+			try:
+				removePaths(job.outputPaths())
+			except:
+				job.write(traceback.format_exc())
+		if state == FINISHED and job.progress is not None:
+			job.progress.complete()
+		if state == FINISHED and job.peakRss and self.memory is not None:
+			try:
+				size = job.inputSize()
+				if size is not None:
+					self.memory.record(job.tool, size, job.peakRss)
+			except (IOError, OSError):
+				job.write("Could not record memory use:\n"
+						+ traceback.format_exc())
+		job.rss = 0
+		job.state = state
+		job.ended = time.time()
+		# handlers hear about the job while it still counts as active,
+		# so active() cannot go false before they have seen it finish
+		self._notify(job)
+		self._lock.acquire()
+		try:
+			if job in self.running:
+				self.running.remove(job)
+			elif job in self._dropped:
+				self._dropped.remove(job)
+			else:
+				self.queued.remove(job)
+			self.finished.append(job)
+		finally:
+			self._lock.release()
+		job._done.set()
+		self._fill()
+
+	def _notify(self, job):
+		for func in self._stateHandlers[:]:
+			func(job)
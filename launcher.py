@@ -0,0 +1,237 @@
+"""start tool processes from a small helper process instead of Chimera
+
+Forking Chimera to run a tool copies the page tables of every map and
+model it holds, and Popen(shell=True) then execs /bin/sh before the
+tool itself.  The helper is a plain Python process started once, when
+the model panel first needs to run a tool; it reads launch requests,
+one JSON object per line, on its stdin and starts each tool directly
+from its argument list.
+Tool output comes back through a pair of named pipes per launch, which
+the caller has opened for reading before the request is sent.  Replies
+on the helper's stdout give the process id (or the reason the launch
+failed) and, later, the exit status.
+
+POSIX only; on Windows shared() returns None and jobs are started
+directly.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+_shared = None
+
+def shared():
+	"""Return the process-wide Launcher, starting it on first use,
+	   or None if this platform cannot use one
+	"""
+	global _shared
+	if os.name == 'nt' or not hasattr(os, 'mkfifo'):
+		return None
+	if _shared is None or not _shared.alive():
+		try:
+			_shared = Launcher()
+		except OSError:
+			_shared = None
+	return _shared
+
+class LaunchedProcess(object):
+	"""The parts of subprocess.Popen that the job scheduler uses, for
+	   a process started by the helper.  The process leads a process
+	   group of its own.
+	"""
+
+	def __init__(self, pid, stdout, stderr):
+		self.pid = pid
+		self.stdout = stdout
+		self.stderr = stderr
+		self.returncode = None
+		self._exited = threading.Event()
+
+	def poll(self):
+		return self.returncode
+
+	def wait(self):
+		self._exited.wait()
+		return self.returncode
+
+	def _exit(self, returncode):
+		self.returncode = returncode
+		self._exited.set()
+
+class Launcher(object):
+	"""Client end of the helper process"""
+
+	def __init__(self):
+		self._helper = subprocess.Popen([sys.executable,
+			os.path.splitext(os.path.abspath(__file__))[0] + ".py"],
+			stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+			close_fds=True)
+		self._lock = threading.Lock()
+		self._nextId = 1
+		self._pending = {}	# request id -> [Event, reply]
+		self._processes = {}	# request id -> LaunchedProcess
+		self._alive = True
+		reader = threading.Thread(target=self._readReplies)
+		reader.setDaemon(True)
+		reader.start()
+
+	def alive(self):
+		return self._alive
+
+	def launch(self, argv, cwd=None):
+		"""Start 'argv' and return a LaunchedProcess whose 'stdout' and
+		   'stderr' are open for reading.  Raises OSError if the tool
+		   cannot be started or the helper has gone.
+		"""
+		fifoDir = tempfile.mkdtemp(prefix="SSETracer-launch-")
+		stdout = stderr = None
+		try:
+			outPath = os.path.join(fifoDir, "stdout")
+			errPath = os.path.join(fifoDir, "stderr")
+			os.mkfifo(outPath)
+			os.mkfifo(errPath)
+			# open without blocking; the helper opens the other ends
+			stdout = os.fdopen(os.open(outPath,
+					os.O_RDONLY | os.O_NONBLOCK), "rb", 0)
+			stderr = os.fdopen(os.open(errPath,
+					os.O_RDONLY | os.O_NONBLOCK), "rb", 0)
+			process = self._request({'argv': argv, 'cwd': cwd,
+					'stdout': outPath, 'stderr': errPath})
+		except:
+			for pipe in (stdout, stderr):
+				if pipe is not None:
+					pipe.close()
+			raise
+		finally:
+			shutil.rmtree(fifoDir, ignore_errors=True)
+		process.stdout = stdout
+		process.stderr = stderr
+		return process
+
+	def _request(self, request):
+		waiter = [threading.Event(), None]
+		self._lock.acquire()
+		try:
+			if not self._alive:
+				raise OSError("the launcher process has exited")
+			request['id'] = requestId = self._nextId
+			self._nextId += 1
+			self._pending[requestId] = waiter
+			try:
+				self._helper.stdin.write(json.dumps(request) + "\n")
+				self._helper.stdin.flush()
+			except IOError, e:
+				self._alive = False
+				del self._pending[requestId]
+				raise OSError("the launcher process has exited: %s" % e)
+		finally:
+			self._lock.release()
+		waiter[0].wait()
+		reply = waiter[1]
+		if reply is None:
+			raise OSError("the launcher process has exited")
+		if 'error' in reply:
+			raise OSError(reply['error'])
+		return reply['process']
+
+	def _readReplies(self):
+		while True:
+			line = self._helper.stdout.readline()
+			if not line:
+				break
+			reply = json.loads(line)
+			requestId = reply['id']
+			self._lock.acquire()
+			try:
+				if 'exit' in reply:
+					process = self._processes.pop(requestId, None)
+					waiter = None
+				else:
+					waiter = self._pending.pop(requestId)
+			finally:
+				self._lock.release()
+			if waiter is None:
+				if process is not None:
+					process._exit(reply['exit'])
+				continue
+			if 'pid' in reply:
+				process = LaunchedProcess(reply['pid'], None, None)
+				self._lock.acquire()
+				self._processes[requestId] = process
+				self._lock.release()
+				reply['process'] = process
+			waiter[1] = reply
+			waiter[0].set()
+		# the helper is gone; nothing more will be heard of its children
+		self._lock.acquire()
+		try:
+			self._alive = False
+			pending = self._pending.values()
+			processes = self._processes.values()
+			self._pending.clear()
+			self._processes.clear()
+		finally:
+			self._lock.release()
+		for waiter in pending:
+			waiter[0].set()
+		for process in processes:
+			process._exit(-1)
+
+def serve(requests, replies):
+	"""Run the helper: start the tools requested on 'requests' and
+	   report on 'replies' until 'requests' is closed
+	"""
+	import fcntl
+	lock = threading.Lock()
+	def reply(message):
+		lock.acquire()
+		try:
+			replies.write(json.dumps(message) + "\n")
+			replies.flush()
+		finally:
+			lock.release()
+	def waitFor(requestId, process):
+		reply({'id': requestId, 'exit': process.wait()})
+
+	def openFile(path, flags):
+		fd = os.open(path, flags)
+		fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+		return fd
+
+	# the helper keeps no other files open, so marking its own close-
+	# on-exec spares Popen from closing every possible descriptor
+	devnull = openFile(os.devnull, os.O_RDONLY)
+	for f in (requests, replies):
+		fcntl.fcntl(f.fileno(), fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+	while True:
+		line = requests.readline()
+		if not line:
+			break
+		request = json.loads(line)
+		fds = []
+		try:
+			for key in ('stdout', 'stderr'):
+				fds.append(openFile(request[key], os.O_WRONLY))
+			process = subprocess.Popen(request['argv'],
+				cwd=request.get('cwd'), stdin=devnull,
+				stdout=fds[0], stderr=fds[1], preexec_fn=os.setsid)
+		except (OSError, ValueError), e:
+			reply({'id': request['id'], 'error': "could not run %s: %s"
+						% (request['argv'][0], e)})
+			continue
+		finally:
+			for fd in fds:
+				os.close(fd)
+		reply({'id': request['id'], 'pid': process.pid})
+		waiter = threading.Thread(target=waitFor,
+					args=(request['id'], process))
+		waiter.setDaemon(True)
+		waiter.start()
+
+if __name__ == "__main__":
+	serve(sys.stdin, sys.stdout)
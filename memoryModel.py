@@ -0,0 +1,153 @@
+"""how much memory the tool runs use, and how much they are likely to
+
+The resident set size (RSS) of a job is the sum over every process in
+its process group, read from /proc, so it is only measured on Linux.
+Each finished run adds its peak RSS and the size of its input map to a
+per-tool history, and a straight line fitted to that history predicts
+the peak of the next run.  The history is kept in a small JSON file so
+that it carries over between sessions.
+"""
+
+import json
+import os
+import threading
+
+# most runs kept per tool
+HISTORY = 50
+
+# the prediction is scaled up by this much to allow for the spread
+MARGIN = 1.2
+
+def available():
+	"""Return whether process memory can be measured here"""
+	return os.path.isdir("/proc/self")
+
+def _pageSize():
+	try:
+		return os.sysconf("SC_PAGE_SIZE")
+	except (AttributeError, ValueError, OSError):
+		return 4096
+
+def groupRss(pgids):
+	"""Return {process group id: RSS in bytes} for the groups 'pgids'"""
+	usage = dict([(pgid, 0) for pgid in pgids])
+	if not usage or not available():
+		return usage
+	pageSize = _pageSize()
+	for name in os.listdir("/proc"):
+		if not name.isdigit():
+			continue
+		try:
+			f = open("/proc/%s/stat" % name)
+			stat = f.read()
+			f.close()
+		except IOError:
+			continue
+		# the command name is in parentheses and may contain spaces
+		fields = stat[stat.rfind(")")+2:].split()
+		pgid = int(fields[2])
+		if pgid in usage:
+			usage[pgid] += int(fields[21]) * pageSize
+	return usage
+
+def selfRss():
+	"""Return the RSS of this process in bytes, or 0 if unknown"""
+	try:
+		f = open("/proc/self/statm")
+		pages = int(f.read().split()[1])
+		f.close()
+	except (IOError, ValueError, IndexError):
+		return 0
+	return pages * _pageSize()
+
+def totalMemory():
+	"""Return the physical memory in bytes, or None if unknown"""
+	try:
+		f = open("/proc/meminfo")
+		for line in f:
+			if line.startswith("MemTotal:"):
+				f.close()
+				return int(line.split()[1]) * 1024
+		f.close()
+	except (IOError, ValueError):
+		pass
+	return None
+
+def defaultBudget(fraction=0.8):
+	"""Return the memory left for tool runs when they may use
+	   'fraction' of physical memory along with this process, or None
+	   if that is unknown
+	"""
+	total = totalMemory()
+	if total is None:
+		return None
+	return max(int(total * fraction) - selfRss(), 0)
+
+def defaultPath():
+	return os.path.join(os.path.expanduser("~"), ".SSETracer",
+							"memory.json")
+
+class MemoryModel(object):
+	"""Peak memory of past runs, by tool, and predictions from it"""
+
+	def __init__(self, path=None):
+		if path is None:
+			path = defaultPath()
+		self.path = path
+		self.history = {}	# tool -> [[input bytes, peak RSS], ...]
+		self._lock = threading.Lock()
+		if os.path.isfile(path):
+			try:
+				f = open(path)
+				self.history = json.load(f)
+				f.close()
+			except (IOError, ValueError):
+				self.history = {}
+
+	def record(self, tool, inputBytes, peakRss):
+		self._lock.acquire()
+		try:
+			runs = self.history.setdefault(tool, [])
+			runs.append([inputBytes, peakRss])
+			del runs[:-HISTORY]
+			self._save()
+		finally:
+			self._lock.release()
+
+	def predict(self, tool, inputBytes):
+		"""Return the likely peak RSS of a run of 'tool' on inputs of
+		   'inputBytes', or None with no history to go on
+		"""
+		runs = self.history.get(tool)
+		if not runs:
+			return None
+		sizes = [float(size) for size, peak in runs]
+		peaks = [float(peak) for size, peak in runs]
+		n = len(runs)
+		meanSize = sum(sizes) / n
+		meanPeak = sum(peaks) / n
+		spread = sum([(s - meanSize) ** 2 for s in sizes])
+		if spread == 0:
+			# one size seen so far: scale its peak to this one
+			if meanSize and inputBytes:
+				estimate = meanPeak * inputBytes / meanSize
+			else:
+				estimate = meanPeak
+		else:
+			slope = sum([(s - meanSize) * (p - meanPeak)
+					for s, p in zip(sizes, peaks)]) / spread
+			estimate = meanPeak + max(slope, 0.0) * (inputBytes - meanSize)
+		# never below the smallest peak seen
+		return int(max(estimate, min(peaks)) * MARGIN)
+
+	def _save(self):
+		folder = os.path.dirname(self.path)
+		if folder and not os.path.isdir(folder):
+			os.makedirs(folder)
+		temp = self.path + ".%d" % os.getpid()
+		f = open(temp, "w")
+		json.dump(self.history, f)
+		f.close()
+		if os.name == 'nt' and os.path.exists(self.path):
+			os.remove(self.path)
+		os.rename(temp, self.path)
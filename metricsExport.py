@@ -0,0 +1,502 @@
+"""export the per-SSE metrics of every axis comparison as it finishes
+
+Each finished comparison appends one row per true SSE (protein, SSE,
+type, lengths, angle and distance errors, the run's timings, ...) to
+metrics.csv and to a binary columnar file, both in one folder (by
+default ~/.SSETracer/metrics).  Rows are written run by run and never
+gathered up, so sweeps of any size can be exported and aggregated
+without scraping the tools' text output.
+
+The columnar rows go to a part of their own for each process that
+writes them: an Arrow IPC stream (part-*.arrows) where pyarrow is
+installed and otherwise a folder of raw little-endian column files
+(part-*/) with a schema.json.  readColumns() loads either kind.  Both
+can be read while they are being written; a part cut short only loses
+the run being written, and the next run goes to a new part.
+
+Run as a script to summarise what has been exported:
+
+	python metricsExport.py [FOLDER]
+"""
+
+import array
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+# name and type ("text", "float" or "int") of every column, in order
+COLUMNS = (
+	("run", "text"),
+	("protein", "text"),
+	("engine", "text"),
+	("traces", "text"),
+	("sse_type", "text"),
+	("true_sse", "text"),
+	("trace_sse", "text"),
+	("matched", "int"),
+	("length_true", "float"),
+	("length_trace", "float"),
+	("angle_error", "float"),
+	("distance_error", "float"),
+	("cross_displacement", "float"),
+	("length_displacement", "float"),
+	("length_error_proportion", "float"),
+	("specificity", "float"),
+	("sensitivity", "float"),
+	("f1", "float"),
+	("started", "float"),
+	("seconds", "float"),
+)
+
+CSV_FILE = "metrics.csv"
+
+# the columns taken from an axisEngine.AxisMatch's errors
+MATCH_COLUMNS = (("length_true", "lengthTrue"),
+	("length_trace", "lengthTrace"),
+	("angle_error", "angle"), ("distance_error", "twoWayDistance"),
+	("cross_displacement", "crossDisplacement"),
+	("length_displacement", "lengthDisplacement"),
+	("length_error_proportion", "lengthErrorProportion"),
+	("specificity", "specificity"), ("sensitivity", "sensitivity"),
+	("f1", "f1"))
+
+# what leastsquare prints for each true axis it matched, and the
+# columns it gives
+LOG_MATCH = re.compile(r"^For true axis p and traced axis q: true(Helix|Sheet)"
+							r"(\S+) --> (\S+)")
+LOG_VALUES = (
+	("Length of p is ", "length_true"),
+	("Length of q is ", "length_trace"),
+	("Cross displacement is ", "cross_displacement"),
+	("Longitudinal displacement is ", "length_displacement"),
+	("Proportion of incorrect length to combined length of axes is ",
+						"length_error_proportion"),
+)
+
+# the true axes leastsquare writes to its output folder, matched or not
+TRUE_FILE = re.compile(r"^true(Helix|Sheet)(\d+)\.pdb$")
+
+def defaultPath():
+	return os.path.join(os.path.expanduser("~"), ".SSETracer", "metrics")
+
+def matchRows(matches):
+	"""Yield a row (a dict by column) for each of 'matches', the
+	   AxisMatches of a NumPy comparison
+	"""
+	for match in matches:
+		row = {'sse_type': match.true.kind.lower(),
+			'true_sse': match.true.label,
+			'matched': int(match.trace is not None)}
+		if match.true.start is not None:
+			row['length_true'] = match.true.length()
+		if match.trace is not None:
+			row['trace_sse'] = match.trace.label
+			for column, name in MATCH_COLUMNS:
+				row[column] = match.errors.get(name)
+		yield row
+
+def logRows(lines, outputDir=None):
+	"""Yield a row (a dict by column) for each true axis leastsquare
+	   reports a match for in its output 'lines', and then one for
+	   each true axis it wrote to 'outputDir' without reporting one.
+	   The angle and distance errors, which leastsquare does not
+	   print, are measured from the axes in 'outputDir' (see
+	   fileErrors()).
+	"""
+	rows = []
+	for line in lines:
+		m = LOG_MATCH.match(line)
+		if m:
+			rows.append({'sse_type': m.group(1).lower(),
+				'true_sse': m.group(2), 'trace_sse': m.group(3),
+				'matched': 1})
+			continue
+		if not rows:
+			continue
+		for prefix, column in LOG_VALUES:
+			if line.startswith(prefix):
+				try:
+					rows[-1][column] = float(line[len(prefix):])
+				except ValueError:
+					pass
+				break
+	if outputDir is None or not os.path.isdir(outputDir):
+		for row in rows:
+			yield row
+		return
+	fileErrors(rows, outputDir)
+	for row in rows:
+		yield row
+	seen = set([(row['sse_type'], row['true_sse']) for row in rows])
+	missing = []
+	for name in os.listdir(outputDir):
+		m = TRUE_FILE.match(name)
+		if m and (m.group(1).lower(), m.group(2)) not in seen:
+			missing.append((m.group(1), int(m.group(2)), name))
+	missing.sort()
+	for kind, number, name in missing:
+		row = {'sse_type': kind.lower(), 'true_sse': str(number),
+								'matched': 0}
+		length = axisLength(os.path.join(outputDir, name))
+		if length is not None:
+			row['length_true'] = length
+		yield row
+
+def fileErrors(rows, outputDir):
+	"""Set the angle and distance errors of the matched 'rows' by
+	   fitting the true and traced axes leastsquare wrote for them to
+	   'outputDir' (trueHelixN.pdb and traceHelixN.pdb for helix N, and
+	   so on) the way axisEngine fits and scores its own.  Without
+	   NumPy they are left out.
+	"""
+	try:
+		import axisEngine
+		import numpy
+	except ImportError:
+		return
+	kinds = {'helix': axisEngine.HELIX, 'sheet': axisEngine.STRAND}
+	pairs = []
+	for row in rows:
+		kind = kinds[row['sse_type']]
+		paths = [os.path.join(outputDir, "%s%s%s.pdb"
+			% (which, kind, row['true_sse'])) for which in ("true", "trace")]
+		if not os.path.isfile(paths[0]) or not os.path.isfile(paths[1]):
+			continue
+		true, trace = [axisEngine.readTraced(path, kind) for path in paths]
+		if true is not None and trace is not None:
+			pairs.append((row, true, trace))
+	if not pairs:
+		return
+	axisEngine.fitAxes([axis for row, true, trace in pairs
+						for axis in (true, trace)])
+	errors = axisEngine.pairErrors(
+		numpy.array([true.start for row, true, trace in pairs]),
+		numpy.array([true.end for row, true, trace in pairs]),
+		numpy.array([trace.start for row, true, trace in pairs]),
+		numpy.array([trace.end for row, true, trace in pairs]))
+	for i, (row, true, trace) in enumerate(pairs):
+		row['angle_error'] = float(errors['angle'][i])
+		row['distance_error'] = float(errors['twoWayDistance'][i])
+
+def axisLength(path):
+	"""Return the length of the axis in PDB file 'path' (from its first
+	   to its last atom), or None if it has fewer than two
+	"""
+	points = []
+	f = open(path)
+	for line in f:
+		if line.startswith(("ATOM", "HETATM")):
+			try:
+				points.append([float(line[i:i+8]) for i in (30, 38, 46)])
+			except ValueError:
+				pass
+	f.close()
+	if len(points) < 2:
+		return None
+	return sum([(a - b) ** 2 for a, b in zip(points[0], points[-1])]) ** 0.5
+
+def jobRows(job):
+	"""Yield the rows of the done comparison 'job', each with the
+	   run's own columns filled in
+	"""
+	metadata = job.metadata()
+	common = {'run': os.path.basename(job.runDir),
+		'protein': metadata.get('protein'),
+		'engine': metadata.get('engine', job.tool),
+		'traces': os.path.basename(job.helixPath or job.strandPath or ""),
+		'started': job.started, 'seconds': job.elapsed()}
+	if getattr(job, 'matches', None) is not None:
+		rows = matchRows(job.matches)
+	else:
+		text = job.output().replace("\r\n", "\n")
+		rows = logRows(text.splitlines(True), job.outputDir())
+	for row in rows:
+		row.update(common)
+		yield row
+
+class MetricsExport(object):
+	"""Append the rows of every finished comparison to the CSV and the
+	   columnar part in 'folder'
+	"""
+
+	def __init__(self, folder=None):
+		if folder is None:
+			folder = defaultPath()
+		self.folder = folder
+		if not os.path.isdir(folder):
+			os.makedirs(folder)
+		self.csvPath = os.path.join(folder, CSV_FILE)
+		self._part = None
+		# comparisons finish in the scheduler's threads
+		self._lock = threading.Lock()
+
+	def attach(self, scheduler):
+		"""Export the comparisons 'scheduler' runs as they finish"""
+		scheduler.addStateHandler(self._jobStateChange)
+
+	def _jobStateChange(self, job):
+		import jobs
+		import tools
+		if job.tool != tools.LEASTSQUARE or job.state != jobs.FINISHED:
+			return
+		try:
+			self.write(jobRows(job))
+		except (IOError, OSError), e:
+			job.write("Could not export the metrics to %s: %s\n"
+							% (self.folder, e))
+
+	def write(self, rows):
+		"""Append 'rows' (dicts by column, a run's worth)"""
+		rows = list(rows)
+		if not rows:
+			return
+		self._lock.acquire()
+		try:
+			self._writeCsv(rows)
+			if self._part is None:
+				self._part = newPart(self.folder)
+			try:
+				self._part.write(rows)
+			except:
+				# the next run starts a new part rather than adding to
+				# one this may have left in a mess
+				self._part = None
+				raise
+		finally:
+			self._lock.release()
+
+	def _writeCsv(self, rows):
+		lines = []
+		if not os.path.isfile(self.csvPath):
+			lines.append(",".join([name for name, kind in COLUMNS]))
+		for row in rows:
+			lines.append(",".join([_csvField(row.get(name), kind)
+						for name, kind in COLUMNS]))
+		# one write per run, so runs exported at once do not interleave
+		f = open(self.csvPath, "a")
+		f.write("\n".join(lines) + "\n")
+		f.close()
+
+	def close(self):
+		if self._part is not None:
+			self._part.close()
+			self._part = None
+
+def _csvField(value, kind):
+	if value is None:
+		return ""
+	if kind == "float":
+		return repr(float(value))
+	if kind == "int":
+		return str(int(value))
+	value = str(value)
+	if [c for c in ',"\n' if c in value]:
+		value = '"%s"' % value.replace('"', '""')
+	return value
+
+_parts = itertools.count(1)
+
+def _partName():
+	# a process may start another part, after a failed write, within
+	# the same second
+	return "part-%s-%d-%03d" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid(),
+								_parts.next())
+
+def newPart(folder):
+	"""Return a new columnar part in 'folder': an ArrowPart where
+	   pyarrow is installed, a RawPart otherwise
+	"""
+	try:
+		import pyarrow
+	except ImportError:
+		return RawPart(os.path.join(folder, _partName()))
+	return ArrowPart(os.path.join(folder, _partName() + ".arrows"))
+
+class ArrowPart(object):
+	"""Rows written as record batches of an Arrow IPC stream at 'path'"""
+
+	def __init__(self, path):
+		import pyarrow
+		self.path = path
+		types = {"text": pyarrow.string(), "float": pyarrow.float64(),
+						"int": pyarrow.int64()}
+		self.schema = pyarrow.schema([pyarrow.field(name, types[kind])
+						for name, kind in COLUMNS])
+		self._file = pyarrow.OSFile(path, "wb")
+		self._writer = pyarrow.RecordBatchStreamWriter(self._file,
+								self.schema)
+
+	def write(self, rows):
+		import pyarrow
+		arrays = [pyarrow.array([row.get(name) for row in rows],
+				type=self.schema[i].type)
+				for i, (name, kind) in enumerate(COLUMNS)]
+		self._writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays,
+						[name for name, kind in COLUMNS]))
+
+	def close(self):
+		self._writer.close()
+		self._file.close()
+
+# array type codes of the raw column files, and what stands for a
+# missing value in them
+RAW_TYPES = {"float": ("d", float("nan")), "int": ("i", -1),
+						"text": ("i", -1)}
+
+class RawPart(object):
+	"""Rows written to the folder 'path', one file of raw little-endian
+	   values per column (<column>.bin); text columns hold indices
+	   into <column>.txt, which has one distinct value per line.
+	   schema.json gives the columns, their types and how many rows
+	   are complete.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		os.makedirs(path)
+		self.rows = 0
+		self._values = dict([(name, {}) for name, kind in COLUMNS
+							if kind == "text"])
+		self._writeSchema()
+
+	def write(self, rows):
+		for name, kind in COLUMNS:
+			code, missing = RAW_TYPES[kind]
+			if kind == "text":
+				values = [self._index(name, row.get(name)) for row in rows]
+			else:
+				values = [row.get(name) for row in rows]
+				values = [v is None and missing or v for v in values]
+			column = array.array(code, values)
+			if sys.byteorder != "little":
+				column.byteswap()
+			path = os.path.join(self.path, name + ".bin")
+			f = open(path, os.path.exists(path) and "r+b" or "wb")
+			# drop whatever a failed write left after the complete rows,
+			# which would put this column out of step with the others
+			f.truncate(self.rows * column.itemsize)
+			f.seek(0, 2)
+			column.tofile(f)
+			f.close()
+		# the rows count once every column has them
+		self.rows += len(rows)
+		self._writeSchema()
+
+	def _index(self, name, value):
+		if value is None:
+			return -1
+		value = str(value).replace("\n", " ")
+		values = self._values[name]
+		if value not in values:
+			f = open(os.path.join(self.path, name + ".txt"), "a")
+			f.write(value + "\n")
+			f.close()
+			# only once it is in the file
+			values[value] = len(values)
+		return values[value]
+
+	def _writeSchema(self):
+		temp = os.path.join(self.path, ".schema.json")
+		f = open(temp, "w")
+		json.dump({'columns': [list(c) for c in COLUMNS],
+						'rows': self.rows}, f)
+		f.close()
+		schema = os.path.join(self.path, "schema.json")
+		if os.name == 'nt' and os.path.exists(schema):
+			# Windows cannot rename over an existing file
+			os.remove(schema)
+		os.rename(temp, schema)
+
+	def close(self):
+		pass
+
+def readColumns(folder=None):
+	"""Return {column: list of values} of every row exported to the
+	   columnar parts in 'folder', oldest part first (None where a
+	   value is missing)
+	"""
+	if folder is None:
+		folder = defaultPath()
+	columns = dict([(name, []) for name, kind in COLUMNS])
+	for name in sorted(os.listdir(folder)):
+		path = os.path.join(folder, name)
+		if name.startswith("part-") and name.endswith(".arrows"):
+			_readArrow(path, columns)
+		elif name.startswith("part-") and os.path.isdir(path):
+			_readRaw(path, columns)
+	return columns
+
+def _readArrow(path, columns):
+	import pyarrow
+	reader = pyarrow.RecordBatchStreamReader(pyarrow.OSFile(path, "rb"))
+	while True:
+		try:
+			batch = reader.read_next_batch()
+		except (StopIteration, pyarrow.ArrowInvalid):
+			break
+		for i, (name, kind) in enumerate(COLUMNS):
+			columns[name].extend(batch.column(i).to_pylist())
+
+def _readRaw(path, columns):
+	f = open(os.path.join(path, "schema.json"))
+	rows = json.load(f)['rows']
+	f.close()
+	for name, kind in COLUMNS:
+		code, missing = RAW_TYPES[kind]
+		values = array.array(code)
+		f = open(os.path.join(path, name + ".bin"), "rb")
+		values.fromfile(f, rows)
+		f.close()
+		if sys.byteorder != "little":
+			values.byteswap()
+		if kind == "text":
+			text = []
+			if os.path.isfile(os.path.join(path, name + ".txt")):
+				f = open(os.path.join(path, name + ".txt"))
+				text = f.read().split("\n")
+				f.close()
+			values = [i >= 0 and text[i] or None for i in values]
+		elif kind == "float":
+			values = [_missing(v != v, v) for v in values]
+		else:
+			values = [_missing(v == missing, v) for v in values]
+		columns[name].extend(values)
+
+def _missing(isMissing, value):
+	if isMissing:
+		return None
+	return value
+
+def main(argv):
+	if len(argv) > 2:
+		print >> sys.stderr, __doc__
+		return 2
+	folder = len(argv) == 2 and argv[1] or defaultPath()
+	if not os.path.isdir(folder):
+		print >> sys.stderr, "Nothing has been exported to %s" % folder
+		return 1
+	columns = readColumns(folder)
+	print "%d rows from %d runs in %s" % (len(columns['run']),
+					len(set(columns['run'])), folder)
+	print "type\tSSEs\tmatched\tmean distance error\tmean angle error"
+	for kind in sorted(set(columns['sse_type'])):
+		rows = [i for i, k in enumerate(columns['sse_type']) if k == kind]
+		matched = [i for i in rows if columns['matched'][i]]
+		means = []
+		for name in ("distance_error", "angle_error"):
+			values = [columns[name][i] for i in matched
+					if columns[name][i] is not None]
+			if values:
+				means.append("%.3f" % (sum(values) / len(values)))
+			else:
+				means.append("-")
+		print "%s\t%d\t%d\t%s" % (kind, len(rows), len(matched),
+							"\t".join(means))
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
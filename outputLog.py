@@ -0,0 +1,101 @@
+"""bounded in-memory tail of a job's output, with the full text on disk"""
+
+import collections
+import os
+import tempfile
+import threading
+import time
+
+# how long (days) the logs in logDir() are kept, and how much (bytes)
+# of them; see pruneLogs()
+KEEP_DAYS = 30
+KEEP_BYTES = 500 * 1024**2
+
+_pruned = threading.Lock()
+
+def logDir():
+	"""Return (creating it if needed, and pruning it the first time)
+	   the folder job logs spill into, ~/.SSETracer/logs
+	"""
+	path = os.path.join(os.path.expanduser("~"), ".SSETracer", "logs")
+	if not os.path.isdir(path):
+		os.makedirs(path)
+	if _pruned.acquire(False):
+		# never released: once per process is enough
+		pruneLogs(path)
+	return path
+
+def pruneLogs(path, days=KEEP_DAYS, size=KEEP_BYTES):
+	"""Delete the logs in 'path' last written more than 'days' ago,
+	   then the oldest of those last written more than a day ago
+	   until the rest take at most 'size' bytes.  The run history
+	   (see jobHistory.py) gives no log for runs whose log has gone.
+	"""
+	now = time.time()
+	logs = []
+	for name in os.listdir(path):
+		if not name.endswith(".log"):
+			continue
+		logPath = os.path.join(path, name)
+		try:
+			st = os.stat(logPath)
+		except OSError:
+			continue
+		logs.append((st.st_mtime, st.st_size, logPath))
+	logs.sort()
+	total = sum([logSize for mtime, logSize, logPath in logs])
+	for mtime, logSize, logPath in logs:
+		age = now - mtime
+		if age > days * 86400 or (total > size and age > 86400):
+			try:
+				os.remove(logPath)
+			except OSError:
+				continue
+			total -= logSize
+
+class OutputLog(object):
+	"""Keep the last 'maxLines' lines of output in memory.
+
+	   Everything appended is also written to 'path' (by default a new
+	   file in logDir() whose name starts with 'prefix'), so the whole
+	   output survives however much of it is dropped from memory.
+	   Files in logDir() are kept as long as pruneLogs() allows.
+	"""
+
+	def __init__(self, maxLines=5000, path=None, prefix="job"):
+		self.lines = collections.deque(maxlen=maxLines)
+		self.dropped = 0
+		self.path = path
+		self._prefix = prefix
+		self._file = None
+
+	def append(self, text):
+		if not text:
+			return
+		if self._file is None:
+			if self.path is None:
+				fd, self.path = tempfile.mkstemp(prefix=self._prefix,
+						suffix=".log", dir=logDir())
+				self._file = os.fdopen(fd, "w")
+			else:
+				self._file = open(self.path, "a")
+		self._file.write(text)
+		self._file.flush()
+
+		lines = text.splitlines(True)
+		if self.lines and not self.lines[-1].endswith("\n"):
+			# finish the partial line left by the previous chunk
+			lines[0] = self.lines.pop() + lines[0]
+		overflow = len(self.lines) + len(lines) - self.lines.maxlen
+		if overflow > 0:
+			self.dropped += overflow
+		self.lines.extend(lines)
+
+	def text(self):
+		"""Return the lines kept in memory as one string"""
+		return "".join(self.lines)
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
@@ -0,0 +1,185 @@
+"""report files in a tool's output folder as soon as they are complete
+
+On Linux the folder is watched with inotify (through ctypes), which says
+when a file that was open for writing is closed or a file is moved into
+the folder.  Elsewhere the folder is scanned (with scandir where it is
+available) a few times a second, and a file counts as complete once its
+size and modification time have stopped changing.  Either way, stop()
+reports whatever has not been reported yet, which is everything that is
+left once the tool has exited.
+"""
+
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+try:
+	from os import scandir
+except ImportError:
+	try:
+		from scandir import scandir
+	except ImportError:
+		scandir = None
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = os.O_NONBLOCK
+_EVENT = struct.Struct("iIII")
+
+def _libc():
+	"""Return libc if it offers inotify, otherwise None"""
+	if not sys.platform.startswith("linux"):
+		return None
+	try:
+		import ctypes, ctypes.util
+		libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+							use_errno=True)
+		libc.inotify_init1
+		libc.inotify_add_watch
+	except (ImportError, OSError, AttributeError):
+		return None
+	return libc
+
+def _listFiles(folder):
+	"""Return (name, size, mtime) for every file in 'folder'"""
+	files = []
+	if scandir is not None:
+		for entry in scandir(folder):
+			try:
+				st = entry.stat()
+			except OSError:
+				continue
+			files.append((entry.name, st.st_size, st.st_mtime))
+		return files
+	for name in os.listdir(folder):
+		try:
+			st = os.stat(os.path.join(folder, name))
+		except OSError:
+			continue
+		files.append((name, st.st_size, st.st_mtime))
+	return files
+
+def naturalKey(name):
+	"""Sort key that puts 'traceHelix2' before 'traceHelix10'"""
+	return [part.isdigit() and int(part) or part
+				for part in re.split(r"(\d+)", name)]
+
+class OutputWatcher(object):
+	"""Call 'callback(path)' once for each complete file in 'folder'.
+
+	   Only file names matching the regular expression 'pattern' (all
+	   files if None) are reported.  The polling fallback rescans every
+	   'interval' seconds and needs a file to be unchanged for 'settle'
+	   seconds.  'callback' runs in the watcher's thread, and from
+	   stop() in the caller's thread.
+	"""
+
+	def __init__(self, folder, callback, pattern=None, interval=0.25,
+							settle=0.5, useInotify=True):
+		self.folder = folder
+		self.callback = callback
+		if isinstance(pattern, basestring):
+			pattern = re.compile(pattern)
+		self.pattern = pattern
+		self.interval = interval
+		self.settle = settle
+		self.reported = set()
+		self._lock = threading.Lock()
+		self._stopping = threading.Event()
+		self._inotify = None
+		if useInotify:
+			self._inotify = self._watch()
+		if self._inotify is None:
+			target = self._pollLoop
+		else:
+			target = self._inotifyLoop
+		self._thread = threading.Thread(target=target)
+		self._thread.setDaemon(True)
+
+	def start(self):
+		self._thread.start()
+		return self
+
+	def stop(self):
+		"""Stop watching and report every file not reported yet"""
+		self._stopping.set()
+		if self._inotify is not None:
+			os.write(self._wakeWrite, "x")
+		if self._thread.isAlive():
+			self._thread.join()
+		if self._inotify is not None:
+			os.close(self._inotify)
+			os.close(self._wakeRead)
+			os.close(self._wakeWrite)
+			self._inotify = None
+		if os.path.isdir(self.folder):
+			for name in sorted(os.listdir(self.folder), key=naturalKey):
+				self._report(name)
+
+	def _accept(self, name):
+		return self.pattern is None or self.pattern.match(name)
+
+	def _report(self, name):
+		if not self._accept(name):
+			return
+		self._lock.acquire()
+		try:
+			if name in self.reported:
+				return
+			self.reported.add(name)
+		finally:
+			self._lock.release()
+		self.callback(os.path.join(self.folder, name))
+
+	def _watch(self):
+		libc = _libc()
+		if libc is None:
+			return None
+		fd = libc.inotify_init1(IN_NONBLOCK)
+		if fd < 0:
+			return None
+		if libc.inotify_add_watch(fd, self.folder,
+					IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+			os.close(fd)
+			return None
+		self._wakeRead, self._wakeWrite = os.pipe()
+		return fd
+
+	def _inotifyLoop(self):
+		fd = self._inotify
+		while not self._stopping.isSet():
+			ready = select.select([fd, self._wakeRead], [], [])[0]
+			if fd not in ready:
+				continue
+			try:
+				buf = os.read(fd, 65536)
+			except OSError:
+				continue
+			offset = 0
+			while offset + _EVENT.size <= len(buf):
+				wd, mask, cookie, length = _EVENT.unpack_from(buf, offset)
+				offset += _EVENT.size
+				name = buf[offset:offset+length].rstrip("\0")
+				offset += length
+				if name and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+					self._report(name)
+
+	def _pollLoop(self):
+		seen = {}	# name -> (size, mtime, time it was first seen so)
+		while not self._stopping.wait(self.interval) \
+		and not self._stopping.isSet():
+			try:
+				files = _listFiles(self.folder)
+			except OSError:
+				continue
+			now = time.time()
+			for name, size, mtime in files:
+				if name in self.reported or not self._accept(name):
+					continue
+				if name not in seen or seen[name][:2] != (size, mtime):
+					seen[name] = (size, mtime, now)
+				elif now - seen[name][2] >= self.settle:
+					self._report(name)
@@ -0,0 +1,217 @@
+"""read the stdout/stderr pipes of every tool process from one thread"""
+
+import errno
+import os
+import select
+import threading
+import time
+import traceback
+import Queue
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+# Linux only: fcntl command to grow a pipe's kernel buffer
+F_SETPIPE_SZ = 1031
+
+class PipeMultiplexer(object):
+	"""Collect the output of many child processes in a single thread.
+
+	   Processes are added with register(key, process, onExit); their
+	   stdout and stderr pipes are read without blocking in chunks of
+	   up to 'bufferSize' bytes.  Each pass over the ready pipes hands
+	   'sink' one list of (key, stream, data) tuples, where 'stream'
+	   is STDOUT or STDERR; after a pass that produced output the
+	   thread waits 'batchInterval' seconds so that busy pipes are read
+	   in large chunks rather than line by line.  Once a process has
+	   closed both pipes and exited, onExit(key, returncode) is called.
+	   Both callbacks run in the multiplexer thread.
+
+	   On Windows, where select() only works on sockets, one small
+	   reader thread per pipe feeds the same batching loop.
+	"""
+
+	def __init__(self, sink, bufferSize=65536, batchInterval=0.05,
+							pipeSize=1<<20):
+		self.sink = sink
+		self.bufferSize = bufferSize
+		self.batchInterval = batchInterval
+		self.pipeSize = pipeSize
+		self._lock = threading.Lock()
+		self._streams = {}	# fd -> (entry, stream name)
+		self._reaping = []	# entries with closed pipes, not yet exited
+		self._thread = None
+		if os.name == 'nt':
+			self._events = Queue.Queue()
+		else:
+			self._wakeRead, self._wakeWrite = os.pipe()
+
+	def register(self, key, process, onExit):
+		"""Start reading the pipes of 'process' (a subprocess.Popen
+		   created with stdout and stderr set to subprocess.PIPE)
+		"""
+		entry = {
+			'key': key,
+			'process': process,
+			'onExit': onExit,
+			'open': 0,
+		}
+		pipes = [(STDOUT, process.stdout), (STDERR, process.stderr)]
+		self._lock.acquire()
+		try:
+			for stream, pipe in pipes:
+				if pipe is None:
+					continue
+				entry['open'] += 1
+				if os.name == 'nt':
+					reader = threading.Thread(target=self._readPipe,
+						args=(entry, stream, pipe.fileno()))
+					reader.setDaemon(True)
+					reader.start()
+				else:
+					self._prepare(pipe.fileno())
+					self._streams[pipe.fileno()] = (entry, stream)
+			if not entry['open']:
+				self._reaping.append(entry)
+			if self._thread is None:
+				self._thread = threading.Thread(target=self._loop)
+				self._thread.setDaemon(True)
+				self._thread.start()
+		finally:
+			self._lock.release()
+		self._wake()
+
+	def _prepare(self, fd):
+		import fcntl
+		flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+		fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+		if self.pipeSize:
+			try:
+				fcntl.fcntl(fd, F_SETPIPE_SZ, self.pipeSize)
+			except (IOError, OSError):
+				# not Linux, or over the per-user pipe limit
+				pass
+
+	def _wake(self):
+		if os.name == 'nt':
+			self._events.put(None)
+		else:
+			os.write(self._wakeWrite, "x")
+
+	def _loop(self):
+		while True:
+			self._lock.acquire()
+			try:
+				reaping = bool(self._reaping)
+			finally:
+				self._lock.release()
+			if reaping:
+				# poll exited processes a few times a second
+				timeout = 0.1
+			else:
+				timeout = None
+			if os.name == 'nt':
+				events = self._waitThreads(timeout)
+			else:
+				events = self._waitSelect(timeout)
+			batch = []
+			for entry, stream, data in events:
+				if data:
+					batch.append((entry['key'], stream, data))
+				else:
+					self._closed(entry)
+			if batch:
+				try:
+					self.sink(batch)
+				except:
+					traceback.print_exc()
+			self._reap()
+			if batch and self.batchInterval:
+				time.sleep(self.batchInterval)
+
+	def _waitSelect(self, timeout):
+		self._lock.acquire()
+		try:
+			fds = self._streams.keys()
+		finally:
+			self._lock.release()
+		try:
+			ready = select.select(fds + [self._wakeRead], [], [],
+								timeout)[0]
+		except (select.error, OSError), e:
+			if e.args[0] == errno.EINTR:
+				return []
+			raise
+		events = []
+		for fd in ready:
+			if fd == self._wakeRead:
+				os.read(fd, 4096)
+				continue
+			try:
+				data = os.read(fd, self.bufferSize)
+			except OSError, e:
+				if e.errno in (errno.EAGAIN, errno.EINTR):
+					continue
+				data = ""
+			self._lock.acquire()
+			try:
+				if data:
+					entry, stream = self._streams[fd]
+				else:
+					entry, stream = self._streams.pop(fd)
+			finally:
+				self._lock.release()
+			events.append((entry, stream, data))
+		return events
+
+	def _readPipe(self, entry, stream, fd):
+		while True:
+			try:
+				data = os.read(fd, self.bufferSize)
+			except OSError:
+				data = ""
+			self._events.put((entry, stream, data))
+			if not data:
+				break
+
+	def _waitThreads(self, timeout):
+		events = []
+		try:
+			event = self._events.get(timeout=timeout)
+			while True:
+				if event is not None:
+					events.append(event)
+				event = self._events.get(block=False)
+		except Queue.Empty:
+			pass
+		return events
+
+	def _closed(self, entry):
+		self._lock.acquire()
+		try:
+			entry['open'] -= 1
+			if not entry['open']:
+				self._reaping.append(entry)
+		finally:
+			self._lock.release()
+
+	def _reap(self):
+		# register() adds to _reaping from other threads
+		exited = []
+		self._lock.acquire()
+		try:
+			for entry in self._reaping[:]:
+				returncode = entry['process'].poll()
+				if returncode is not None:
+					self._reaping.remove(entry)
+					exited.append((entry, returncode))
+		finally:
+			self._lock.release()
+		for entry, returncode in exited:
+			for pipe in (entry['process'].stdout, entry['process'].stderr):
+				if pipe is not None:
+					pipe.close()
+			try:
+				entry['onExit'](entry['key'], returncode)
+			except:
+				traceback.print_exc()
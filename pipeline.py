@@ -0,0 +1,179 @@
+"""chain tool runs so that each starts as soon as its inputs are ready
+
+A Pipeline is a set of stages, each of which makes a Job from the
+finished jobs of the stages it comes after.  Stages with nothing left to
+wait for are submitted to a JobScheduler straight away, so independent
+branches (one per threshold or per protein, say) run side by side within
+the scheduler's limits, and the whole takes as long as its slowest chain
+of stages rather than the sum of all of them.
+
+Nothing in here imports chimera.
+"""
+
+import threading
+import time
+import jobs
+
+WAITING = "waiting"
+SUBMITTED = "submitted"
+SKIPPED = "skipped"
+
+class Stage(object):
+	"""One step of a Pipeline; see Pipeline.add()"""
+
+	def __init__(self, name, makeJob, after, optional):
+		self.name = name
+		self.makeJob = makeJob
+		self.after = list(after)
+		self.optional = list(optional)
+		self.job = None
+		self.state = WAITING
+		self.error = None
+
+	def __repr__(self):
+		return "<Stage %s (%s)>" % (self.name, self.state)
+
+	def isDone(self):
+		return self.state in (SKIPPED, jobs.FINISHED, jobs.FAILED,
+							jobs.CANCELLED)
+
+class Pipeline(object):
+	"""Stages run through 'scheduler' in dependency order.
+
+	   'callback', if given, is called with the pipeline once every
+	   stage is done, from whichever thread finished the last one.
+	"""
+
+	def __init__(self, scheduler, name="pipeline", callback=None):
+		self.scheduler = scheduler
+		self.name = name
+		self.callback = callback
+		self.stages = []
+		self.started = self.ended = None
+		self._lock = threading.RLock()
+		self._done = threading.Event()
+
+	def add(self, name, makeJob, after=(), optional=()):
+		"""Add a stage and return it.
+
+		   'makeJob' is called with the finished Jobs of the stages in
+		   'after', in that order, and returns the Job to run or None
+		   if there is nothing to do.  If any of those stages did not
+		   finish successfully the stage is skipped.  The stages in
+		   'optional' are waited for too, and their Jobs follow the
+		   others, but one that did not finish is passed as None.
+		"""
+		stage = Stage(name, makeJob, after, optional)
+		self.stages.append(stage)
+		return stage
+
+	def start(self):
+		self.started = time.time()
+		self.scheduler.addStateHandler(self._jobStateChange)
+		self._advance()
+		return self
+
+	def isDone(self):
+		return self._done.isSet()
+
+	def wait(self, timeout=None):
+		self._done.wait(timeout)
+		return self._done.isSet()
+
+	def cancel(self, reason="cancelled"):
+		"""Cancel the running stages and skip the ones still waiting"""
+		self._lock.acquire()
+		try:
+			running = [s.job for s in self.stages if s.state == SUBMITTED]
+			for stage in self.stages:
+				if stage.state == WAITING:
+					stage.state = SKIPPED
+					stage.error = reason
+		finally:
+			self._lock.release()
+		for job in running:
+			self.scheduler.cancel(job, reason)
+		self._advance()
+
+	def summary(self):
+		"""Return a tab-separated table of the stages and their times"""
+		lines = ["stage\tstate\tstart\tseconds\n"]
+		for stage in self.stages:
+			start = elapsed = ""
+			job = stage.job
+			if job is not None and job.started is not None:
+				start = "%.1f" % (job.started - self.started)
+				elapsed = "%.1f" % (job.elapsed() or 0.0)
+			state = stage.state
+			if stage.error:
+				state += " (%s)" % stage.error
+			lines.append("%s\t%s\t%s\t%s\n" % (stage.name, state,
+								start, elapsed))
+		if self.ended is not None:
+			busy = sum([s.job.elapsed() or 0.0 for s in self.stages
+						if s.job is not None])
+			lines.append("total %.1f seconds, %.1f seconds of tool runs\n"
+					% (self.ended - self.started, busy))
+		return "".join(lines)
+
+	def _jobStateChange(self, job):
+		if job.isDone() and [s for s in self.stages if s.job is job]:
+			self._advance()
+
+	def _advance(self):
+		# submit every stage whose inputs are ready, skip those whose
+		# inputs failed, and repeat while that changes anything
+		submit = []
+		self._lock.acquire()
+		try:
+			changed = True
+			while changed:
+				changed = False
+				for stage in self.stages:
+					if stage.job is not None and stage.state == SUBMITTED \
+					and stage.job.isDone():
+						stage.state = stage.job.state
+						changed = True
+					if stage.state != WAITING:
+						continue
+					if [s for s in stage.after + stage.optional
+							if not s.isDone()]:
+						continue
+					changed = True
+					failed = [s for s in stage.after
+							if s.state != jobs.FINISHED]
+					if failed:
+						stage.state = SKIPPED
+						stage.error = "%s did not finish" % failed[0].name
+						continue
+					try:
+						inputs = [s.job for s in stage.after]
+						for s in stage.optional:
+							if s.state == jobs.FINISHED:
+								inputs.append(s.job)
+							else:
+								inputs.append(None)
+						stage.job = stage.makeJob(*inputs)
+					except Exception, e:
+						stage.state = jobs.FAILED
+						stage.error = "%s: %s" % (e.__class__.__name__, e)
+						continue
+					if stage.job is None:
+						stage.state = SKIPPED
+						stage.error = "nothing to do"
+						continue
+					stage.state = SUBMITTED
+					submit.append(stage.job)
+			finished = not [s for s in self.stages if not s.isDone()] \
+						and not self._done.isSet()
+			if finished:
+				self.ended = time.time()
+				self._done.set()
+		finally:
+			self._lock.release()
+		for job in submit:
+			self.scheduler.submit(job)
+		if finished:
+			self.scheduler.removeStateHandler(self._jobStateChange)
+			if self.callback:
+				self.callback(self)
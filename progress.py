@@ -0,0 +1,225 @@
+"""progress of the external tools, read from their output
+
+Each tool prints a line as it reaches each stage of its work.  A parser
+for the tool turns those lines into ProgressEvents, and a
+ProgressTracker keeps the latest one together with a rolling estimate
+of the time left.  Parsers are looked up by tool name (see register()),
+so other tools can be added without touching the job code.
+
+Run as a script to check on a tool from its log file:
+
+	python progress.py leastsquare output_runs/1ABC/latest/output/leastsquare.log
+"""
+
+import re
+import sys
+import time
+import tools
+
+class ProgressEvent(object):
+	"""A stage reached by a tool.
+
+	   'fraction' is the part of the work done (0 to 1), or None when
+	   the tool does not say how far along it is; 'count' and 'total'
+	   are set by parsers that count items.
+	"""
+
+	def __init__(self, stage, fraction=None, count=None, total=None,
+								when=None):
+		self.stage = stage
+		self.fraction = fraction
+		self.count = count
+		self.total = total
+		if when is None:
+			when = time.time()
+		self.time = when
+
+	def __repr__(self):
+		if self.fraction is None:
+			return "<ProgressEvent %s>" % self.stage
+		return "<ProgressEvent %s %.0f%%>" % (self.stage,
+							100 * self.fraction)
+
+class StageParser(object):
+	"""Progress from lines that mark the stages a tool goes through.
+
+	   'stages' lists (regular expression, stage name) in the order the
+	   tool reaches them; reaching stage i of n means i/n of the work
+	   is done.  Progress never goes backwards, so a stage printed again
+	   later (once per helix, say) does not undo anything.
+	"""
+
+	def __init__(self, stages):
+		self.stages = [(re.compile(pattern), name)
+					for pattern, name in stages]
+		self.reached = 0
+
+	def parse(self, line):
+		"""Return the ProgressEvent 'line' marks, or None"""
+		for index, (pattern, name) in enumerate(self.stages):
+			if pattern.search(line):
+				if index < self.reached:
+					return None
+				self.reached = index + 1
+				return ProgressEvent(name,
+					float(index) / len(self.stages))
+		return None
+
+class CountParser(object):
+	"""Progress from a line the tool prints once per item.
+
+	   'total' is the number of items, if known; without it events
+	   carry the count but no fraction.
+	"""
+
+	def __init__(self, pattern, stage, total=None):
+		self.pattern = re.compile(pattern)
+		self.stage = stage
+		self.total = total
+		self.count = 0
+
+	def parse(self, line):
+		if not self.pattern.search(line):
+			return None
+		self.count += 1
+		fraction = None
+		if self.total:
+			fraction = min(float(self.count) / (self.total + 1), 1.0)
+		return ProgressEvent(self.stage, fraction, self.count,
+								self.total)
+
+_parsers = {}
+
+def register(tool, factory):
+	"""Use 'factory(**options)' to make progress parsers for 'tool'"""
+	_parsers[tool] = factory
+
+def newParser(tool, **options):
+	"""Return a new parser for 'tool', or None if there is none"""
+	factory = _parsers.get(tool)
+	if factory is None:
+		return None
+	return factory(**options)
+
+register(tools.TRACER, lambda: StageParser([
+	(r"^Filtering the map", "filtering"),
+	(r"^Normalizing the map", "normalizing"),
+	(r"^Gauss smoothing", "smoothing"),
+	(r"^Building gradient", "gradient"),
+	(r"^Building tensor", "tensor"),
+	(r"^Building thickness", "thickness"),
+	(r"^Euclidian Distance Transform", "distance transform"),
+	(r"^Find the Distance Ridge", "distance ridge"),
+	(r"^Estimate HLX/SHT", "estimating helices/sheets"),
+	(r"^Clustering helix points", "clustering helices"),
+	(r"^Smoothing the helix nodes", "smoothing helices"),
+	(r"^linear segment the helix", "segmenting helices"),
+	(r"Printing out quantitative analysis", "analysis"),
+]))
+
+register(tools.TWISTER, lambda: StageParser([
+	(r"^Filtering the map", "filtering"),
+	(r"^Normalizing the map", "normalizing"),
+	(r"^Building gradient", "gradient"),
+	(r"^Building tensor", "tensor"),
+	(r"^Building thickness", "thickness"),
+	(r"^Euclidian Distance Transform", "distance transform"),
+	(r"^Find the Distance Ridge", "distance ridge"),
+	(r"^Clustering helix points", "clustering helices"),
+	(r"^Find out two ends of each helix", "helix ends"),
+	(r"^Re-order the helix nodes", "ordering helices"),
+]))
+
+# leastsquare prints this once for every traced axis it compares
+register(tools.LEASTSQUARE, lambda total=None: CountParser(
+	r"^For true axis p and traced axis q", "comparing axes", total))
+
+class ProgressTracker(object):
+	"""Follow one run of a tool through its output.
+
+	   feed() takes output as it arrives, in chunks of any size.  The
+	   latest event is in 'event' and all of them are in 'events'; the
+	   estimate of the time left is based on the last 'window' events.
+	"""
+
+	window = 5
+
+	def __init__(self, parser, started=None):
+		self.parser = parser
+		if started is None:
+			started = time.time()
+		self.started = started
+		self.event = None
+		self.events = []
+		self._partial = ""
+
+	def feed(self, text):
+		if self.parser is None:
+			return
+		lines = (self._partial + text).split("\n")
+		self._partial = lines.pop()
+		for line in lines:
+			event = self.parser.parse(line.strip())
+			if event is not None:
+				self.event = event
+				self.events.append(event)
+
+	def complete(self):
+		"""Note that the tool has finished all its work"""
+		self.event = ProgressEvent("done", 1.0)
+		self.events.append(self.event)
+
+	def stage(self):
+		if self.event is None:
+			return None
+		return self.event.stage
+
+	def fraction(self):
+		if self.event is None:
+			if self.parser is None:
+				return None
+			return 0.0
+		return self.event.fraction
+
+	def eta(self, now=None):
+		"""Return the estimated seconds left, or None if unknown"""
+		points = [(e.time, e.fraction) for e in self.events[-self.window:]
+						if e.fraction is not None]
+		if len(points) < self.window:
+			points.insert(0, (self.started, 0.0))
+		if len(points) < 2:
+			return None
+		(t0, f0), (t1, f1) = points[0], points[-1]
+		if f1 >= 1.0:
+			return 0.0
+		if f1 <= f0 or t1 <= t0:
+			return None
+		if now is None:
+			now = time.time()
+		left = (1.0 - f1) * (t1 - t0) / (f1 - f0) - (now - t1)
+		return max(left, 0.0)
+
+def readLog(tool, path, **options):
+	"""Return a ProgressTracker fed with the log file 'path' of 'tool'"""
+	tracker = ProgressTracker(newParser(tool, **options))
+	f = open(path, "rU")
+	tracker.feed(f.read() + "\n")
+	f.close()
+	return tracker
+
+def main(argv):
+	if len(argv) != 3:
+		print >> sys.stderr, "usage: python progress.py TOOL LOGFILE"
+		return 2
+	tracker = readLog(argv[1], argv[2])
+	if tracker.event is None:
+		print "no progress yet"
+	elif tracker.event.fraction is None:
+		print "%s (%d)" % (tracker.event.stage, tracker.event.count or 0)
+	else:
+		print "%s %.0f%%" % (tracker.event.stage,
+					100 * tracker.event.fraction)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
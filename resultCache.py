@@ -0,0 +1,184 @@
+"""content-addressed cache of external tool results
+
+An entry is keyed on the SHA-1 of the command line together with the
+contents of the tool binary and of every input file, so editing an input
+or rebuilding a tool misses the cache while rerunning the same thing
+restores the earlier output folders and replays the tool's output.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+MANIFEST = "manifest"
+STDOUT = "stdout.txt"
+
+def defaultRoot():
+	return os.path.join(os.path.expanduser("~"), ".SSETracer", "cache")
+
+def pathSize(path):
+	"""Return the number of bytes in the file or folder 'path'"""
+	if not os.path.isdir(path):
+		return os.path.getsize(path)
+	total = 0
+	for dirPath, dirNames, fileNames in os.walk(path):
+		for name in fileNames:
+			total += os.path.getsize(os.path.join(dirPath, name))
+	return total
+
+class ResultCache(object):
+	"""Cache of tool runs in 'root', kept under 'maxBytes' in total.
+
+	   Least recently used entries are evicted first.  File digests are
+	   remembered by path, size and modification time, so unchanged
+	   multi-gigabyte maps are only read once per session.
+	"""
+
+	def __init__(self, root=None, maxBytes=2 * 1024**3):
+		if root is None:
+			root = defaultRoot()
+		self.root = root
+		self.maxBytes = maxBytes
+		self._digests = {}
+		self._lock = threading.Lock()
+		if not os.path.isdir(root):
+			os.makedirs(root)
+
+	def fileDigest(self, path):
+		st = os.stat(path)
+		stamp = (st.st_size, st.st_mtime)
+		cached = self._digests.get(path)
+		if cached and cached[0] == stamp:
+			return cached[1]
+		sha = hashlib.sha1()
+		f = open(path, "rb")
+		while True:
+			block = f.read(1 << 20)
+			if not block:
+				break
+			sha.update(block)
+		f.close()
+		digest = sha.hexdigest()
+		self._digests[path] = (stamp, digest)
+		return digest
+
+	def key(self, command, inputs):
+		"""Return the key for running 'command' on the files 'inputs'
+
+		   'inputs' should include the tool binary itself; files that
+		   do not exist are recorded as missing.
+		"""
+		sha = hashlib.sha1()
+		sha.update(command)
+		for path in sorted(inputs):
+			sha.update("\0" + path + "\0")
+			if os.path.isfile(path):
+				sha.update(self.fileDigest(path))
+			else:
+				sha.update("missing")
+		return sha.hexdigest()
+
+	def restore(self, key, outputPaths):
+		"""Put the outputs stored under 'key' back at 'outputPaths'.
+
+		   Returns the captured tool output, or None if there is no
+		   entry for 'key'.
+		"""
+		entry = os.path.join(self.root, key)
+		manifest = os.path.join(entry, MANIFEST)
+		if not os.path.isfile(manifest):
+			return None
+		# the manifest's time stamp records the last use
+		os.utime(manifest, None)
+		for index, path in enumerate(outputPaths):
+			saved = os.path.join(entry, str(index))
+			if os.path.isdir(path):
+				shutil.rmtree(path)
+			elif os.path.exists(path):
+				os.remove(path)
+			if os.path.isdir(saved):
+				shutil.copytree(saved, path)
+			elif os.path.exists(saved):
+				shutil.copy2(saved, path)
+		f = open(os.path.join(entry, STDOUT), "rb")
+		stdout = f.read()
+		f.close()
+		return stdout
+
+	def store(self, key, outputPaths, stdoutFile):
+		"""Save 'outputPaths' and the tool output in the open file
+		   'stdoutFile' under 'key', then evict down to 'maxBytes'
+		"""
+		entry = os.path.join(self.root, key)
+		if os.path.exists(entry):
+			return
+		staging = tempfile.mkdtemp(dir=self.root, prefix=".new-")
+		try:
+			for index, path in enumerate(outputPaths):
+				saved = os.path.join(staging, str(index))
+				if os.path.isdir(path):
+					shutil.copytree(path, saved)
+				elif os.path.exists(path):
+					shutil.copy2(path, saved)
+			stdoutFile.seek(0)
+			f = open(os.path.join(staging, STDOUT), "wb")
+			shutil.copyfileobj(stdoutFile, f)
+			f.close()
+			f = open(os.path.join(staging, MANIFEST), "w")
+			f.write("%d\n" % pathSize(staging))
+			for path in outputPaths:
+				f.write(path + "\n")
+			f.close()
+			try:
+				os.rename(staging, entry)
+			except OSError:
+				# stored meanwhile by another run of the same thing
+				if not os.path.isdir(entry):
+					raise
+				shutil.rmtree(staging, ignore_errors=True)
+		except:
+			shutil.rmtree(staging, ignore_errors=True)
+			raise
+		self.evict()
+
+	def entries(self):
+		"""Return (last use, bytes, key) for every entry, oldest first"""
+		entries = []
+		for key in os.listdir(self.root):
+			manifest = os.path.join(self.root, key, MANIFEST)
+			if key.startswith(".") or not os.path.isfile(manifest):
+				continue
+			f = open(manifest)
+			size = int(f.readline())
+			f.close()
+			entries.append((os.path.getmtime(manifest), size, key))
+		entries.sort()
+		return entries
+
+	def evict(self, maxBytes=None):
+		"""Remove least recently used entries until the cache holds
+		   at most 'maxBytes' (default: self.maxBytes)
+		"""
+		if maxBytes is None:
+			maxBytes = self.maxBytes
+		self._lock.acquire()
+		try:
+			entries = self.entries()
+			total = sum([size for used, size, key in entries])
+			for used, size, key in entries:
+				if total <= maxBytes:
+					break
+				shutil.rmtree(os.path.join(self.root, key),
+							ignore_errors=True)
+				total -= size
+			# staging folders left behind by an interrupted store
+			for name in os.listdir(self.root):
+				path = os.path.join(self.root, name)
+				if name.startswith(".new-") and \
+				time.time() - os.path.getmtime(path) > 86400:
+					shutil.rmtree(path, ignore_errors=True)
+		finally:
+			self._lock.release()
@@ -0,0 +1,537 @@
+"""run SSETracer, StrandTwister and leastsquare, alone or chained, without
+Chimera
+
+usage: python runTools.py trace [-a] [-j N] [-q] MAP SKELETON PDB THRESHOLDS
+       python runTools.py twist [-j N] [-q] MAP PDB THRESHOLD
+       python runTools.py compare [-b N] [-c] [-e ENGINE] [-g GATE] [-o OUTPUT]
+						[-q] PDB [HELIX [STRAND]]
+       python runTools.py pipeline [-a] [-b N] [-c] [-e ENGINE] [-g GATE] [-j N]
+				[-q] MAP SKELETON PDB THRESHOLDS TWISTER_THRESHOLD
+       python runTools.py prune [-n KEEP] PDB
+
+Paths may be given with or without their extension.  THRESHOLDS is one
+value, a list ("0.3,0.35") or a start:stop:step range; several run side
+by side.  HELIX and STRAND are the first files of the traced helix and
+strand series ('-' for none).  The pipeline traces the map at every
+threshold, runs StrandTwister on each sheet estimate and compares the
+traced helices and strands against PDB, writing a summary of its stages
+to <MAP>_pipeline.txt.  prune deletes all but the KEEP (default 10)
+newest comparison runs against PDB, keeping those the run history names;
+see pruneRuns().
+
+  -a	sensitivity analysis (the tracer compares against PDB)
+  -b N	with numpy, add bootstrap intervals of the errors from N
+	resamples of the traced points
+  -c	with numpy, also fit strands as curves and report how far apart
+	those are
+  -e	compare with ENGINE, leastsquare or numpy (default: leastsquare
+	if its binary is here, numpy otherwise; see axisEngine.py)
+  -g	with numpy, only match axes that pass GATE, e.g. "distance=8,
+	angle=30" (see tools.parseGate())
+  -j N	at most N runs of each tool at once (default: one per CPU)
+  -n	keep KEEP comparison runs
+  -o	write leastsquare's text report to OUTPUT
+  -q	only print the summary, not the tools' output
+
+The tools' output is printed as it comes, each line led by the name of
+the run.  Runs are recorded in the run history like those started from
+Chimera.  The exit status is 0 if every run finished, 1 otherwise.
+
+The job classes here are the ones the model panel's jobs are built on;
+nothing in this module imports chimera.
+"""
+
+import os
+import platform
+import sys
+import threading
+import time
+import jobs
+import pipeline
+import progress
+import tools
+
+def _stem(path):
+	if os.path.splitext(path)[1].lower() in (".mrc", ".pdb", ".txt"):
+		return tools.stripExt(path)
+	return path
+
+def workFolder(mrcPath):
+	"""Return the folder the tracer is run in for map 'mrcPath'"""
+	path = os.path.dirname(mrcPath)
+	# only use drive letter + colon if path points to drive root on Windows
+	if platform.system() == 'Windows' and len(path) == 3:
+		path = path[:2]
+	return path
+
+class TracerRun(jobs.Job):
+	"""SSETracer on map 'mrcPath' at 'threshold'; paths are without
+	   their extension
+	"""
+
+	tool = tools.TRACER
+
+	def __init__(self, mrcPath, skeletonPath, threshold, analysis, pdbPath):
+		self.tracerPath = '"' + tools.binaryPath(tools.TRACER) + '"'
+		self.path = workFolder(mrcPath)
+		self.pdbPath = pdbPath
+		self.mrcPath = mrcPath
+		self.skeletonPath = skeletonPath
+		self.threshold = threshold
+		self.analysis = analysis
+		jobs.Job.__init__(self, os.path.basename(mrcPath) + "_thr_" + threshold)
+
+	def command(self):
+		if platform.system() == 'Windows':
+			arguments = '"' + self.path + '"\ "' + self.mrcPath + '" "' + self.skeletonPath + '" ' + str(self.threshold) + ' ' + str(self.analysis) + ' "' + self.pdbPath + '"'
+		else:
+			arguments = '"' + self.path + '" "' + self.mrcPath + '" "' + self.skeletonPath + '" ' + str(self.threshold) + ' ' + str(self.analysis) + ' "' + self.pdbPath + '"'
+		self.write("Running: " + self.tracerPath + "\n" + arguments + "\n\n")
+		return self.tracerPath + " " + arguments
+
+	def metadata(self):
+		return {'protein': os.path.basename(self.mrcPath),
+			'threshold': self.threshold, 'map': self.mrcPath + ".mrc",
+			'skeleton': self.skeletonPath + ".mrc",
+			'pdb': self.pdbPath + ".pdb", 'analysis': self.analysis}
+
+	def args(self):
+		path = self.path
+		if platform.system() == 'Windows':
+			path += "\\"
+		return [tools.binaryPath(tools.TRACER), path, self.mrcPath,
+			self.skeletonPath, str(self.threshold), str(self.analysis),
+			self.pdbPath]
+
+	def outputPaths(self):
+		return [tools.tracerOutputDir(self.mrcPath, self.threshold)]
+
+	def inputSize(self):
+		return os.path.getsize(self.mrcPath + ".mrc")
+
+	def cacheInputs(self):
+		return [tools.binaryPath(tools.TRACER), self.mrcPath + ".mrc",
+			self.skeletonPath + ".mrc", self.pdbPath + ".pdb"]
+
+class TwisterRun(jobs.Job):
+	"""StrandTwister on sheet map 'mrcPath' at 'threshold' for protein
+	   'pdbPath'; paths are without their extension
+	"""
+
+	tool = tools.TWISTER
+
+	def __init__(self, mrcPath, threshold, pdbPath):
+		self.twisterPath = '"' + tools.binaryPath(tools.TWISTER) + '"'
+		self.path = os.path.dirname(mrcPath)
+		self.pdbPath = pdbPath
+		self.mrcPath = mrcPath
+		self.threshold = threshold
+		jobs.Job.__init__(self, os.path.basename(pdbPath) + "sht_thr_" + threshold)
+
+	def command(self):
+		arguments = '"' + self.pdbPath + '" "' + self.mrcPath + '" ' + str(self.threshold)
+		self.write("Running: " + self.twisterPath + "\n" + arguments + "\n\n")
+		return self.twisterPath + " " + arguments
+
+	def metadata(self):
+		return {'protein': os.path.basename(self.pdbPath),
+			'threshold': self.threshold, 'map': self.mrcPath + ".mrc",
+			'pdb': self.pdbPath + ".pdb"}
+
+	def args(self):
+		return [tools.binaryPath(tools.TWISTER), self.pdbPath,
+			self.mrcPath, str(self.threshold)]
+
+	def outputPaths(self):
+		return [tools.twisterOutputDir(self.mrcPath)]
+
+	def inputSize(self):
+		return os.path.getsize(self.mrcPath + ".mrc")
+
+	def cacheInputs(self):
+		return [tools.binaryPath(tools.TWISTER), self.mrcPath + ".mrc",
+			self.pdbPath + ".pdb"]
+
+class ComparisonRun(jobs.Job):
+	"""leastsquare comparing the helix and strand series that start at
+	   'helixPath' and 'strandPath' (either may be blank) against the
+	   reference 'pdbPath', in run folder 'runDir' (see
+	   tools.newComparisonRun()); paths are without their extension.
+	   'engine' is passed to tools.comparisonEngine(); with the NumPy
+	   engine the comparison runs in a thread of this process, matching
+	   only the axes that pass 'gate' (see tools.parseGate()), with
+	   'curves' also scoring strands as curves and with 'resamples'
+	   adding bootstrap intervals from that many resamples.  What it
+	   finds is kept for the next comparison against the same
+	   reference, which then redoes only what changed; 'changed' is
+	   left holding the names of the result files that did and
+	   'matches' the axisEngine.AxisMatches.  Comparisons in this
+	   process against the same reference take turns with its state.
+	"""
+
+	tool = tools.LEASTSQUARE
+
+	def __init__(self, pdbPath, helixPath, strandPath, outPath, runDir,
+				engine="", gate="", curves=False, resamples=0):
+		self.engine = tools.comparisonEngine(engine)
+		self.gate = gate
+		self.curves = curves
+		self.resamples = resamples
+		self.changed = self.matches = None
+		tools.parseGate(gate)
+		self.tracerPath = '"' + tools.binaryPath(tools.LEASTSQUARE) + '"'
+		self.runDir = runDir
+		#leastsquare is run on the copy of the reference in runDir, so that
+		#it writes to runDir/output
+		self.runPath = tools.runReference(runDir, pdbPath)
+		self.pdbPath = pdbPath
+		self.helixPath = helixPath
+		self.strandPath = strandPath
+		self.outPath = outPath
+		jobs.Job.__init__(self, os.path.basename(pdbPath))
+
+	def command(self):
+		if self.engine != tools.LEASTSQUARE:
+			return None
+		helixPath = self.helixPath or tools.EMPTY
+		strandPath = self.strandPath or tools.EMPTY
+		outPath = self.outPath or tools.EMPTY
+		arguments = '"' + self.runPath +  '" "'  + helixPath + '" "' + strandPath + '" "' + outPath + '"'
+		return self.tracerPath + " " + arguments
+
+	def metadata(self):
+		metadata = {'protein': os.path.basename(self.pdbPath),
+			'reference': self.pdbPath + ".pdb",
+			'helix': self.helixPath, 'strand': self.strandPath,
+			'output': self.outPath}
+		if self.engine != tools.LEASTSQUARE:
+			metadata['engine'] = self.engine
+			if self.gate:
+				metadata['gate'] = self.gate
+			if self.curves:
+				metadata['curves'] = True
+			if self.resamples:
+				metadata['resamples'] = self.resamples
+		return metadata
+
+	def args(self):
+		if self.engine != tools.LEASTSQUARE:
+			return None
+		return [tools.binaryPath(tools.LEASTSQUARE), self.runPath,
+			self.helixPath or tools.EMPTY, self.strandPath or tools.EMPTY,
+			self.outPath or tools.EMPTY]
+
+	def outputPaths(self):
+		paths = [self.runDir]
+		if self.outPath:
+			paths.append(self.outPath)
+		return paths
+
+	def outputDir(self):
+		"""Return the folder leastsquare writes its results to"""
+		return tools.comparisonOutputDir(self.runPath)
+
+	def cacheInputs(self):
+		inputs = [tools.binaryPath(tools.LEASTSQUARE), self.pdbPath + ".pdb"]
+		#leastsquare reads the whole numbered series after each first file
+		for firstPath in (self.helixPath, self.strandPath):
+			if firstPath:
+				inputs.extend(tools.seriesFiles(firstPath + ".pdb"))
+		return inputs
+
+	def cacheCommand(self, command):
+		return command.replace(self.runPath, self.pdbPath)
+
+	def progressParser(self):
+		#leastsquare reports once per traced axis
+		total = 0
+		for firstPath in (self.helixPath, self.strandPath):
+			if firstPath:
+				total += len(tools.seriesFiles(firstPath + ".pdb"))
+		return progress.newParser(self.tool, total=total or None)
+
+	def run(self):
+		import axisEngine
+		def write(text):
+			self.write(text)
+			if self.progress is not None:
+				self.progress.feed(text)
+		statePath = tools.comparisonStatePath(self.pdbPath + ".pdb")
+		lock = _stateLock(statePath)
+		lock.acquire()
+		try:
+			# otherwise a comparison that loaded the state before
+			# another saved it would save over what that one found
+			state = axisEngine.loadState(statePath)
+			matches = axisEngine.compare(self.runPath, self.helixPath,
+				self.strandPath, self.outPath, write,
+				cancelled=lambda: self.cancelReason is not None,
+				gate=tools.parseGate(self.gate), curves=self.curves,
+				resamples=self.resamples, state=state)
+			if matches is not None:
+				axisEngine.saveState(state, statePath)
+		finally:
+			lock.release()
+		if matches is not None:
+			self.changed = state.changed
+			self.matches = matches
+			self.exited(0)
+
+	def exited(self, returncode):
+		jobs.Job.exited(self, returncode)
+		if returncode == 0 and not self.cancelReason:
+			tools.setLatestRun(self.runDir)
+
+# state file path -> lock held while a ComparisonRun uses it
+_stateLocks = {}
+_stateLocksLock = threading.Lock()
+
+def _stateLock(statePath):
+	_stateLocksLock.acquire()
+	try:
+		return _stateLocks.setdefault(statePath, threading.Lock())
+	finally:
+		_stateLocksLock.release()
+
+def addStages(p, mrcPath, skeletonPath, pdbPath, thresholds,
+			twisterThreshold, analysis=0, tracer=TracerRun,
+			twister=TwisterRun, comparison=ComparisonRun):
+	"""Add the trace -> twist -> compare stages for each of
+	   'thresholds' to Pipeline 'p'.
+
+	   StrandTwister runs on the sheet estimate of each trace, at
+	   'twisterThreshold', and is skipped when the tracer wrote none;
+	   the comparison then goes ahead with the helices alone.
+	   'tracer', 'twister' and 'comparison' make the jobs and take the
+	   arguments of TracerRun, TwisterRun and ComparisonRun.
+	"""
+	for threshold in thresholds:
+		def traceJob(threshold=threshold):
+			return tracer(mrcPath, skeletonPath, threshold, analysis, pdbPath)
+		def twistJob(tracerJob):
+			sheetPath = tools.sheetEstimate(tracerJob.outputPaths()[0], mrcPath)
+			if not os.path.isfile(sheetPath):
+				return None
+			return twister(tools.stripExt(sheetPath), twisterThreshold, pdbPath)
+		def compareJob(tracerJob, twisterJob=None):
+			helices = tools.helixFiles(tracerJob.outputPaths()[0])
+			strands = []
+			if twisterJob is not None:
+				strands = tools.strandFiles(twisterJob.outputPaths()[0], pdbPath)
+			if not helices and not strands:
+				return None
+			helixPath = helices and tools.stripExt(helices[0]) or ""
+			strandPath = strands and tools.stripExt(strands[0]) or ""
+			runDir = tools.newComparisonRun(pdbPath + ".pdb")
+			return comparison(pdbPath, helixPath, strandPath, "", runDir)
+		trace = p.add("trace %s" % threshold, traceJob)
+		twist = p.add("twist %s" % threshold, twistJob, [trace])
+		p.add("compare %s" % threshold, compareJob, [trace], [twist])
+	return p
+
+def writeSummary(p, mrcPath):
+	"""Write the summary of Pipeline 'p' to <mrcPath>_pipeline.txt and
+	   return it
+	"""
+	summary = p.summary()
+	f = open(mrcPath + "_pipeline.txt", "w")
+	f.write(summary)
+	f.close()
+	return summary
+
+def newScheduler(limit=None):
+	"""Return a JobScheduler set up like the model panel's: runs wait
+	   for memory, are recorded in the run history and comparisons
+	   have their metrics exported
+	"""
+	import memoryModel
+	scheduler = jobs.JobScheduler(defaultLimit=limit,
+				memoryBudget=memoryModel.defaultBudget(),
+				memory=memoryModel.MemoryModel())
+	try:
+		import jobHistory
+		jobHistory.JobHistory().attach(scheduler)
+	except Exception, e:
+		print >> sys.stderr, "Runs will not be recorded: %s" % e
+	try:
+		import metricsExport
+		metricsExport.MetricsExport().attach(scheduler)
+	except Exception, e:
+		print >> sys.stderr, "Metrics will not be exported: %s" % e
+	return scheduler
+
+def pruneRuns(pdbPath, keep, scheduler=None, history=None):
+	"""Delete all but the 'keep' newest comparison runs against
+	   'pdbPath' (see tools.pruneComparisonRuns()), other than those
+	   the unfinished jobs of 'scheduler' or the runs recorded in
+	   'history', a jobHistory.JobHistory, still refer to.  Returns
+	   the run folders deleted.
+	"""
+	protected = set()
+	if scheduler is not None:
+		for job in scheduler.jobs():
+			if not job.isDone():
+				protected.update(job.outputPaths())
+	if history is not None:
+		protected.update(history.outputPaths())
+	return tools.pruneComparisonRuns(pdbPath, keep, protected)
+
+def follow(runs, isDone, quiet=False, interval=0.2):
+	"""Print the output of 'runs' (jobs, or a callable returning them)
+	   until 'isDone' returns true
+	"""
+	partial = {}
+	while True:
+		done = isDone()
+		if callable(runs):
+			current = runs()
+		else:
+			current = runs
+		for job in current:
+			text = job.readOutput()
+			if quiet or not text:
+				continue
+			lines = (partial.pop(job, "") + text).split("\n")
+			if lines[-1]:
+				partial[job] = lines[-1]
+			for line in lines[:-1]:
+				sys.stdout.write("[%s] %s\n" % (job.name, line))
+		sys.stdout.flush()
+		if done:
+			break
+		time.sleep(interval)
+	for job, line in partial.items():
+		sys.stdout.write("[%s] %s\n" % (job.name, line))
+
+def _report(runs):
+	print "job\tstate\tseconds\toutput"
+	failed = 0
+	for job in runs:
+		print "%s\t%s\t%.1f\t%s" % (job.name, job.state,
+				job.elapsed() or 0.0, " ".join(job.outputPaths()))
+		if job.state != jobs.FINISHED:
+			failed += 1
+	return failed and 1 or 0
+
+USAGE = {
+	'trace': 4,
+	'twist': 3,
+	'compare': (1, 3),
+	'pipeline': 5,
+	'prune': 1,
+}
+
+def main(argv):
+	import getopt
+	if len(argv) < 2 or argv[1] not in USAGE:
+		print >> sys.stderr, __doc__
+		return 2
+	action = argv[1]
+	try:
+		opts, args = getopt.getopt(argv[2:], "ab:ce:g:j:n:o:q")
+	except getopt.GetoptError, e:
+		print >> sys.stderr, e
+		print >> sys.stderr, __doc__
+		return 2
+	counts = USAGE[action]
+	if isinstance(counts, int):
+		counts = (counts, counts)
+	if not counts[0] <= len(args) <= counts[1]:
+		print >> sys.stderr, __doc__
+		return 2
+	analysis = 0
+	resamples = 0
+	curves = False
+	engine = ""
+	gate = ""
+	limit = None
+	keep = 10
+	outPath = ""
+	quiet = False
+	for opt, val in opts:
+		if opt == "-a":
+			analysis = 1
+		elif opt == "-b":
+			resamples = int(val)
+		elif opt == "-c":
+			curves = True
+		elif opt == "-e":
+			engine = val
+		elif opt == "-g":
+			gate = val
+		elif opt == "-j":
+			limit = int(val)
+		elif opt == "-n":
+			keep = int(val)
+		elif opt == "-o":
+			outPath = val
+		elif opt == "-q":
+			quiet = True
+	paths = [os.path.abspath(_stem(arg)) for arg in args]
+	if action == "prune":
+		import jobHistory
+		for runDir in pruneRuns(paths[0] + ".pdb", keep,
+						history=jobHistory.JobHistory()):
+			print "deleted", runDir
+		return 0
+	try:
+		if action in ("trace", "pipeline"):
+			thresholds = tools.parseThresholds(args[3])
+		if action == "pipeline":
+			tools.parseThresholds(args[4])
+	except ValueError, e:
+		print >> sys.stderr, "Bad threshold: %s" % e
+		return 2
+	try:
+		tools.comparisonEngine(engine)
+	except ValueError, e:
+		print >> sys.stderr, e
+		return 2
+	try:
+		tools.parseGate(gate)
+	except ValueError, e:
+		print >> sys.stderr, "Bad gate: %s" % e
+		return 2
+
+	scheduler = newScheduler(limit)
+	if action == "pipeline":
+		mrcPath, skeletonPath, pdbPath = paths[:3]
+		p = pipeline.Pipeline(scheduler, os.path.basename(mrcPath))
+		addStages(p, mrcPath, skeletonPath, pdbPath, thresholds,
+			args[4], analysis, comparison=lambda *args:
+				ComparisonRun(engine=engine, gate=gate, curves=curves,
+						resamples=resamples, *args))
+		p.start()
+		runs = lambda: [s.job for s in p.stages if s.job is not None]
+		follow(runs, p.isDone, quiet)
+		print writeSummary(p, mrcPath),
+		failed = [s for s in p.stages if s.state != jobs.FINISHED
+					and s.error != "nothing to do"]
+		return failed and 1 or 0
+
+	if action == "trace":
+		mrcPath, skeletonPath, pdbPath = paths[:3]
+		runs = [TracerRun(mrcPath, skeletonPath, threshold, analysis,
+				pdbPath) for threshold in thresholds]
+	elif action == "twist":
+		mrcPath, pdbPath = paths[:2]
+		runs = [TwisterRun(mrcPath, args[2], pdbPath)]
+	else:
+		pdbPath = paths[0]
+		series = [""] * 2
+		for i, arg in enumerate(args[1:]):
+			if arg not in ("-", tools.EMPTY):
+				series[i] = paths[i+1]
+		if outPath:
+			outPath = os.path.abspath(tools.stripExt(outPath)) + ".txt"
+		runDir = tools.newComparisonRun(pdbPath + ".pdb")
+		runs = [ComparisonRun(pdbPath, series[0], series[1], outPath,
+					runDir, engine, gate, curves, resamples)]
+	for job in runs:
+		scheduler.submit(job)
+	follow(runs, lambda: not [job for job in runs if not job.isDone()],
+								quiet)
+	return _report(runs)
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -0,0 +1,77 @@
+"""tests of the NumPy axis comparison engine
+
+Run from the extension folder with
+
+	python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import axisEngine
+
+class BootstrapTest(unittest.TestCase):
+	"""Intervals of traces drawn with known noise about a known line"""
+
+	traces = 200
+	points = 16
+	noise = 0.7
+	resamples = 200
+
+	def setUp(self):
+		random = numpy.random.RandomState(1)
+		p0 = numpy.array([0.0, 0.0, 0.0])
+		p1 = numpy.array([0.0, 0.0, 20.0])
+		# the line the traces are drawn about: off the true axis,
+		# tilted and overshooting both ends
+		q0 = numpy.array([1.5, 0.0, -2.0])
+		q1 = numpy.array([1.5, 0.8, 22.0])
+		self.truth = axisEngine.pairErrors(p0[None], p1[None], q0[None],
+								q1[None])
+		along = numpy.linspace(0, 1, self.points)[:, None]
+		self.matches = []
+		for i in range(self.traces):
+			true = axisEngine.Axis(axisEngine.HELIX, "1", None)
+			true.start, true.end = p0, p1
+			trace = axisEngine.Axis(axisEngine.HELIX, "t%d" % i, q0
+				+ along * (q1 - q0)
+				+ random.normal(0, self.noise, (self.points, 3)))
+			axisEngine.fitAxes([trace])
+			errors = axisEngine.pairErrors(p0[None], p1[None],
+					trace.start[None], trace.end[None])
+			self.matches.append(axisEngine.AxisMatch(true, trace,
+				dict([(name, float(v[0])) for name, v in errors.items()])))
+		axisEngine.bootstrap(self.matches, self.resamples)
+
+	def coverage(self, name):
+		truth = self.truth[name][0]
+		return numpy.mean([m.intervals[name][0] <= truth
+				<= m.intervals[name][1] for m in self.matches])
+
+	def testDistancesCovered(self):
+		for name in ("twoWayDistance", "crossDisplacement",
+						"lengthDisplacement"):
+			self.assertTrue(0.8 <= self.coverage(name) <= 1.0,
+					"%s: %.2f" % (name, self.coverage(name)))
+
+	def testLengthsLeanShort(self):
+		# the documented limitation of bootstrap()
+		coverage = self.coverage("lengthTrace")
+		self.assertTrue(coverage < 0.8, coverage)
+		short = numpy.mean([sum(m.intervals["lengthTrace"]) / 2
+			< m.errors["lengthTrace"] for m in self.matches])
+		self.assertTrue(short > 0.5, short)
+
+	def testRepeatable(self):
+		intervals = [dict(m.intervals) for m in self.matches]
+		for match in self.matches:
+			match.intervals = {}
+		axisEngine.bootstrap(self.matches, self.resamples)
+		self.assertEqual(intervals, [m.intervals for m in self.matches])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,158 @@
+"""tests of the per-SSE metrics export
+
+Run from the extension folder with
+
+	python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metricsExport
+
+# leastsquare's output for a comparison matching true helices 1 and 3
+# and true sheet 1, of true helices 1-3 and true sheet 1-2
+LEASTSQUARE_LOG = """\
+Reading true helices
+For true axis p and traced axis q: trueHelix1 --> trace_HLX0
+Length of p is 15.003
+Length of q is 19.695
+Length of s is 15.003
+Cross displacement is 1.544
+Longitudinal displacement is 4.685
+Proportion of incorrect length to combined length of axes is 0.135
+For true axis p and traced axis q: trueHelix3 --> trace_HLX2
+Length of p is 27.000
+Length of q is 30.993
+Length of s is 27.000
+Cross displacement is 1.359
+Longitudinal displacement is 3.987
+Proportion of incorrect length to combined length of axes is 0.069
+For true axis p and traced axis q: trueSheet1 --> strand1
+Length of p is 9.900
+Length of q is 11.192
+Length of s is 9.900
+Cross displacement is 0.378
+Longitudinal displacement is 1.267
+Proportion of incorrect length to combined length of axes is 0.061
+"""
+
+def writeAxis(path, start, end):
+	f = open(path, "w")
+	for i, (x, y, z) in enumerate((start, end)):
+		f.write("ATOM  %5d  CA  ALA A%4d    %8.3f%8.3f%8.3f  1.00  0.00"
+			"           C\n" % (i+1, i+1, x, y, z))
+	f.write("END\n")
+	f.close()
+
+class LeastsquareRowsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.outputDir = tempfile.mkdtemp()
+		for name in ("trueHelix1", "trueHelix2", "trueHelix3",
+				"trueSheet1", "trueSheet2"):
+			writeAxis(os.path.join(self.outputDir, name + ".pdb"),
+						(0.0, 0.0, 0.0), (0.0, 3.0, 4.0))
+		for name in ("traceHelix1", "traceHelix3", "traceSheet1"):
+			writeAxis(os.path.join(self.outputDir, name + ".pdb"),
+						(0.0, 0.0, 0.0), (1.0, 0.0, 0.0))
+		self.rows = list(metricsExport.logRows(
+			LEASTSQUARE_LOG.splitlines(True), self.outputDir))
+
+	def tearDown(self):
+		shutil.rmtree(self.outputDir)
+
+	def testOneRowPerSse(self):
+		self.assertEqual([(r['sse_type'], r['true_sse'], r['matched'])
+				for r in self.rows],
+			[("helix", "1", 1), ("helix", "3", 1), ("sheet", "1", 1),
+			("helix", "2", 0), ("sheet", "2", 0)])
+
+	def testMatchedValues(self):
+		row = self.rows[1]
+		self.assertEqual(row['trace_sse'], "trace_HLX2")
+		self.assertEqual(row['length_true'], 27.0)
+		self.assertEqual(row['length_trace'], 30.993)
+		self.assertEqual(row['cross_displacement'], 1.359)
+		self.assertEqual(row['length_displacement'], 3.987)
+		self.assertEqual(row['length_error_proportion'], 0.069)
+
+	def testFileErrors(self):
+		# leastsquare does not print these; they come from its files
+		for row in self.rows[:3]:
+			self.assertAlmostEqual(row['angle_error'], 90.0)
+			self.assert_(row['distance_error'] > 0)
+		for row in self.rows[3:]:
+			self.assertEqual(row.get('angle_error'), None)
+			self.assertEqual(row.get('distance_error'), None)
+
+	def testUnmatchedValues(self):
+		row = self.rows[3]
+		self.assertEqual(row.get('trace_sse'), None)
+		self.assertAlmostEqual(row['length_true'], 5.0)
+
+	def testLogOnly(self):
+		rows = list(metricsExport.logRows(LEASTSQUARE_LOG.splitlines(True)))
+		self.assertEqual(len(rows), 3)
+		self.assertEqual(rows[0].get('angle_error'), None)
+
+class ExportTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def testRoundTrip(self):
+		export = metricsExport.MetricsExport(self.folder)
+		rows = list(metricsExport.logRows(LEASTSQUARE_LOG.splitlines(True)))
+		for row in rows:
+			row.update({'run': "r1", 'protein': "1ABC", 'seconds': 2.5})
+		export.write(rows)
+		export.write([dict(rows[0], run="r2", matched=0, f1=0.0)])
+		export.close()
+		columns = metricsExport.readColumns(self.folder)
+		self.assertEqual(columns['run'], ["r1", "r1", "r1", "r2"])
+		self.assertEqual(columns['matched'], [1, 1, 1, 0])
+		self.assertEqual(columns['f1'], [None, None, None, 0.0])
+		self.assertEqual(columns['cross_displacement'][:3],
+						[1.544, 1.359, 0.378])
+		f = open(os.path.join(self.folder, metricsExport.CSV_FILE))
+		lines = f.read().splitlines()
+		f.close()
+		self.assertEqual(len(lines), 5)
+		self.assertEqual(lines[0].split(","),
+				[name for name, kind in metricsExport.COLUMNS])
+
+	def testFailedWrite(self):
+		export = metricsExport.MetricsExport(self.folder)
+		part = export._part = metricsExport.RawPart(
+				os.path.join(self.folder, "part-1"))
+		export.write([{'run': "r1", 'matched': 1}])
+		# a write that stopped part of the way through
+		f = open(os.path.join(part.path, "matched.bin"), "ab")
+		f.write("\1\0")
+		f.close()
+		part.write([{'run': "r2", 'matched': 0}])
+		columns = metricsExport.readColumns(self.folder)
+		self.assertEqual(columns['run'], ["r1", "r2"])
+		self.assertEqual(columns['matched'], [1, 0])
+
+	def testFailedWriteDropsPart(self):
+		export = metricsExport.MetricsExport(self.folder)
+		export.write([{'run': "r1"}])
+		first = export._part
+		# a value the CSV takes but the columns do not
+		self.assertRaises(TypeError, export.write, [{'matched': "1"}])
+		self.assertEqual(export._part, None)
+		export.write([{'run': "r2"}])
+		self.assertNotEqual(export._part, first)
+
+if __name__ == "__main__":
+	unittest.main()
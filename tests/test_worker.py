@@ -0,0 +1,200 @@
+"""tests of running jobs on workers
+
+Two workers listen on ephemeral loopback ports, each mirroring files
+under a root of its own, and run a shell script in place of the tracer.
+Run from the extension folder with
+
+	python -m unittest discover tests
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jobs
+import tools
+import worker
+
+# copies its first argument into the folder given as its second, after
+# pausing for as many seconds as its third says
+SCRIPT = """\
+#!/bin/sh
+echo "reading $1"
+sleep $3
+cat "$1" > "$2/copy.txt"
+echo "wrote $2/copy.txt"
+"""
+
+class CopyJob(jobs.Job):
+	tool = tools.TRACER
+
+	def __init__(self, script, inputPath, outDir, pause=0):
+		jobs.Job.__init__(self, "copy %s" % os.path.basename(inputPath))
+		self.script = script
+		self.inputPath = inputPath
+		self.outDir = outDir
+		self.pause = pause
+		if not os.path.isdir(outDir):
+			os.makedirs(outDir)
+
+	def args(self):
+		return [self.script, self.inputPath, self.outDir, str(self.pause)]
+
+	def command(self):
+		return " ".join(['"%s"' % arg for arg in self.args()])
+
+	def progressParser(self):
+		return None
+
+	def outputPaths(self):
+		return [self.outDir]
+
+def unusedAddress():
+	"""Return a loopback address nothing listens on"""
+	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	sock.bind(("127.0.0.1", 0))
+	address = sock.getsockname()
+	sock.close()
+	return address
+
+class WorkerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.script = os.path.join(self.dir, "tracer.sh")
+		f = open(self.script, "w")
+		f.write(SCRIPT)
+		f.close()
+		os.chmod(self.script, 0755)
+		self.input = os.path.join(self.dir, "map.txt")
+		f = open(self.input, "w")
+		f.write("density\n")
+		f.close()
+		self.tools = worker.TOOLS.copy()
+		worker.TOOLS[tools.TRACER] = self.script
+		self.workers = []
+		for name in ("a", "b"):
+			root = os.path.join(self.dir, "worker-" + name)
+			self.workers.append(worker.Worker(port=0, slots=1,
+							root=root).start())
+		self.addresses = [w.address for w in self.workers]
+		self.jobs = []
+
+	def tearDown(self):
+		for job in self.jobs:
+			if job.process is not None:
+				job.process.wait()
+		for w in self.workers:
+			w.sock.close()
+		worker.TOOLS.clear()
+		worker.TOOLS.update(self.tools)
+		shutil.rmtree(self.dir)
+
+	def newJob(self, name, pause=0):
+		job = CopyJob(self.script, self.input,
+				os.path.join(self.dir, "out", name), pause)
+		self.jobs.append(job)
+		return job
+
+	def launch(self, pool, job):
+		job.process = pool.launch(job)
+		return job.process
+
+	def testSlots(self):
+		pool = worker.WorkerPool(self.addresses)
+		first = self.launch(pool, self.newJob("1", 1))
+		second = self.launch(pool, self.newJob("2", 1))
+		self.assertEqual(set([first.slot.address, second.slot.address]),
+							set(self.addresses))
+		# both workers are full
+		self.assertEqual(self.launch(pool, self.newJob("3")), None)
+		first.wait()
+		second.wait()
+		self.assertEqual(pool.busy, dict.fromkeys(self.addresses, 0))
+		self.assertNotEqual(self.launch(pool, self.newJob("4")), None)
+
+	def testCapacityFromWorker(self):
+		self.workers[0].slots = 2
+		pool = worker.WorkerPool(self.addresses[:1])
+		first = self.launch(pool, self.newJob("1", 1))
+		self.assertEqual(pool.capacity[self.addresses[0]], 2)
+		self.assertNotEqual(self.launch(pool, self.newJob("2", 1)), None)
+		self.assertEqual(self.launch(pool, self.newJob("3")), None)
+
+	def testBusy(self):
+		self.workers[0].running = self.workers[0].slots
+		pool = worker.WorkerPool(self.addresses)
+		process = self.launch(pool, self.newJob("1"))
+		self.assertEqual(process.slot.address, self.addresses[1])
+		# busy is not down
+		self.assertEqual(pool.down, {})
+		self.assertEqual(pool.busy[self.addresses[0]], 0)
+
+	def testDown(self):
+		dead = unusedAddress()
+		pool = worker.WorkerPool([dead, self.addresses[1]])
+		job = self.newJob("1")
+		process = self.launch(pool, job)
+		self.assertEqual(process.slot.address, self.addresses[1])
+		self.assert_(dead in pool.down)
+		self.assert_("not using worker" in job.output())
+		process.wait()
+		# left alone until retryAfter has passed
+		process = self.launch(pool, self.newJob("2"))
+		self.assertEqual(process.slot.address, self.addresses[1])
+		self.assertEqual(pool.busy[dead], 0)
+
+	def testStreaming(self):
+		pool = worker.WorkerPool(self.addresses[:1])
+		job = self.newJob("1", 1)
+		process = self.launch(pool, job)
+		line = process.stdout.readline()
+		self.assertEqual(line, "reading %s\n"
+				% self.workers[0].mirror(self.input))
+		# still running: the output came as it was written
+		self.assertEqual(process.poll(), None)
+		rest = process.stdout.read()
+		self.assertEqual(process.wait(), 0)
+		self.assert_(rest.startswith("wrote "))
+
+	def testOutputsReturned(self):
+		pool = worker.WorkerPool(self.addresses[:1])
+		job = self.newJob("1")
+		process = self.launch(pool, job)
+		process.stdout.read()
+		self.assertEqual(process.wait(), 0)
+		copy = os.path.join(job.outDir, "copy.txt")
+		self.assertEqual(open(copy).read(), "density\n")
+		# made in the worker's mirror, not here
+		self.assert_(os.path.isfile(self.workers[0].mirror(copy)))
+
+	def testSchedulerRemote(self):
+		scheduler = jobs.JobScheduler(defaultLimit=2,
+				workers=worker.WorkerPool(self.addresses))
+		job = self.newJob("1")
+		scheduler.submit(job)
+		self.assert_(job.wait(30))
+		self.assertEqual(job.state, jobs.FINISHED)
+		self.assert_(isinstance(job.process, worker.RemoteProcess))
+		self.assertEqual(open(os.path.join(job.outDir,
+					"copy.txt")).read(), "density\n")
+
+	def testSchedulerLocalFallback(self):
+		scheduler = jobs.JobScheduler(defaultLimit=2,
+				workers=worker.WorkerPool([unusedAddress()]))
+		job = self.newJob("1")
+		scheduler.submit(job)
+		self.assert_(job.wait(30))
+		self.assertEqual(job.state, jobs.FINISHED)
+		self.failIf(isinstance(job.process, worker.RemoteProcess))
+		self.assert_("not using worker" in job.readOutput())
+		self.assertEqual(open(os.path.join(job.outDir,
+					"copy.txt")).read(), "density\n")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,355 @@
+"""locate the external SSETracer/StrandTwister/leastsquare binaries and
+build their command lines
+
+Nothing in here imports chimera, so it can be used from batch scripts
+that run outside of Chimera as well as from the model panel.
+"""
+
+import os
+import platform
+import shutil
+import threading
+import time
+
+TRACER = "tracer_v3_command"
+TWISTER = "strandtwister_v2_command"
+LEASTSQUARE = "leastsquare"
+
+# the in-process alternative to LEASTSQUARE; see axisEngine.py
+NUMPY = "numpy"
+
+# placeholder the binaries expect for an optional argument left blank
+EMPTY = "Empty"
+
+# folder next to the reference PDBs that holds a folder for each of them
+# (named after the reference) of one folder per comparison run, and the
+# pointer in that to the most recent successful run
+RUNS = "output_runs"
+LATEST = "latest"
+
+# the marker of a run that has not yet succeeded, and how long (seconds)
+# such a run is taken to be still going; see pruneComparisonRuns()
+UNFINISHED = ".unfinished"
+STALE_RUN = 24 * 3600
+
+# added to the reference's name for the file in the runs folder holding
+# what the NumPy engine found last time; see axisEngine.ComparisonState
+STATE = ".state"
+
+def binaryPath(name):
+	"""Return the full path of the bundled binary 'name'.
+
+	   'name' is one of TRACER, TWISTER or LEASTSQUARE; everywhere
+	   other than Linux the '.exe' build is used.
+	"""
+	if platform.system() != 'Linux':
+		name += ".exe"
+	return os.path.dirname(os.path.realpath(__file__)) + os.sep + name
+
+def comparisonEngine(choice=""):
+	"""Return what axis comparisons are run with: 'choice' (LEASTSQUARE
+	   or NUMPY) or, if it is blank, leastsquare where its binary is
+	   here and the NumPy engine where it is not
+	"""
+	if choice:
+		if choice not in (LEASTSQUARE, NUMPY):
+			raise ValueError("no comparison engine %r" % choice)
+		return choice
+	if os.path.isfile(binaryPath(LEASTSQUARE)):
+		return LEASTSQUARE
+	return NUMPY
+
+def stripExt(path):
+	"""file path and name without extension"""
+	return os.path.splitext(path)[0]
+
+def tracerOutputDir(mrcPath, threshold):
+	"""Return the folder the tracer writes for map 'mrcPath' (without
+	   extension) at 'threshold'
+	"""
+	return stripExt(mrcPath) + "_thr_" + str(threshold) + "_outFiles"
+
+def sheetEstimate(tracerDir, mrcPath):
+	"""Return the sheet density map the tracer wrote in 'tracerDir'"""
+	return os.path.join(tracerDir, os.path.basename(stripExt(mrcPath))
+						+ "_SHTestimate_final.mrc")
+
+def helixFiles(tracerDir):
+	"""Return the helix sticks the tracer wrote in 'tracerDir', in
+	   numerical order
+	"""
+	helices = []
+	if os.path.isdir(tracerDir):
+		for name in os.listdir(tracerDir):
+			stem, ext = os.path.splitext(name)
+			number = stem.rsplit("_HLX", 1)[-1]
+			if ext == ".pdb" and "_HLX" in stem and number.isdigit():
+				helices.append((int(number), os.path.join(tracerDir, name)))
+	helices.sort()
+	return [path for number, path in helices]
+
+def twisterOutputDir(mrcPath):
+	"""Return the folder StrandTwister writes for map 'mrcPath'"""
+	return stripExt(mrcPath) + "twist"
+
+def strandFiles(twisterDir, pdbPath):
+	"""Return the strand models StrandTwister wrote in 'twisterDir'
+	   for the protein 'pdbPath', in natural order
+	"""
+	import re
+	pdbID = os.path.basename(stripExt(pdbPath))
+	strands = []
+	if os.path.isdir(twisterDir):
+		for name in os.listdir(twisterDir):
+			if name.startswith(pdbID) and re.search(r"\d\.pdb$", name) \
+			and "CAchain" not in name:
+				key = [part.isdigit() and int(part) or part
+					for part in re.split(r"(\d+)", name)]
+				strands.append((key, os.path.join(twisterDir, name)))
+	strands.sort()
+	return [path for key, path in strands]
+
+def comparisonOutputDir(pdbPath):
+	"""Return the 'output' folder leastsquare writes next to 'pdbPath'"""
+	return os.path.join(os.path.dirname(os.path.abspath(pdbPath)), "output")
+
+def comparisonRunsDir(pdbPath):
+	"""Return the folder of the comparison runs against 'pdbPath'"""
+	return os.path.join(os.path.dirname(os.path.abspath(pdbPath)), RUNS,
+				os.path.basename(stripExt(pdbPath)))
+
+def newComparisonRun(pdbPath):
+	"""Make a new run folder for comparing against 'pdbPath'.
+
+	   leastsquare writes its results to an 'output' folder next to
+	   the reference PDB, so the reference is linked (copied where
+	   links are not available) into the run folder and leastsquare is
+	   pointed at that; see runReference().  Runs are named after the
+	   time they were made and marked unfinished until setLatestRun()
+	   is called for them.  Returns the run folder.
+	"""
+	runsDir = comparisonRunsDir(pdbPath)
+	if not os.path.isdir(runsDir):
+		os.makedirs(runsDir)
+	runId = time.strftime("%Y%m%d-%H%M%S")
+	suffix = 1
+	while True:
+		runDir = os.path.join(runsDir, runId)
+		try:
+			os.mkdir(runDir)
+			break
+		except OSError:
+			if not os.path.isdir(runDir):
+				raise
+			suffix += 1
+			runId = time.strftime("%Y%m%d-%H%M%S") + "-%d" % suffix
+	open(os.path.join(runDir, UNFINISHED), "w").close()
+	linked = os.path.join(runDir, os.path.basename(pdbPath))
+	try:
+		os.link(pdbPath, linked)
+	except (AttributeError, OSError):
+		shutil.copy2(pdbPath, linked)
+	os.mkdir(comparisonOutputDir(linked))
+	return runDir
+
+def runReference(runDir, pdbPath):
+	"""Return the copy of reference 'pdbPath' in 'runDir'"""
+	return os.path.join(runDir, os.path.basename(pdbPath))
+
+def setLatestRun(runDir):
+	"""Atomically point the 'latest' entry of the runs folder at 'runDir'
+
+	   'latest' is a symbolic link where the platform has them and
+	   a text file holding the run name otherwise.  The run is then no
+	   longer unfinished.
+	"""
+	runsDir, runId = os.path.split(runDir)
+	latest = os.path.join(runsDir, LATEST)
+	temp = os.path.join(runsDir, ".%s-%d-%d" % (LATEST, os.getpid(),
+					threading.current_thread().ident))
+	if hasattr(os, 'symlink'):
+		if os.path.lexists(temp):
+			os.remove(temp)
+		os.symlink(runId, temp)
+	else:
+		f = open(temp, "w")
+		f.write(runId + "\n")
+		f.close()
+		if os.path.exists(latest):
+			# Windows cannot rename over an existing file
+			os.remove(latest)
+	os.rename(temp, latest)
+	marker = os.path.join(runDir, UNFINISHED)
+	if os.path.exists(marker):
+		os.remove(marker)
+
+def _runOrder(runId):
+	# runs sort by the time they were made, then by their suffix
+	parts = runId.split("-")
+	return parts[:2], [int(p) for p in parts[2:] if p.isdigit()]
+
+def pruneComparisonRuns(pdbPath, keep, protected=()):
+	"""Delete all but the 'keep' newest comparison runs against
+	   'pdbPath'; a 'keep' of 0 deletes none.
+
+	   Never deleted are the run 'latest' points at, the runs in
+	   'protected' (folders still referred to, say by unfinished jobs
+	   or the run history) and unfinished runs made less than
+	   STALE_RUN seconds ago, which may still be going.  Returns the
+	   run folders deleted.
+	"""
+	runsDir = comparisonRunsDir(pdbPath)
+	if keep <= 0 or not os.path.isdir(runsDir):
+		return []
+	protected = set([os.path.realpath(path) for path in protected])
+	latest = _latestIn(runsDir)
+	runs = []
+	for runId in os.listdir(runsDir):
+		runDir = os.path.join(runsDir, runId)
+		if runId[:1].isdigit() and os.path.isdir(runDir) \
+		and not os.path.islink(runDir):
+			runs.append((_runOrder(runId), runDir))
+	runs.sort()
+	deleted = []
+	now = time.time()
+	for order, runDir in runs[:max(len(runs) - keep, 0)]:
+		if runDir == latest or os.path.realpath(runDir) in protected:
+			continue
+		try:
+			if now - os.path.getmtime(os.path.join(runDir,
+						UNFINISHED)) < STALE_RUN:
+				continue
+		except OSError:
+			pass
+		shutil.rmtree(runDir, ignore_errors=True)
+		deleted.append(runDir)
+	return deleted
+
+def comparisonStatePath(pdbPath):
+	"""Return where the NumPy engine keeps its comparison state for
+	   reference 'pdbPath'
+	"""
+	return comparisonRunsDir(pdbPath) + STATE
+
+def latestRun(pdbPath):
+	"""Return the most recent successful run folder for 'pdbPath',
+	   or None if it has not been compared yet
+	"""
+	return _latestIn(comparisonRunsDir(pdbPath))
+
+def _latestIn(runsDir):
+	latest = os.path.join(runsDir, LATEST)
+	if os.path.islink(latest):
+		runId = os.readlink(latest)
+	elif os.path.isfile(latest):
+		f = open(latest)
+		runId = f.read().strip()
+		f.close()
+	else:
+		return None
+	return os.path.join(runsDir, runId)
+
+def seriesFiles(firstPath):
+	"""Return the numbered series of files that starts with 'firstPath'.
+
+	   For '.../helix1.pdb' this is every '.../helix<N>.pdb' in the same
+	   folder, in numerical order; a 'firstPath' without a number is
+	   returned on its own.
+	"""
+	folder, name = os.path.split(firstPath)
+	stem, ext = os.path.splitext(name)
+	prefix = stem.rstrip("0123456789")
+	if prefix == stem or not os.path.isdir(folder or os.curdir):
+		return [firstPath]
+	series = []
+	for fileName in os.listdir(folder or os.curdir):
+		fileStem, fileExt = os.path.splitext(fileName)
+		number = fileStem[len(prefix):]
+		if fileExt == ext and fileStem.startswith(prefix) \
+		and number.isdigit():
+			series.append((int(number), os.path.join(folder, fileName)))
+	series.sort()
+	return [path for number, path in series]
+
+def comparisonArgs(pdbPath, helixPath="", strandPath="", outPath=""):
+	"""Return the argument list for running leastsquare.
+
+	   'pdbPath' is the reference (true) structure, 'helixPath' and
+	   'strandPath' are the first files of the traced helix and
+	   strand series, and 'outPath' is the optional text report.
+	   Blank optional arguments are passed as EMPTY.
+	"""
+	outPath = stripExt(outPath)
+	if outPath:
+		outPath += ".txt"
+	return [binaryPath(LEASTSQUARE), stripExt(pdbPath),
+		stripExt(helixPath) or EMPTY, stripExt(strandPath) or EMPTY,
+		outPath or EMPTY]
+
+def parseThresholds(text):
+	"""Return the thresholds described by 'text' as a list of strings.
+
+	   'text' is a single value, a list of values separated by commas
+	   and/or spaces, or 'start:stop:step' for every step from start
+	   up to and including stop.  Raises ValueError for anything else.
+	"""
+	text = text.strip()
+	if ":" in text:
+		try:
+			start, stop, step = [float(v) for v in text.split(":")]
+		except ValueError:
+			raise ValueError("threshold range must be start:stop:step")
+		if step <= 0 or stop < start:
+			raise ValueError("threshold range must go up from start to"
+						" stop by a positive step")
+		#round to the step's precision so folder names stay short
+		decimals = 0
+		for v in text.split(":"):
+			if "." in v:
+				decimals = max(decimals, len(v.split(".")[1].strip()))
+		count = int((stop - start) / step + 1e-9) + 1
+		thresholds = []
+		for i in range(count):
+			value = "%.*f" % (decimals, start + i * step)
+			if "." in value:
+				value = value.rstrip("0").rstrip(".")
+			thresholds.append(value)
+		return thresholds
+	values = text.replace(",", " ").split()
+	if not values:
+		raise ValueError("no threshold given")
+	for v in values:
+		float(v)
+	return values
+
+# the settings parseGate() understands, and the matchAxes() arguments
+# they become
+GATE_SETTINGS = {"distance": "maxDistance", "overlap": "minOverlap",
+							"angle": "maxAngle"}
+
+def parseGate(text):
+	"""Return the matching gate described by 'text' as keyword
+	   arguments for axisEngine.matchAxes().
+
+	   'text' is 'name=value' settings separated by commas and/or
+	   spaces: 'distance' (the furthest apart, in angstroms, a true
+	   and a traced axis may be and still be matched), 'overlap' (how
+	   much they must at least overlap) and 'angle' (the most degrees
+	   their directions may differ by).  Settings left out keep their
+	   defaults; a blank 'text' leaves them all.  Raises ValueError
+	   for anything else.
+	"""
+	gate = {}
+	for setting in text.replace(",", " ").split():
+		name, sep, value = setting.partition("=")
+		if not sep or name not in GATE_SETTINGS:
+			raise ValueError("gate settings are %s=VALUE"
+				% "/".join(sorted(GATE_SETTINGS)))
+		try:
+			value = float(value)
+		except ValueError:
+			raise ValueError("gate %s must be a number" % name)
+		if value < 0:
+			raise ValueError("gate %s must not be negative" % name)
+		gate[GATE_SETTINGS[name]] = value
+	return gate
@@ -0,0 +1,630 @@
+"""run tool jobs on other machines
+
+A worker daemon listens on a TCP port and runs tracer, twister and
+leastsquare jobs sent to it, one per connection:
+
+	python worker.py [-H HOST] [-p PORT] [-j SLOTS] [-k KEY] [-d ROOT] [-s]
+
+Messages in both directions are JSON objects, one per line, with file
+and output data base64 encoded.  A job names its tool, its arguments,
+the files it reads and the files and folders it writes, all as paths on
+the submitting machine.  Unless it is started with -s, saying that it
+shares a file system with its clients, the worker keeps a mirror of
+those paths under ROOT and touches nothing outside it: it asks for whichever
+inputs it does not already have (by size and modification time), runs
+the tool with absolute paths in its arguments moved into the mirror,
+streams the tool's output back as it comes, and sends the outputs back
+as a tar archive once the tool has exited.
+
+A worker without a KEY only listens on the loopback interface.  It runs
+at most SLOTS jobs at once and turns further ones away as busy.
+
+On the submitting side, a WorkerPool hands out free worker slots and
+RemoteProcess stands in for subprocess.Popen, so the JobScheduler runs
+remote jobs like local ones.
+"""
+
+import base64
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import tools
+
+PORT = 7341
+CHUNK = 1 << 20
+
+# the only programs a worker will run
+TOOLS = {
+	tools.TRACER: tools.binaryPath(tools.TRACER),
+	tools.TWISTER: tools.binaryPath(tools.TWISTER),
+	tools.LEASTSQUARE: tools.binaryPath(tools.LEASTSQUARE),
+}
+
+# hosts a worker without a key may listen on
+LOOPBACK = ("127.0.0.1", "::1", "localhost")
+
+class WorkerBusy(IOError):
+	"""The worker is already running as many jobs as it has slots"""
+
+class Connection(object):
+	"""JSON messages over a socket"""
+
+	def __init__(self, sock):
+		self.sock = sock
+		self._in = sock.makefile("rb")
+		self._lock = threading.Lock()
+
+	def send(self, message):
+		data = json.dumps(message) + "\n"
+		self._lock.acquire()
+		try:
+			self.sock.sendall(data)
+		finally:
+			self._lock.release()
+
+	def receive(self):
+		"""Return the next message, or None once the other end has
+		   closed the connection
+		"""
+		line = self._in.readline()
+		if not line:
+			return None
+		return json.loads(line)
+
+	def sendFile(self, f, kind):
+		"""Send the contents of the open file 'f' as 'kind' messages
+		   followed by one with 'end' set
+		"""
+		f.seek(0)
+		while True:
+			block = f.read(CHUNK)
+			if not block:
+				break
+			self.send({'type': kind, 'data': base64.b64encode(block)})
+		self.send({'type': kind, 'end': True})
+
+	def receiveFile(self, f, kind):
+		"""Write 'kind' messages to 'f' until the one with 'end' set"""
+		while True:
+			message = self.receive()
+			if message is None or message.get('type') != kind:
+				raise IOError("connection lost while receiving %s" % kind)
+			if message.get('end'):
+				break
+			f.write(base64.b64decode(message['data']))
+		f.seek(0)
+
+	def close(self):
+		try:
+			self.sock.shutdown(socket.SHUT_RDWR)
+		except socket.error:
+			pass
+		self.sock.close()
+
+def packPaths(paths, mapPath=None):
+	"""Return a temporary file holding a tar archive of 'paths'.
+
+	   Members are named by the original path (without the leading
+	   separator); 'mapPath', if given, says where each one actually is.
+	"""
+	f = tempfile.TemporaryFile()
+	archive = tarfile.open(fileobj=f, mode="w")
+	for path in paths:
+		source = path
+		if mapPath is not None:
+			source = mapPath(path)
+		if os.path.exists(source):
+			archive.add(source, path.lstrip("/"))
+	archive.close()
+	return f
+
+def unpackPaths(f, allowed, mapPath=None):
+	"""Extract the archive in 'f', accepting only members at or under
+	   one of the 'allowed' paths
+	"""
+	allowed = [path.rstrip("/") for path in allowed]
+	archive = tarfile.open(fileobj=f, mode="r")
+	for member in archive.getmembers():
+		path = "/" + member.name
+		if ".." in member.name.split("/") or not [a for a in allowed
+				if path == a or path.startswith(a + "/")]:
+			continue
+		if member.issym() or member.islnk():
+			continue
+		target = path
+		if mapPath is not None:
+			target = mapPath(path)
+		if member.isdir():
+			if not os.path.isdir(target):
+				os.makedirs(target)
+			continue
+		folder = os.path.dirname(target)
+		if not os.path.isdir(folder):
+			os.makedirs(folder)
+		source = archive.extractfile(member)
+		out = open(target, "wb")
+		shutil.copyfileobj(source, out)
+		out.close()
+		os.utime(target, (member.mtime, member.mtime))
+	archive.close()
+
+def fileStamp(path):
+	st = os.stat(path)
+	return [st.st_size, int(st.st_mtime)]
+
+#
+# worker side
+#
+
+class Worker(object):
+	"""Daemon running up to 'slots' jobs at once, mirroring files under
+	   'root' (or, if 'shared', using the paths it is given).  Without
+	   a 'key' it may only listen on the loopback interface.
+	"""
+
+	def __init__(self, host="127.0.0.1", port=PORT, slots=None, key=None,
+						root=None, shared=False):
+		import multiprocessing
+		if not key and host not in LOOPBACK:
+			raise ValueError("a worker listening on %s needs a key" % host)
+		if slots is None:
+			slots = multiprocessing.cpu_count()
+		if root is None:
+			root = os.path.join(tempfile.gettempdir(), "SSETracer-worker")
+		self.slots = slots
+		self.key = key or None
+		self.root = os.path.normpath(os.path.abspath(root))
+		self.shared = shared
+		self.running = 0
+		self._lock = threading.Lock()
+		self._mirrorLock = threading.Lock()
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.sock.bind((host, port))
+		self.sock.listen(16)
+		self.address = self.sock.getsockname()
+
+	def serve(self):
+		while True:
+			conn, address = self.sock.accept()
+			thread = threading.Thread(target=self._handle, args=(conn,))
+			thread.setDaemon(True)
+			thread.start()
+
+	def start(self):
+		"""Serve in a background thread and return self"""
+		thread = threading.Thread(target=self.serve)
+		thread.setDaemon(True)
+		thread.start()
+		return self
+
+	def mirror(self, path):
+		"""Return where 'path' is mirrored; raises ValueError if that
+		   would be outside the root
+		"""
+		mirrored = os.path.normpath(os.path.join(self.root,
+							path.lstrip("/")))
+		if mirrored != self.root \
+		and not mirrored.startswith(self.root + os.sep):
+			raise ValueError("%s is outside the worker's files" % path)
+		return mirrored
+
+	def _handle(self, sock):
+		conn = Connection(sock)
+		try:
+			conn.send({'type': 'hello', 'slots': self.slots,
+				'running': self.running, 'shared': self.shared})
+			spec = conn.receive()
+			if spec is None or spec.get('type') != 'run':
+				return
+			if self.key is not None and spec.get('key') != self.key:
+				conn.send({'type': 'error', 'error': "wrong key"})
+				return
+			self._lock.acquire()
+			try:
+				busy = self.running >= self.slots
+				if not busy:
+					self.running += 1
+			finally:
+				self._lock.release()
+			if busy:
+				conn.send({'type': 'busy'})
+				return
+			try:
+				self._run(conn, spec)
+			finally:
+				self._lock.acquire()
+				self.running -= 1
+				self._lock.release()
+		except Exception, e:
+			import traceback
+			traceback.print_exc()
+			try:
+				conn.send({'type': 'error', 'error': str(e)})
+			except socket.error:
+				pass
+		finally:
+			conn.close()
+
+	def _run(self, conn, spec):
+		binary = TOOLS.get(spec['tool'])
+		if binary is None:
+			conn.send({'type': 'error',
+					'error': "unknown tool %s" % spec['tool']})
+			return
+		if self.shared:
+			mapPath = lambda path: path
+		else:
+			mapPath = self.mirror
+			self._mirrorLock.acquire()
+			try:
+				# clear what an earlier run left, then fetch the inputs
+				# (some of which, like leastsquare's copy of the
+				# reference, are inside the outputs)
+				for path in spec['outputs']:
+					path = mapPath(path)
+					if os.path.isdir(path):
+						shutil.rmtree(path)
+					elif os.path.exists(path):
+						os.remove(path)
+				self._fetchInputs(conn, spec, mapPath)
+			finally:
+				self._mirrorLock.release()
+		for path in spec.get('dirs', []):
+			if not os.path.isdir(mapPath(path)):
+				os.makedirs(mapPath(path))
+		args = [binary]
+		for arg in spec['args']:
+			if arg.startswith("/"):
+				arg = mapPath(arg)
+			args.append(arg)
+		cwd = mapPath(spec.get('cwd') or "/")
+		if not os.path.isdir(cwd):
+			cwd = None
+		try:
+			process = subprocess.Popen(args, cwd=cwd,
+				stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+				preexec_fn=os.setsid)
+		except OSError, e:
+			conn.send({'type': 'error', 'error': "could not run %s: %s"
+							% (binary, e)})
+			return
+		conn.send({'type': 'started', 'pid': process.pid})
+		readers = []
+		for stream, pipe in (("stdout", process.stdout),
+						("stderr", process.stderr)):
+			reader = threading.Thread(target=self._forward,
+						args=(conn, stream, pipe))
+			reader.setDaemon(True)
+			reader.start()
+			readers.append(reader)
+		exited = threading.Event()
+		watcher = threading.Thread(target=self._watchCancel,
+						args=(conn, process, exited))
+		watcher.setDaemon(True)
+		watcher.start()
+		returncode = process.wait()
+		exited.set()
+		for reader in readers:
+			reader.join()
+		conn.send({'type': 'exit', 'returncode': returncode})
+		if returncode == 0 and not self.shared:
+			archive = packPaths(spec['outputs'], mapPath)
+			conn.sendFile(archive, 'outputs')
+			archive.close()
+		conn.send({'type': 'done'})
+
+	def _fetchInputs(self, conn, spec, mapPath):
+		need = []
+		for path, stamp in spec['inputs']:
+			local = mapPath(path)
+			if not os.path.isfile(local) or fileStamp(local) != stamp:
+				need.append(path)
+		conn.send({'type': 'need', 'paths': need})
+		if need:
+			f = tempfile.TemporaryFile()
+			conn.receiveFile(f, 'inputs')
+			unpackPaths(f, need, mapPath)
+			f.close()
+
+	def _forward(self, conn, stream, pipe):
+		while True:
+			data = os.read(pipe.fileno(), 65536)
+			if not data:
+				break
+			conn.send({'type': 'output', 'stream': stream,
+						'data': base64.b64encode(data)})
+		pipe.close()
+
+	def _watchCancel(self, conn, process, exited):
+		# only the serving thread may reap the process (Popen.poll()
+		# here would race its wait()), so it says when it has exited
+		import jobs
+		while not exited.isSet():
+			try:
+				message = conn.receive()
+			except (socket.error, ValueError):
+				message = None
+			if message is None:
+				# the client has gone; so should the job
+				if not exited.isSet():
+					jobs.killProcessGroup(process, True)
+				return
+			if message.get('type') == 'cancel':
+				jobs.killProcessGroup(process, message.get('force'))
+
+#
+# submitting side
+#
+
+class RemoteProcess(object):
+	"""A job running on a worker, with what the scheduler needs of a
+	   subprocess.Popen: 'stdout' and 'stderr' (local pipes the output
+	   is copied to), poll(), wait() and cancel()
+	"""
+
+	def __init__(self, slot, spec):
+		self.slot = slot
+		self.spec = spec
+		# not a local process; see remotePid
+		self.pid = None
+		self.remotePid = None
+		self.returncode = None
+		self._exited = threading.Event()
+		outRead, self._outWrite = os.pipe()
+		errRead, self._errWrite = os.pipe()
+		self.stdout = os.fdopen(outRead, "rb", 0)
+		self.stderr = os.fdopen(errRead, "rb", 0)
+		self.conn = None
+		try:
+			self._connect()
+		except:
+			self._finish(None)
+			raise
+
+	def _connect(self):
+		host, port = self.slot.address
+		sock = socket.create_connection((host, port), timeout=30)
+		sock.settimeout(None)
+		self.conn = Connection(sock)
+		hello = self.conn.receive()
+		if hello is None or hello.get('type') != 'hello':
+			raise socket.error("%s:%d is not a worker" % (host, port))
+		self.slot.pool._setCapacity(self.slot.address, hello['slots'])
+		self.conn.send(dict(self.spec, type='run'))
+		message = self.conn.receive()
+		if message and message.get('type') == 'need':
+			if message['paths']:
+				archive = packPaths(message['paths'])
+				self.conn.sendFile(archive, 'inputs')
+				archive.close()
+			message = self.conn.receive()
+		if message and message.get('type') == 'busy':
+			raise WorkerBusy("%s:%d has no free slot" % (host, port))
+		if message is None or message.get('type') != 'started':
+			error = message and message.get('error') or "connection lost"
+			raise OSError("%s:%d: %s" % (host, port, error))
+		self.remotePid = message['pid']
+		thread = threading.Thread(target=self._receive)
+		thread.setDaemon(True)
+		thread.start()
+
+	def _receive(self):
+		returncode = None
+		try:
+			while True:
+				message = self.conn.receive()
+				if message is None or message['type'] == 'done':
+					break
+				kind = message['type']
+				if kind == 'output':
+					if message['stream'] == "stdout":
+						fd = self._outWrite
+					else:
+						fd = self._errWrite
+					data = base64.b64decode(message['data'])
+					while data:
+						data = data[os.write(fd, data):]
+				elif kind == 'exit':
+					returncode = message['returncode']
+				elif kind == 'outputs':
+					f = tempfile.TemporaryFile()
+					f.write(base64.b64decode(message.get('data', "")))
+					if not message.get('end'):
+						self.conn.receiveFile(f, 'outputs')
+					f.seek(0)
+					unpackPaths(f, self.spec['outputs'])
+					f.close()
+		except Exception, e:
+			os.write(self._errWrite, "worker %s:%d: %s\n"
+					% (self.slot.address + (e,)))
+			if returncode == 0:
+				returncode = None
+		self._finish(returncode)
+
+	def _finish(self, returncode):
+		for fd in (self._outWrite, self._errWrite):
+			try:
+				os.close(fd)
+			except OSError:
+				pass
+		if self.conn is not None:
+			self.conn.close()
+		self.slot.release()
+		self.returncode = returncode
+		if returncode is None:
+			# connection lost or never made
+			self.returncode = -1
+		self._exited.set()
+
+	def poll(self):
+		if self._exited.isSet():
+			return self.returncode
+		return None
+
+	def wait(self):
+		self._exited.wait()
+		return self.returncode
+
+	def cancel(self, force=False):
+		try:
+			self.conn.send({'type': 'cancel', 'force': force})
+		except (socket.error, AttributeError):
+			pass
+
+class WorkerSlot(object):
+	def __init__(self, pool, address):
+		self.pool = pool
+		self.address = address
+
+	def release(self):
+		self.pool._release(self.address)
+
+class WorkerPool(object):
+	"""Workers at 'addresses' ((host, port) pairs, or 'host:port'
+	   strings).  Each is given as many jobs at a time as it has slots,
+	   which it says when first contacted; 'slots' is assumed until
+	   then.  A worker that cannot be reached or turns a job down is
+	   left alone for 'retryAfter' seconds (one that is busy only for
+	   the job it turned down), and the job goes to another worker or
+	   is run here.
+	"""
+
+	retryAfter = 60.0
+
+	def __init__(self, addresses, slots=1, key=None):
+		self.addresses = []
+		for address in addresses:
+			if isinstance(address, basestring):
+				host, port = address.rsplit(":", 1)
+				address = (host, int(port))
+			self.addresses.append(tuple(address))
+		self.capacity = dict([(address, slots)
+					for address in self.addresses])
+		self.key = key
+		self.busy = dict([(address, 0) for address in self.addresses])
+		self.down = {}	# address -> time it could not be reached
+		self._lock = threading.Lock()
+
+	def launch(self, job):
+		"""Start 'job' on a worker with a free slot and return its
+		   RemoteProcess, or None if no worker can take it
+		"""
+		args = job.args()
+		if args is None:
+			return None
+		spec = None
+		tried = set()
+		while True:
+			self._lock.acquire()
+			try:
+				now = time.time()
+				free = [a for a in self.addresses
+					if self.busy[a] < self.capacity[a] and a not in tried
+					and now - self.down.get(a, 0) > self.retryAfter]
+				if not free:
+					return None
+				address = min(free, key=lambda a: float(self.busy[a])
+							/ self.capacity[a])
+				self.busy[address] += 1
+			finally:
+				self._lock.release()
+			if spec is None:
+				spec = self.spec(job, args)
+			tried.add(address)
+			try:
+				return RemoteProcess(WorkerSlot(self, address), spec)
+			except WorkerBusy:
+				pass
+			except (socket.error, IOError, OSError, ValueError), e:
+				# unreachable, or refused the job (a wrong key, a tool
+				# missing there, ...)
+				job.write("%s; not using worker %s:%d for %g seconds\n"
+					% ((e,) + address + (self.retryAfter,)))
+				self._lock.acquire()
+				try:
+					self.down[address] = time.time()
+				finally:
+					self._lock.release()
+
+	def spec(self, job, args):
+		inputs = []
+		binaries = set(TOOLS.values())
+		paths = list(job.cacheInputs() or [])
+		# files named on the command line, such as leastsquare's copy
+		# of the reference in its run folder, are inputs too
+		paths += [arg for arg in args[1:] if os.path.isfile(arg)]
+		for path in paths:
+			path = os.path.abspath(path)
+			if path in binaries or not os.path.isfile(path):
+				continue
+			if path not in [p for p, stamp in inputs]:
+				inputs.append((path, fileStamp(path)))
+		dirs = []
+		for path in job.outputPaths():
+			for dirPath, dirNames, fileNames in os.walk(path):
+				dirs.append(os.path.abspath(dirPath))
+		return {
+			'tool': job.tool,
+			'args': args[1:],
+			'cwd': os.getcwd(),
+			'inputs': inputs,
+			'outputs': [os.path.abspath(p) for p in job.outputPaths()],
+			'dirs': dirs,
+			'key': self.key,
+		}
+
+	def _setCapacity(self, address, slots):
+		self.capacity[address] = max(slots, 1)
+
+	def _release(self, address):
+		self._lock.acquire()
+		try:
+			self.busy[address] -= 1
+		finally:
+			self._lock.release()
+
+def main(argv):
+	import getopt
+	try:
+		opts, args = getopt.getopt(argv[1:], "H:p:j:k:d:s")
+	except getopt.GetoptError, e:
+		print >> sys.stderr, e
+		print >> sys.stderr, __doc__
+		return 2
+	options = {}
+	for opt, val in opts:
+		if opt == "-H":
+			options['host'] = val
+		elif opt == "-p":
+			options['port'] = int(val)
+		elif opt == "-j":
+			options['slots'] = int(val)
+		elif opt == "-k":
+			options['key'] = val
+		elif opt == "-d":
+			options['root'] = val
+		elif opt == "-s":
+			options['shared'] = True
+	try:
+		worker = Worker(**options)
+	except ValueError, e:
+		print >> sys.stderr, e
+		return 2
+	if worker.shared:
+		files = "shared files"
+	else:
+		files = "files under %s" % worker.root
+	print >> sys.stderr, "worker on %s:%d, %d slots, %s" % (
+			worker.address + (worker.slots, files))
+	worker.serve()
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))